@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Async GBM Clinical Query Interface
+asyncio facade over ClinicalQueryInterface for web front ends: query encoding,
+ChromaDB search and cross-encoder scoring run on a bounded thread pool, with
+per-request timeouts and cancellation, so one process keeps many clinician
+requests in flight
+Author: Chetanya Pandey
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from clinical_query_interface import ClinicalQueryInterface
+
+# Marks "use the facade's default timeout" (None means wait forever)
+_DEFAULT_TIMEOUT = object()
+
+
+class AsyncClinicalQueryInterface:
+    def __init__(self, interface: Optional[ClinicalQueryInterface] = None, max_workers: int = 4,
+                 max_in_flight: int = 64, default_timeout: Optional[float] = 30.0, **interface_kwargs):
+        """
+        Initialize the async query facade.
+
+        Args:
+            interface: Query interface to wrap (built from interface_kwargs if omitted)
+            max_workers: Threads running encodes, searches and cross-encoder passes
+            max_in_flight: Requests admitted at once; later ones wait for a slot
+            default_timeout: Seconds before a request gives up, including time waiting
+                for a slot (None waits forever)
+        """
+        self.interface = interface or ClinicalQueryInterface(**interface_kwargs)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gbm-query')
+        self.max_in_flight = max_in_flight
+        self.default_timeout = default_timeout
+
+        self.in_flight = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.cancellations = 0
+        # Created on first use so it belongs to the running event loop
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def _offload(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call on the facade's executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _run(self, work: Callable[[], Awaitable[Any]], timeout: Any, on_timeout: Callable[[float], Any]) -> Any:
+        """Admit a request, enforce its timeout and keep the request counters."""
+        if timeout is _DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+
+        async def admitted():
+            async with self._slots:
+                self.in_flight += 1
+                try:
+                    return await work()
+                finally:
+                    self.in_flight -= 1
+
+        try:
+            result = await asyncio.wait_for(admitted(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return on_timeout(timeout)
+        except asyncio.CancelledError:
+            self.cancellations += 1
+            raise
+        self.completed += 1
+        return result
+
+    async def _query_pipeline(self, queries: List[Any], **options) -> List[Dict[str, Any]]:
+        """
+        Run the batched query pipeline one stage per executor call.
+
+        A cancelled or timed-out request stops at the next stage boundary, so the
+        cross-encoder never runs for a caller that has gone away.
+        """
+        interface = self.interface
+        results, pending = await self._offload(interface._prepare_batch, queries, **options)
+        for stage in interface._query_stages():
+            if not pending:
+                break
+            pending = await self._offload(stage, pending, results)
+        return results
+
+    async def aquery_clinical_data(self, query: str, n_results: int = 5, metadata_filters: Dict[str, Any] = None,
+                                   drug_filter: str = None, section_filter: str = None, hybrid: bool = None,
+                                   timeout: Any = _DEFAULT_TIMEOUT) -> Dict[str, Any]:
+        """
+        Async query_clinical_data.
+
+        Args:
+            timeout: Seconds for this request (defaults to the facade's default_timeout)
+
+        Returns:
+            The query result, or {'error': ...} if it failed or timed out
+        """
+        results = await self.aquery_clinical_data_batch(
+            [query], n_results=n_results, metadata_filters=metadata_filters,
+            drug_filter=drug_filter, section_filter=section_filter, hybrid=hybrid, timeout=timeout)
+        return results[0]
+
+    async def aquery_clinical_data_batch(self, queries: List[Any], n_results: int = 5,
+                                         metadata_filters: Dict[str, Any] = None, drug_filter: str = None,
+                                         section_filter: str = None, hybrid: bool = None,
+                                         timeout: Any = _DEFAULT_TIMEOUT) -> List[Dict[str, Any]]:
+        """Async query_clinical_data_batch; every query gets an error result if the batch times out."""
+        options = {
+            'n_results': n_results,
+            'metadata_filters': metadata_filters,
+            'drug_filter': drug_filter,
+            'section_filter': section_filter,
+            'hybrid': hybrid
+        }
+        return await self._run(
+            lambda: self._query_pipeline(queries, **options), timeout,
+            lambda seconds: [{'error': f"Query timed out after {seconds}s"} for _ in queries])
+
+    async def aget_drug_specific_info(self, drug: str, topic: str = None,
+                                      timeout: Any = _DEFAULT_TIMEOUT) -> Dict[str, Any]:
+        """Async get_drug_specific_info ({'error': ...} if it times out)."""
+        return await self._run(
+            lambda: self._offload(self.interface.get_drug_specific_info, drug, topic), timeout,
+            lambda seconds: {'error': f"Drug lookup timed out after {seconds}s"})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'cancellations': self.cancellations,
+            'max_in_flight': self.max_in_flight,
+            'max_workers': self.max_workers
+        }
+
+    async def aclose(self) -> None:
+        """Wait for running stages to finish and stop the executor."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+
+    async def __aenter__(self) -> 'AsyncClinicalQueryInterface':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Clinical Metadata Extraction Benchmark
+Compares chunks/second of the original per-pattern extraction against the
+precompiled single-pass ClinicalMetadataExtractor and checks they agree
+Author: Chetanya Pandey
+"""
+
+import os
+import re
+import glob
+import time
+import argparse
+from typing import List, Dict, Any, Tuple
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from clinical_extractor import ClinicalMetadataExtractor
+
+
+def legacy_extract_clinical_topic(chunk: str) -> str:
+    """Original GBMVectorDB._extract_clinical_topic, kept as the benchmark baseline."""
+    chunk_lower = chunk.lower()
+
+    if any(word in chunk_lower for word in ['dosing', 'dose', 'mg/m²', 'mg/kg']):
+        if 'maintenance' in chunk_lower:
+            return 'Maintenance Dosing'
+        elif 'concomitant' in chunk_lower or 'concurrent' in chunk_lower:
+            return 'Concomitant Dosing'
+        elif 'modification' in chunk_lower or 'reduction' in chunk_lower:
+            return 'Dose Modifications'
+        else:
+            return 'Dosing Protocol'
+    elif any(word in chunk_lower for word in ['toxicity', 'adverse', 'side effect', 'mortality', 'death']):
+        if 'hematologic' in chunk_lower or 'neutropenia' in chunk_lower or 'thrombocytopenia' in chunk_lower:
+            return 'Hematologic Toxicity'
+        elif 'cardiovascular' in chunk_lower or 'hypertension' in chunk_lower:
+            return 'Cardiovascular Toxicity'
+        elif 'mortality' in chunk_lower or 'death' in chunk_lower:
+            return 'Treatment Mortality'
+        else:
+            return 'Toxicity Profile'
+    elif any(word in chunk_lower for word in ['monitoring', 'laboratory', 'cbc', 'blood pressure']):
+        return 'Clinical Monitoring'
+    elif any(word in chunk_lower for word in ['administration', 'infusion', 'oral', 'iv']):
+        return 'Drug Administration'
+    elif any(word in chunk_lower for word in ['protocol', 'guideline', 'management']):
+        return 'Clinical Protocol'
+    elif 'temozolomide' in chunk_lower or 'temodar' in chunk_lower:
+        return 'Temozolomide Specific'
+    elif 'bevacizumab' in chunk_lower or 'avastin' in chunk_lower:
+        return 'Bevacizumab Specific'
+    else:
+        return 'General Clinical'
+
+
+def legacy_extract_detailed_metadata(chunk: str) -> Dict[str, Any]:
+    """Original GBMVectorDB._extract_detailed_metadata, kept as the benchmark baseline."""
+    chunk_lower = chunk.lower()
+    metadata = {}
+
+    lines = chunk.split('\n')
+    section = None
+    subsection = None
+    for line in lines[:5]:
+        line_clean = line.strip()
+        if line_clean.startswith('### '):
+            subsection = line_clean.replace('###', '').strip()
+        elif line_clean.startswith('## '):
+            section = line_clean.replace('##', '').strip()
+        elif line_clean.startswith('# ') and not line_clean.startswith('##'):
+            section = line_clean.replace('#', '').strip()
+        elif line_clean.startswith('**') and line_clean.endswith('**') and len(line_clean) < 80:
+            if not subsection:
+                subsection = line_clean.replace('**', '').strip()
+
+    metadata['section'] = section or 'Unknown'
+    metadata['subsection'] = subsection or 'General'
+
+    dosing_patterns = {
+        'mg_per_m2': r'(\d+(?:\.\d+)?)\s*mg/m[²2]',
+        'mg_per_kg': r'(\d+(?:\.\d+)?)\s*mg/kg',
+        'cycle_length': r'(\d+)[-\s]*day',
+        'frequency': r'every\s*(\d+)\s*weeks?|q(\d+)w'
+    }
+    for key, pattern in dosing_patterns.items():
+        import re
+        matches = re.findall(pattern, chunk_lower)
+        if matches:
+            if key == 'frequency':
+                metadata[key] = [m[0] or m[1] for m in matches if any(m)]
+            else:
+                metadata[key] = matches
+
+    grade_matches = re.findall(r'grade\s*(\d+)', chunk_lower)
+    if grade_matches:
+        metadata['toxicity_grades'] = list(set(grade_matches))
+
+    lab_patterns = {
+        'anc_values': r'anc[:\s]*(?:≥|>=|>|<|≤|<=)\s*([0-9.,]+)',
+        'platelet_values': r'platelet[s]?[:\s]*(?:≥|>=|>|<|≤|<=)\s*([0-9.,]+)',
+        'hemoglobin_values': r'h[gb|emoglobin][:\s]*(?:≥|>=|>|<|≤|<=)\s*([0-9.,]+)'
+    }
+    for key, pattern in lab_patterns.items():
+        matches = re.findall(pattern, chunk_lower)
+        if matches:
+            metadata[key] = matches
+
+    population_indicators = {
+        'newly_diagnosed': ['newly diagnosed', 'initial', 'upfront', 'first-line'],
+        'recurrent': ['recurrent', 'progressive', 'relapsed', 'refractory', 'salvage'],
+        'elderly': ['elderly', '≥70', '>70', '≥65', '>65', 'geriatric'],
+        'poor_performance': ['kps', 'performance status', 'ecog']
+    }
+    for pop_type, indicators in population_indicators.items():
+        if any(indicator in chunk_lower for indicator in indicators):
+            metadata[f'population_{pop_type}'] = True
+
+    treatment_phases = {
+        'concomitant': ['concomitant', 'concurrent', 'chemoradiation', 'during radiation'],
+        'maintenance': ['maintenance', 'adjuvant', 'post-radiation'],
+        'salvage': ['salvage', 'rescue', 'recurrent treatment']
+    }
+    for phase, indicators in treatment_phases.items():
+        if any(indicator in chunk_lower for indicator in indicators):
+            metadata[f'treatment_phase_{phase}'] = True
+
+    evidence_indicators = {
+        'fda_approved': ['fda approved', 'fda approval', 'approved by fda'],
+        'clinical_trial': ['phase ii', 'phase iii', 'clinical trial', 'randomized'],
+        'guideline': ['nccn', 'guideline', 'recommendation', 'standard of care'],
+        'real_world': ['real world', 'clinical practice', 'institutional']
+    }
+    for evidence_type, indicators in evidence_indicators.items():
+        if any(indicator in chunk_lower for indicator in indicators):
+            metadata[f'evidence_{evidence_type}'] = True
+
+    return metadata
+
+
+def load_sample_chunks(data_dir: str) -> List[str]:
+    """Split the clinical corpus into chunks the same size as ingestion uses."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=100)
+    chunks = []
+    for file_path in sorted(glob.glob(os.path.join(data_dir, "*.md"))):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            chunks.extend(splitter.split_text(f.read()))
+    return chunks
+
+
+def _normalize(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Compare grade lists as sets since the legacy extractor returned them unordered."""
+    normalized = dict(metadata)
+    if 'toxicity_grades' in normalized:
+        normalized['toxicity_grades'] = sorted(set(normalized['toxicity_grades']))
+    return normalized
+
+
+def run_benchmark(chunks: List[str], repeats: int = 5) -> Dict[str, Any]:
+    """Time both extractors over the same chunks and count disagreements."""
+    extractor = ClinicalMetadataExtractor()
+
+    def time_it(fn) -> float:
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for chunk in chunks:
+                fn(chunk)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    legacy_seconds = time_it(lambda c: (legacy_extract_clinical_topic(c), legacy_extract_detailed_metadata(c)))
+    compiled_seconds = time_it(extractor.extract)
+
+    mismatches = 0
+    for chunk in chunks:
+        topic, metadata = extractor.extract(chunk)
+        if (topic != legacy_extract_clinical_topic(chunk)
+                or _normalize(metadata) != _normalize(legacy_extract_detailed_metadata(chunk))):
+            mismatches += 1
+
+    return {
+        'chunks': len(chunks),
+        'legacy_chunks_per_second': round(len(chunks) / legacy_seconds, 1),
+        'compiled_chunks_per_second': round(len(chunks) / compiled_seconds, 1),
+        'speedup': round(legacy_seconds / compiled_seconds, 2),
+        'mismatches': mismatches
+    }
+
+
+def main():
+    """Run the extraction benchmark over the clinical corpus."""
+    parser = argparse.ArgumentParser(description="Benchmark clinical metadata extraction")
+    parser.add_argument('--data-dir', default='us_clinical_data')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = load_sample_chunks(args.data_dir)
+    print(f"⏱️ Benchmarking metadata extraction on {len(chunks)} chunks")
+    results = run_benchmark(chunks, repeats=args.repeats)
+
+    print(f"🐢 Before (per-pattern scans): {results['legacy_chunks_per_second']} chunks/s")
+    print(f"🚀 After (single-pass compiled): {results['compiled_chunks_per_second']} chunks/s")
+    print(f"📈 Speedup: x{results['speedup']}")
+    print(f"🔍 Output mismatches: {results['mismatches']}")
+
+
+if __name__ == "__main__":
+    main()
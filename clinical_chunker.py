@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Clinical Document Chunker for GBM Clinical Vector Database
+Loads, classifies and splits clinical documents; free of database and model
+state so it can run inside worker processes
+Author: Chetanya Pandey
+"""
+
+import os
+import gzip
+import multiprocessing as mp
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from clinical_extractor import ClinicalMetadataExtractor
+from index_manifest import hash_text
+from ingest_profiler import StageProfiler
+
+# Chunker instance owned by each worker process
+_worker_chunker = None
+
+
+def _init_worker(cprofile: bool = False) -> None:
+    """Build the text splitter and compiled extractor once per worker process."""
+    global _worker_chunker
+    _worker_chunker = ClinicalChunker(profiler=StageProfiler(cprofile=cprofile))
+
+
+def _load_and_chunk(task: Tuple[str, Optional[str]]) -> Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]], Dict[str, Any]]:
+    """Worker entry point: load a file and chunk it unless its hash is unchanged, with stage timings."""
+    file_path, known_hash = task
+    doc, chunks = _worker_chunker.load_and_chunk(file_path, known_hash)
+    return doc, chunks, _worker_chunker.profiler.drain()
+
+
+class ClinicalChunker:
+    def __init__(self, profiler: Optional[StageProfiler] = None):
+        """
+        Initialize the clinical text splitter and metadata extractor.
+        
+        Args:
+            profiler: Records load, split and extract stage timings (a private one if omitted)
+        """
+        self.profiler = profiler or StageProfiler()
+        
+        # Initialize text splitter for clinical content
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=400,  # Smaller chunks for focused clinical concepts
+            chunk_overlap=100,  # Reduced overlap
+            separators=[
+                "\n## ",      # Major sections (dosing, toxicity, etc.)
+                "\n### ",     # Subsections (specific protocols)
+                "\n#### ",    # Clinical details
+                "\n**",       # Bold clinical concepts
+                "\n- **",     # Bullet points with bold headers
+                "\n---",      # Section dividers
+                "\n\n",       # Paragraph breaks
+                "\n",         # Line breaks
+                ". ",         # Sentences
+                "! ",         # Exclamations
+                "? ",         # Questions
+                "; ",         # Semicolons
+                ", ",         # Commas
+                " ",          # Spaces
+                ""            # Characters
+            ]
+        )
+        
+        # Precompiled single-pass clinical metadata extraction
+        self.extractor = ClinicalMetadataExtractor()
+    
+    def load_document(self, file_path: str) -> Dict[str, Any]:
+        """Read a markdown file and attach its classification metadata."""
+        with self.profiler.stage('load', items=1):
+            # Gzipped markdown (.md.gz) is read transparently
+            opener = gzip.open if file_path.endswith('.gz') else open
+            with opener(file_path, 'rt', encoding='utf-8') as f:
+                content = f.read()
+            
+            return self.make_document(os.path.basename(file_path), file_path, content)
+    
+    def make_document(self, filename: str, filepath: str, content: str, doc_type: Optional[str] = None,
+                      drug: Optional[List[str]] = None, source: Optional[str] = None,
+                      label: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build a document record, classifying whatever metadata was not supplied.
+        
+        Args:
+            filename: Unique document name (also the prefix of its chunk IDs)
+            filepath: File the content came from
+            content: Document text
+            doc_type, drug, source: Known metadata; derived from label and content if omitted
+            label: Text the classification heuristics look at (defaults to filename)
+        """
+        label = label or filename
+        return {
+            'filename': filename,
+            'filepath': filepath,
+            'content': content,
+            'content_hash': hash_text(content),
+            'doc_type': doc_type or self._classify_document(label),
+            'drug': drug or self._extract_drug_info(label, content),
+            'source': source or self._extract_source_info(label)
+        }
+    
+    def chunk_document(self, doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Split a document into focused clinical chunks."""
+        # First try clinical-focused chunking
+        clinical_chunks = self._create_clinical_chunks(doc)
+        if clinical_chunks:
+            return clinical_chunks
+        
+        # Fallback to standard chunking
+        text_chunks = self._split(doc['content'])
+        with self.profiler.stage('extract', items=len(text_chunks)):
+            return [{
+                'chunk_id': f"{doc['filename']}_chunk_{i}",
+                'content': chunk,
+                'filename': doc['filename'],
+                'doc_type': doc['doc_type'],
+                'drug': doc['drug'],
+                'source': doc['source'],
+                'chunk_index': i,
+                'total_chunks': len(text_chunks),
+                'clinical_topic': self.extractor.extract_topic(chunk)
+            } for i, chunk in enumerate(text_chunks)]
+    
+    def load_and_chunk(self, file_path: str, known_hash: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """
+        Load and chunk one file.
+        
+        Returns:
+            (document, chunks); chunks is None when the content hash equals known_hash,
+            and document is None when the file could not be read
+        """
+        try:
+            doc = self.load_document(file_path)
+        except Exception as e:
+            print(f"❌ Error loading {file_path}: {e}")
+            return None, None
+        
+        if doc['content_hash'] == known_hash:
+            return doc, None
+        return doc, self.chunk_document(doc)
+    
+    def _split(self, content: str) -> List[str]:
+        """Split document text with the clinical separators."""
+        with self.profiler.stage('split'):
+            text_chunks = self.text_splitter.split_text(content)
+        self.profiler.count('split', len(text_chunks))
+        return text_chunks
+    
+    def _classify_document(self, filename: str) -> str:
+        """Classify document type based on filename."""
+        filename_lower = filename.lower()
+        
+        if 'fda' in filename_lower and 'complete' in filename_lower:
+            return 'FDA_Complete_Prescribing_Information'
+        elif 'fda' in filename_lower and 'approval' in filename_lower:
+            return 'FDA_Approval_Trials'
+        elif 'fda' in filename_lower:
+            return 'FDA_Document'
+        elif 'nccn' in filename_lower:
+            return 'NCCN_Guidelines'
+        elif 'stupp' in filename_lower:
+            return 'Pivotal_Clinical_Trial'
+        elif 'hospital' in filename_lower or 'protocols' in filename_lower:
+            return 'Hospital_Protocol'
+        elif 'dailymed' in filename_lower:
+            return 'DailyMed_Prescribing_Info'
+        elif 'trial' in filename_lower or 'clinical' in filename_lower:
+            return 'Clinical_Research'
+        elif 'dosing' in filename_lower:
+            return 'Dosing_Protocol'
+        elif 'source' in filename_lower:
+            return 'Source_Reference'
+        else:
+            return 'Clinical_Document'
+    
+    def _extract_drug_info(self, filename: str, content: str) -> List[str]:
+        """Extract drug information from filename and content."""
+        drugs = []
+        
+        # Check filename
+        filename_lower = filename.lower()
+        if 'temodar' in filename_lower or 'temozolomide' in filename_lower:
+            drugs.append('temozolomide')
+        if 'avastin' in filename_lower or 'bevacizumab' in filename_lower:
+            drugs.append('bevacizumab')
+        
+        # Check content
+        content_lower = content.lower()
+        if 'temozolomide' in content_lower or 'temodar' in content_lower:
+            if 'temozolomide' not in drugs:
+                drugs.append('temozolomide')
+        if 'bevacizumab' in content_lower or 'avastin' in content_lower:
+            if 'bevacizumab' not in drugs:
+                drugs.append('bevacizumab')
+        
+        return drugs if drugs else ['both']
+    
+    def _extract_source_info(self, filename: str) -> str:
+        """Extract source information from filename."""
+        filename_lower = filename.lower()
+        
+        if 'fda' in filename_lower:
+            return 'FDA'
+        elif 'nccn' in filename_lower:
+            return 'NCCN'
+        elif 'nejm' in filename_lower:
+            return 'NEJM'
+        elif 'dailymed' in filename_lower:
+            return 'DailyMed'
+        elif 'hospital' in filename_lower:
+            return 'Hospital'
+        else:
+            return 'Clinical_Literature'
+    
+    def _create_clinical_chunks(self, doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Create chunks focused on clinical concepts."""
+        content = doc['content']
+        chunks = []
+        
+        # Use improved text splitter
+        text_chunks = self._split(content)
+        
+        for i, chunk in enumerate(text_chunks):
+            # Determine clinical topic and detailed metadata in a single scan
+            with self.profiler.stage('extract', items=1):
+                clinical_topic, detailed_metadata = self.extractor.extract(chunk)
+            
+            chunk_data = {
+                'chunk_id': f"{doc['filename']}_clinical_{i}",
+                'content': chunk,
+                'filename': doc['filename'],
+                'doc_type': doc['doc_type'],
+                'drug': doc['drug'],
+                'source': doc['source'],
+                'chunk_index': i,
+                'total_chunks': len(text_chunks),
+                'clinical_topic': clinical_topic
+            }
+            
+            # Add detailed metadata
+            chunk_data.update(detailed_metadata)
+            chunks.append(chunk_data)
+        
+        return chunks
+
+
+def iter_load_and_chunk(file_paths: List[str], known_hashes: Dict[str, str],
+                        num_workers: int = 1, chunker: Optional[ClinicalChunker] = None,
+                        profiler: Optional[StageProfiler] = None) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]]:
+    """
+    Load and chunk files in input order, across a process pool when num_workers > 1.
+    
+    Results come back in the same order as file_paths, so chunk IDs and ingestion
+    order are identical to a sequential run. At most two files per worker are in
+    flight, so a slow consumer holds back the workers instead of queueing chunks.
+    
+    Args:
+        file_paths: Files to process
+        known_hashes: filename -> content hash already indexed (unchanged files are not chunked)
+        num_workers: Number of worker processes
+        chunker: Chunker to use in-process when num_workers is 1
+        profiler: Receives the workers' stage timings when num_workers > 1
+    """
+    tasks = [(path, known_hashes.get(os.path.basename(path))) for path in file_paths]
+    
+    if num_workers <= 1:
+        chunker = chunker or ClinicalChunker()
+        for file_path, known_hash in tasks:
+            yield chunker.load_and_chunk(file_path, known_hash)
+        return
+    
+    print(f"🧵 Loading and chunking with {num_workers} worker processes")
+    ctx = mp.get_context('spawn')
+    cprofile = bool(profiler and profiler.cprofile)
+    max_in_flight = 2 * num_workers
+    with ctx.Pool(processes=num_workers, initializer=_init_worker, initargs=(cprofile,)) as pool:
+        in_flight = deque()
+        
+        def next_result():
+            doc, chunks, timings = in_flight.popleft().get()
+            if profiler:
+                profiler.merge(timings)
+            return doc, chunks
+        
+        for task in tasks:
+            in_flight.append(pool.apply_async(_load_and_chunk, (task,)))
+            # Oldest file first keeps input order; waiting on it stops workers running
+            # ahead of a slow consumer (e.g. embedding), so memory stays bounded
+            if len(in_flight) >= max_in_flight:
+                yield next_result()
+        while in_flight:
+            yield next_result()
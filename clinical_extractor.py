@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Single-Pass Clinical Metadata Extractor for GBM Clinical Chunks
+Compiles dosing, grade, lab, population, phase, evidence and topic patterns once
+and scans each chunk in one pass per pattern family
+Author: Chetanya Pandey
+"""
+
+import re
+from typing import List, Dict, Any, Set, Tuple
+
+# Comparator used by the laboratory threshold patterns
+_COMPARATOR = r'(?:≥|>=|>|<|≤|<=)'
+
+# Numeric clinical values, one named group per feature. The leading lookahead
+# rejects positions that cannot start any alternative before trying them all.
+VALUE_PATTERN = re.compile(
+    r'(?=[0-9eqgaph])(?:'
+    r'(?P<mg_per_m2>\d+(?:\.\d+)?)\s*mg/m[²2]'
+    r'|(?P<mg_per_kg>\d+(?:\.\d+)?)\s*mg/kg'
+    r'|(?P<cycle_length>\d+)[-\s]*day'
+    r'|every\s*(?P<frequency_every>\d+)\s*weeks?'
+    r'|q(?P<frequency_q>\d+)w'
+    r'|grade\s*(?P<toxicity_grade>\d+)'
+    r'|anc[:\s]*' + _COMPARATOR + r'\s*(?P<anc_value>[0-9.,]+)'
+    r'|platelet[s]?[:\s]*' + _COMPARATOR + r'\s*(?P<platelet_value>[0-9.,]+)'
+    r'|h[gb|emoglobin][:\s]*' + _COMPARATOR + r'\s*(?P<hemoglobin_value>[0-9.,]+)'
+    r')'
+)
+
+# Named group -> metadata field
+VALUE_FIELDS = {
+    'mg_per_m2': 'mg_per_m2',
+    'mg_per_kg': 'mg_per_kg',
+    'cycle_length': 'cycle_length',
+    'frequency_every': 'frequency',
+    'frequency_q': 'frequency',
+    'toxicity_grade': 'toxicity_grades',
+    'anc_value': 'anc_values',
+    'platelet_value': 'platelet_values',
+    'hemoglobin_value': 'hemoglobin_values'
+}
+
+POPULATION_INDICATORS = {
+    'newly_diagnosed': ['newly diagnosed', 'initial', 'upfront', 'first-line'],
+    'recurrent': ['recurrent', 'progressive', 'relapsed', 'refractory', 'salvage'],
+    'elderly': ['elderly', '≥70', '>70', '≥65', '>65', 'geriatric'],
+    'poor_performance': ['kps', 'performance status', 'ecog']
+}
+
+TREATMENT_PHASES = {
+    'concomitant': ['concomitant', 'concurrent', 'chemoradiation', 'during radiation'],
+    'maintenance': ['maintenance', 'adjuvant', 'post-radiation'],
+    'salvage': ['salvage', 'rescue', 'recurrent treatment']
+}
+
+EVIDENCE_INDICATORS = {
+    'fda_approved': ['fda approved', 'fda approval', 'approved by fda'],
+    'clinical_trial': ['phase ii', 'phase iii', 'clinical trial', 'randomized'],
+    'guideline': ['nccn', 'guideline', 'recommendation', 'standard of care'],
+    'real_world': ['real world', 'clinical practice', 'institutional']
+}
+
+# Keywords consulted by the clinical topic decision tree
+TOPIC_KEYWORDS = {
+    'dosing': ['dosing', 'dose', 'mg/m²', 'mg/kg'],
+    'maintenance': ['maintenance'],
+    'concomitant': ['concomitant', 'concurrent'],
+    'modification': ['modification', 'reduction'],
+    'toxicity': ['toxicity', 'adverse', 'side effect', 'mortality', 'death'],
+    'hematologic': ['hematologic', 'neutropenia', 'thrombocytopenia'],
+    'cardiovascular': ['cardiovascular', 'hypertension'],
+    'mortality': ['mortality', 'death'],
+    'monitoring': ['monitoring', 'laboratory', 'cbc', 'blood pressure'],
+    'administration': ['administration', 'infusion', 'oral', 'iv'],
+    'protocol': ['protocol', 'guideline', 'management'],
+    'temozolomide': ['temozolomide', 'temodar'],
+    'bevacizumab': ['bevacizumab', 'avastin']
+}
+
+# Bump when the stored metadata layout changes so existing indexes are rebuilt
+METADATA_SCHEMA_VERSION = 2
+
+# Extracted value list -> prefix of the typed <prefix>_min / <prefix>_max fields
+NUMERIC_FIELDS = {
+    'mg_per_m2': 'mg_per_m2',
+    'mg_per_kg': 'mg_per_kg',
+    'cycle_length': 'cycle_length_days',
+    'frequency': 'frequency_weeks',
+    'toxicity_grades': 'toxicity_grade',
+    'anc_values': 'anc',
+    'platelet_values': 'platelets',
+    'hemoglobin_values': 'hemoglobin'
+}
+
+# Boolean indicator fields, always stored as True/False
+BOOLEAN_FIELDS = (
+    [f'population_{name}' for name in POPULATION_INDICATORS]
+    + [f'treatment_phase_{name}' for name in TREATMENT_PHASES]
+    + [f'evidence_{name}' for name in EVIDENCE_INDICATORS]
+)
+
+
+def parse_number(value: str):
+    """Parse an extracted value like '1,500' or '1.5.' into a float (None if unparsable)."""
+    cleaned = value.strip('.,').replace(',', '')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def typed_metadata(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build range-queryable metadata from a chunk's extracted values.
+    
+    Each numeric list becomes <prefix>_min and <prefix>_max floats (omitted when
+    nothing parsed), and every indicator flag is stored as a real boolean.
+    """
+    typed: Dict[str, Any] = {}
+
+    for field, prefix in NUMERIC_FIELDS.items():
+        numbers = [n for n in (parse_number(str(v)) for v in chunk.get(field, [])) if n is not None]
+        if numbers:
+            typed[f'{prefix}_min'] = min(numbers)
+            typed[f'{prefix}_max'] = max(numbers)
+
+    for field in BOOLEAN_FIELDS:
+        typed[field] = bool(chunk.get(field, False))
+
+    return typed
+
+
+def _trie_regex(words: List[str]) -> str:
+    """Compile a word list into a trie-shaped regex that prefers the longest match."""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class ClinicalMetadataExtractor:
+    def __init__(self):
+        """Compile the keyword automaton and value patterns once."""
+        # flag name -> indicator keywords
+        self.flag_keywords: Dict[str, List[str]] = {}
+        for pop_type, indicators in POPULATION_INDICATORS.items():
+            self.flag_keywords[f'population_{pop_type}'] = indicators
+        for phase, indicators in TREATMENT_PHASES.items():
+            self.flag_keywords[f'treatment_phase_{phase}'] = indicators
+        for evidence_type, indicators in EVIDENCE_INDICATORS.items():
+            self.flag_keywords[f'evidence_{evidence_type}'] = indicators
+        for topic, indicators in TOPIC_KEYWORDS.items():
+            self.flag_keywords[f'topic_{topic}'] = indicators
+
+        keywords = sorted({kw for indicators in self.flag_keywords.values() for kw in indicators})
+
+        # Every keyword that occurs inside another keyword is implied by it, so one
+        # longest match per start position still reports all overlapping keywords
+        self.keyword_flags: Dict[str, Set[str]] = {}
+        for keyword in keywords:
+            flags = set()
+            for flag, indicators in self.flag_keywords.items():
+                if any(indicator in keyword for indicator in indicators):
+                    flags.add(flag)
+            self.keyword_flags[keyword] = flags
+
+        # Zero-width lookahead so keywords starting inside another match are still seen;
+        # the leading character class skips positions no keyword can start at
+        first_chars = ''.join(sorted({keyword[0] for keyword in keywords}))
+        self.keyword_pattern = re.compile(
+            '(?=[' + re.escape(first_chars) + '])(?=(' + _trie_regex(keywords) + '))'
+        )
+
+    def extract(self, chunk: str) -> Tuple[str, Dict[str, Any]]:
+        """Return (clinical topic, detailed metadata) for a chunk."""
+        chunk_lower = chunk.lower()
+        flags = self._find_flags(chunk_lower)
+
+        metadata = self._extract_sections(chunk)
+        metadata.update(self._extract_values(chunk_lower))
+        for flag in flags:
+            if not flag.startswith('topic_'):
+                metadata[flag] = True
+
+        return self._classify_topic(flags), metadata
+
+    def extract_topic(self, chunk: str) -> str:
+        """Return just the clinical topic for a chunk."""
+        return self._classify_topic(self._find_flags(chunk.lower()))
+
+    def extract_metadata(self, chunk: str) -> Dict[str, Any]:
+        """Return just the detailed metadata for a chunk."""
+        return self.extract(chunk)[1]
+
+    def _find_flags(self, chunk_lower: str) -> Set[str]:
+        """Scan the chunk once and collect every indicator flag it triggers."""
+        flags: Set[str] = set()
+        for match in self.keyword_pattern.finditer(chunk_lower):
+            flags |= self.keyword_flags[match.group(1)]
+        return flags
+
+    def _extract_values(self, chunk_lower: str) -> Dict[str, Any]:
+        """Scan the chunk once for dosing, grade and laboratory values."""
+        values: Dict[str, List[str]] = {}
+        for match in VALUE_PATTERN.finditer(chunk_lower):
+            group = match.lastgroup
+            values.setdefault(VALUE_FIELDS[group], []).append(match.group(group))
+
+        # Sorted so the stored metadata (and its manifest hash) is deterministic
+        if 'toxicity_grades' in values:
+            values['toxicity_grades'] = sorted(set(values['toxicity_grades']), key=int)
+        return values
+
+    def _extract_sections(self, chunk: str) -> Dict[str, str]:
+        """Extract section and subsection headings from the first lines of a chunk."""
+        section = None
+        subsection = None
+
+        for line in chunk.split('\n', 5)[:5]:  # Check first 5 lines
+            line_clean = line.strip()
+            if line_clean.startswith('### '):
+                subsection = line_clean.replace('###', '').strip()
+            elif line_clean.startswith('## '):
+                section = line_clean.replace('##', '').strip()
+            elif line_clean.startswith('# ') and not line_clean.startswith('##'):
+                section = line_clean.replace('#', '').strip()
+            elif line_clean.startswith('**') and line_clean.endswith('**') and len(line_clean) < 80:
+                if not subsection:
+                    subsection = line_clean.replace('**', '').strip()
+
+        return {
+            'section': section or 'Unknown',
+            'subsection': subsection or 'General'
+        }
+
+    def _classify_topic(self, flags: Set[str]) -> str:
+        """Pick the main clinical topic from the keyword flags found in a chunk."""
+        # Dosing-related topics
+        if 'topic_dosing' in flags:
+            if 'topic_maintenance' in flags:
+                return 'Maintenance Dosing'
+            elif 'topic_concomitant' in flags:
+                return 'Concomitant Dosing'
+            elif 'topic_modification' in flags:
+                return 'Dose Modifications'
+            else:
+                return 'Dosing Protocol'
+
+        # Toxicity-related topics
+        elif 'topic_toxicity' in flags:
+            if 'topic_hematologic' in flags:
+                return 'Hematologic Toxicity'
+            elif 'topic_cardiovascular' in flags:
+                return 'Cardiovascular Toxicity'
+            elif 'topic_mortality' in flags:
+                return 'Treatment Mortality'
+            else:
+                return 'Toxicity Profile'
+
+        elif 'topic_monitoring' in flags:
+            return 'Clinical Monitoring'
+        elif 'topic_administration' in flags:
+            return 'Drug Administration'
+        elif 'topic_protocol' in flags:
+            return 'Clinical Protocol'
+        elif 'topic_temozolomide' in flags:
+            return 'Temozolomide Specific'
+        elif 'topic_bevacizumab' in flags:
+            return 'Bevacizumab Specific'
+        else:
+            return 'General Clinical'
@@ -5,135 +5,672 @@ Interactive interface for clinicians to query the GBM clinical vector database.
 Author: Chetanya Pandey
 """
 
+import os
+import math
+import threading
 import chromadb
 from chromadb.config import Settings
 from typing import List, Dict, Any
 import json
 from sentence_transformers import SentenceTransformer, CrossEncoder
 import numpy as np
+from length_batching import PaddingStats, track_padding
+from metadata_filters import parse_range_filters, range_conditions, combine_conditions
+from corpus_stats import CorpusStats
+from index_versions import IndexVersions
+from query_cache import LRUCache, ResultCache
+from index_manifest import hash_text, index_embedding_model
+from sharded_collection import ShardedCollection, open_collection, route_shards, shard_for, where_doc_types
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from model_loader import ModelChoice, LazyModel
+from rerank_features import RerankFeatures, DEFAULT_BOOST_WEIGHTS, boost_weights, query_features, metadata_boosts, scale_to_range
 
 class ClinicalQueryInterface:
-    def __init__(self, db_dir: str = "vector_db"):
-        """Initialize the clinical query interface."""
-        self.db_dir = db_dir
+    def __init__(self, db_dir: str = "vector_db", embedding_cache_size: int = 1024,
+                 result_cache_size: int = 256, result_cache_ttl: float = 3600,
+                 result_cache_dir: str = None, score_cache_size: int = 50000,
+                 hybrid: bool = False, rrf_k: int = 60, model_loading: str = "background",
+                 model_cache_dir: str = "embedding_cache", cascade: bool = True, cascade_margin: float = 0.05,
+                 metadata_boost_weights: Dict[str, float] = None):
+        """
+        Initialize the clinical query interface.
         
-        # Connect to existing ChromaDB
-        self.chroma_client = chromadb.PersistentClient(
-            path=db_dir,
-            settings=Settings(anonymized_telemetry=False)
-        )
+        Args:
+            db_dir: Index root (a versioned root or a plain ChromaDB directory)
+            embedding_cache_size: Query embeddings kept in the in-memory LRU cache
+            result_cache_size: Final query results kept in memory (0 disables the result cache)
+            result_cache_ttl: Seconds before a cached result is recomputed (None never expires)
+            result_cache_dir: Directory of an optional on-disk result cache that survives restarts
+            score_cache_size: Cross-encoder (query, chunk) scores kept in memory
+            hybrid: Fuse BM25 and dense candidates by default (queries may override)
+            rrf_k: Reciprocal rank fusion constant for hybrid retrieval
+            model_loading: 'background' loads and warms up the models on background threads,
+                'lazy' on first use, 'eager' before returning; queries wait for them if needed
+            model_cache_dir: Directory of the record of the last successfully loaded cross-encoder
+            cascade: Cross-encoder score only the metadata-ranked head by default (queries may override)
+            cascade_margin: Metadata score gap below the n-th candidate past which the
+                cross-encoder skips a candidate
+            metadata_boost_weights: Metadata re-ranking boosts overriding the defaults
+                (topic, drug, toxicity_grades, laboratory_values, fda_approved, clinical_trial, doc_type)
+        """
+        # db_dir is the index root; queries follow its published version (or the root itself for an unversioned index)
+        self.db_root = db_dir
+        self.index_versions = IndexVersions(db_dir)
+        self.hybrid = hybrid
+        self.rrf_k = rrf_k
+        self.cascade = cascade
+        self.cascade_margin = cascade_margin
+        self.metadata_boost_weights = {key: value for key, value in (metadata_boost_weights or {}).items()
+                                       if DEFAULT_BOOST_WEIGHTS.get(key) != value}
+        self._boost_vector = boost_weights(self.metadata_boost_weights)
+        # Candidates re-ranked, pairs the cross-encoder ranked and pairs it actually ran on (not cached)
+        self.cascade_stats = {'queries': 0, 'candidates': 0, 'pairs_reranked': 0, 'pairs_scored': 0}
+        self._stats_lock = threading.Lock()
+        # Serializes index switches when queries run on several threads
+        self._index_lock = threading.Lock()
+        self._connect_index()
         
-        # Get the medical embeddings collection
-        try:
-            self.collection = self.chroma_client.get_collection("gbm_clinical_medical_embeddings")
-        except:
-            # Fallback to original collection
-            self.collection = self.chroma_client.get_collection("gbm_clinical_data")
+        # The cross-encoder resolves from the last successful choice first instead of retrying failed downloads
+        model_choice = ModelChoice(model_cache_dir)
+        
+        # Tokens used vs padded across query encodes
+        self.padding_stats = PaddingStats()
+        
+        # The embedding model the live index was built with (any loadable candidate for an unrecorded legacy index)
+        self.model_loading = model_loading
+        self._embedding_index_model = self.index_embedding_model
+        self._embedding_loader = self._make_embedding_loader(self.index_embedding_model)
+        
+        # Repeated (expanded) queries skip the encoder; keyed by model name and exact text
+        self.query_embedding_cache = LRUCache(max_size=embedding_cache_size)
+        
+        # Cross-encoder scores of (query, chunk) pairs, which recur across overlapping candidate sets
+        self.score_cache = LRUCache(max_size=score_cache_size)
+        
+        # Whole-pipeline results keyed by query, filters and the index they were computed on
+        self.result_cache = ResultCache(max_size=result_cache_size, ttl_seconds=result_cache_ttl,
+                                        disk_dir=result_cache_dir)
+        
+        # Cross-encoder re-ranker for refined semantic matching
+        cross_encoder_models = [
+            'pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb',  # BioBERT cross-encoder for medical text
+            'cross-encoder/ms-marco-MiniLM-L-6-v2',  # MS MARCO cross-encoder
+            'cross-encoder/ms-marco-MiniLM-L-4-v2',  # Smaller MS MARCO model
+        ]
+        self._cross_encoder_loader = LazyModel(
+            'cross_encoder', cross_encoder_models, CrossEncoder, choice=model_choice,
+            warm_up=self._warm_up_cross_encoder, description="cross-encoder re-ranker",
+            fallback="using metadata re-ranking only")
+        
+        print(f"✅ Connected to GBM Clinical Database")
+        print(f"Total documents: {self.collection.count()}")
+        
+        if model_loading == 'eager':
+            print("Loading medical domain embedding model and cross-encoder re-ranker...")
+            self._embedding_loader.get()
+            self._cross_encoder_loader.get()
+        elif model_loading == 'background':
+            print("Loading medical domain embedding model and cross-encoder re-ranker in the background...")
+            self._embedding_loader.start_background()
+            self._cross_encoder_loader.start_background()
+    
+    @property
+    def embedding_model(self):
+        """Query embedding model (None if none loaded); waits for it while it is loading."""
+        return self._embedding_loader.get()
+    
+    @property
+    def embedding_model_name(self) -> str:
+        self._embedding_loader.get()
+        return self._embedding_loader.name
+    
+    @property
+    def cross_encoder(self):
+        """Cross-encoder re-ranker (None if none loaded); waits for it while it is loading."""
+        return self._cross_encoder_loader.get()
+    
+    @property
+    def cross_encoder_name(self) -> str:
+        self._cross_encoder_loader.get()
+        return self._cross_encoder_loader.name
+    
+    def _make_embedding_loader(self, index_model: str = None) -> LazyModel:
+        """
+        Loader of the query embedding model.
+        
+        An index that records its embedding model is queried with exactly that
+        model; if it cannot load, dense search is refused rather than run with another.
+        """
+        if index_model:
+            return LazyModel('embedding', [index_model], self._load_embedding_model,
+                             warm_up=self._warm_up_embedding_model, description="query embedding model",
+                             fallback="dense search unavailable")
         
-        # Initialize the same medical embedding model used for database creation
-        print("Loading medical domain embedding model for queries...")
+        # Legacy index without a recorded model: the same medical embedding models used for database creation
         medical_models = [
             'pritamdeka/S-PubMedBert-MS-MARCO',  # PubMedBERT fine-tuned for retrieval
             'pritamdeka/S-BioBert-snli-multinli-stsb',  # BioBERT fine-tuned for sentence similarity
             'microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract-fulltext',  # PubMedBERT base
             'all-MiniLM-L6-v2'  # Fallback general model
         ]
+        return LazyModel('embedding', medical_models, self._load_embedding_model,
+                         warm_up=self._warm_up_embedding_model, description="query embedding model",
+                         fallback="using ChromaDB default")
+    
+    def _load_embedding_model(self, model_name: str):
+        """Load a query embedding model whose forward passes count into padding_stats."""
+        model = SentenceTransformer(model_name)
+        track_padding(model, self.padding_stats)
+        return model
+    
+    def _follow_index_model(self) -> None:
+        """Switch the query embedding model when the index was re-embedded with another one."""
+        if self.index_embedding_model == self._embedding_index_model:
+            return
+        print(f"🔀 Index embedding model changed to {self.index_embedding_model}")
+        self._embedding_index_model = self.index_embedding_model
+        self._embedding_loader = self._make_embedding_loader(self.index_embedding_model)
+        if self.model_loading == 'background':
+            self._embedding_loader.start_background()
+    
+    def _text_search_allowed(self) -> None:
+        """Raise if dense search would have to embed queries with a model other than the index's."""
+        if self.index_embedding_model:
+            raise RuntimeError(f"Index was built with {self.index_embedding_model}, which could not be loaded; "
+                               f"refusing dense search with another embedding model")
+    
+    def _warm_up_embedding_model(self, model) -> None:
+        """First encode and first search, so the first clinician query does not pay for them."""
+        embedding = model.encode(["temozolomide dosing"])
+        if self.collection.count():
+            self.collection.query(query_embeddings=np.asarray(embedding).tolist(), n_results=1,
+                                  include=['distances'])
+        print(f"🧠 Query embedding dimension: {model.get_sentence_embedding_dimension()}")
+    
+    def _warm_up_cross_encoder(self, model) -> None:
+        model.predict([["temozolomide dosing", "Temozolomide 75 mg/m² daily with radiotherapy"]])
+        print(f"Cross-encoder re-ranking enabled for refined semantic matching")
+    
+    def _connect_index(self):
+        """Open the live index version, swapping in the new connection only once it is ready."""
+        pointer_token = self.index_versions.pointer_token()
+        db_dir = self.index_versions.current_path()
         
-        self.embedding_model = None
-        for model_name in medical_models:
-            try:
-                self.embedding_model = SentenceTransformer(model_name)
-                print(f"✅ Loaded query embedding model: {model_name}")
-                break
-            except Exception as e:
-                continue
+        # Connect to existing ChromaDB
+        chroma_client = chromadb.PersistentClient(
+            path=db_dir,
+            settings=Settings(anonymized_telemetry=False)
+        )
         
-        if self.embedding_model is None:
-            print("❌ Failed to load medical embedding model, using ChromaDB default")
+        # Get the medical embeddings collection (or its shards)
+        collection = open_collection(chroma_client, db_dir)
         
-        # Initialize cross-encoder re-ranker for refined semantic matching
-        print("Loading cross-encoder re-ranker...")
-        cross_encoder_models = [
-            'pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb',  # BioBERT cross-encoder for medical text
-            'cross-encoder/ms-marco-MiniLM-L-6-v2',  # MS MARCO cross-encoder
-            'cross-encoder/ms-marco-MiniLM-L-4-v2',  # Smaller MS MARCO model
-        ]
+        # Exact facet counts written at ingest (recounted in memory if missing or stale)
+        corpus_stats = CorpusStats(db_dir)
+        corpus_stats.ensure_consistent(collection)
+        
+        # BM25 index written at ingest (re-indexed in memory if missing or stale)
+        lexical_index = BM25Index(db_dir)
+        lexical_index.ensure_consistent(collection)
+        
+        # Metadata re-ranking features written at ingest (recomputed in memory if missing or stale)
+        rerank_features = RerankFeatures(db_dir)
+        rerank_features.ensure_consistent(collection)
         
-        self.cross_encoder = None
-        for model_name in cross_encoder_models:
+        self.db_dir = db_dir
+        self.index_version = self.index_versions.current_version()
+        self.chroma_client = chroma_client
+        self.collection = collection
+        self.sharded = isinstance(collection, ShardedCollection)
+        self.corpus_stats = corpus_stats
+        self.lexical_index = lexical_index
+        self.rerank_features = rerank_features
+        self.index_embedding_model = index_embedding_model(db_dir)
+        self._pointer_token = pointer_token
+        self._result_fingerprint = None
+    
+    def _check_index_version(self) -> bool:
+        """Switch to a newly published index version, if any; returns True if it switched."""
+        if self.index_versions.pointer_token() == self._pointer_token:
+            return False
+        
+        with self._index_lock:
+            # Another thread may have switched while we waited
+            if self.index_versions.pointer_token() == self._pointer_token:
+                return False
+            
+            previous = self.index_version
             try:
-                self.cross_encoder = CrossEncoder(model_name)
-                print(f"✅ Loaded cross-encoder re-ranker: {model_name}")
-                break
+                self._connect_index()
             except Exception as e:
+                # Keep serving the version we already have open
+                print(f"⚠️ Could not open new index version, staying on {previous}: {e}")
+                self._pointer_token = self.index_versions.pointer_token()
+                return False
+            
+            if self.index_version == previous:
+                return False
+            self._invalidate_caches()
+            self._follow_index_model()
+        print(f"🔀 Switched to index version {self.index_version} ({self.collection.count()} chunks)")
+        return True
+    
+    def _invalidate_caches(self):
+        """Drop everything derived from the previous index version."""
+        self.result_cache.clear()
+    
+    def _index_fingerprint(self) -> str:
+        """
+        Identify the exact index contents results were computed on.
+        
+        Published versions never change; an unversioned directory updated in place
+        is told apart by the corpus statistics written on every ingestion commit.
+        """
+        try:
+            stats_mtime = os.stat(self.corpus_stats.path).st_mtime_ns
+        except OSError:
+            stats_mtime = 0
+        return f"{self.index_version or self.db_dir}:{stats_mtime}"
+    
+    def query_clinical_data(self, query: str, n_results: int = 5, metadata_filters: Dict[str, Any] = None, 
+                          drug_filter: str = None, section_filter: str = None, hybrid: bool = None) -> Dict[str, Any]:
+        """
+        Query the clinical database with expanded clinical terminology and medical embeddings.
+        
+        With hybrid (default: the interface's setting), BM25 and dense candidates are
+        fused by reciprocal rank fusion before metadata and cross-encoder re-ranking.
+        """
+        return self.query_clinical_data_batch([query], n_results=n_results, metadata_filters=metadata_filters,
+                                              drug_filter=drug_filter, section_filter=section_filter,
+                                              hybrid=hybrid)[0]
+    
+    def query_clinical_data_batch(self, queries: List[Any], n_results: int = 5, metadata_filters: Dict[str, Any] = None,
+                                  drug_filter: str = None, section_filter: str = None,
+                                  hybrid: bool = None) -> List[Dict[str, Any]]:
+        """
+        Query the clinical database for several queries at once.
+        
+        All expanded queries are embedded in one encoder call, queries with the same
+        filters and shards are searched with one multi-embedding collection query, and
+        every (query, chunk) pair is scored in one cross-encoder call. Each result is
+        the same as query_clinical_data would return for that query.
+        
+        Args:
+            queries: Query strings, or dicts with a 'query' and any of n_results,
+                metadata_filters, drug_filter, section_filter, hybrid and cascade overriding the defaults
+            n_results, metadata_filters, drug_filter, section_filter, hybrid: Defaults for every query
+            
+        Returns:
+            One result (or {'error': ...}) per query, in input order
+        """
+        results, pending = self._prepare_batch(queries, n_results, metadata_filters, drug_filter, section_filter,
+                                               hybrid)
+        for stage in self._query_stages():
+            pending = stage(pending, results)
+        return results
+    
+    def evaluate_cascade(self, queries: List[Any], n_results: int = 5) -> Dict[str, Any]:
+        """
+        Compare cascade re-ranking with cross-encoder scoring of every candidate.
+        
+        Returns how often the top result agrees, the mean overlap of the top
+        n_results, and the (query, chunk) pairs each approach had the cross-encoder rank.
+        """
+        def variant(cascade):
+            return [dict(item, cascade=cascade) if isinstance(item, dict) else {'query': item, 'cascade': cascade}
+                    for item in queries]
+        
+        full = self.query_clinical_data_batch(variant(False), n_results=n_results)
+        cascaded = self.query_clinical_data_batch(variant(True), n_results=n_results)
+        
+        compared, top1_agreement, overlaps = 0, 0, []
+        pairs_full, pairs_cascade = 0, 0
+        for full_result, cascade_result in zip(full, cascaded):
+            if 'error' in full_result or 'error' in cascade_result:
                 continue
+            full_ids = full_result['results']['ids'][0]
+            cascade_ids = cascade_result['results']['ids'][0]
+            compared += 1
+            top1_agreement += full_ids[:1] == cascade_ids[:1]
+            overlaps.append(len(set(full_ids) & set(cascade_ids)) / len(full_ids) if full_ids else 1.0)
+            # Pairs ranked rather than run: the first pass fills the score cache for the second
+            pairs_full += full_result['rerank']['pairs_reranked']
+            pairs_cascade += cascade_result['rerank']['pairs_reranked']
         
-        if self.cross_encoder is None:
-            print("❌ Failed to load cross-encoder, using metadata re-ranking only")
+        return {
+            'queries': compared,
+            'top1_agreement': round(top1_agreement / compared, 4) if compared else 0.0,
+            'mean_overlap': round(float(np.mean(overlaps)), 4) if overlaps else 0.0,
+            'pairs_reranked_full': pairs_full,
+            'pairs_reranked_cascade': pairs_cascade,
+            'pairs_saved': round(1 - pairs_cascade / pairs_full, 4) if pairs_full else 0.0
+        }
+    
+    def _query_stages(self) -> List[Any]:
+        """
+        The pipeline stages after _prepare_batch, in order.
         
-        print(f"✅ Connected to GBM Clinical Database")
-        print(f"Total documents: {self.collection.count()}")
-        if self.embedding_model:
-            print(f"🧠 Query embedding dimension: {self.embedding_model.get_sentence_embedding_dimension()}")
-        if self.cross_encoder:
-            print(f"Cross-encoder re-ranking enabled for refined semantic matching")
+        Each takes the requests still in flight and the result list, records results
+        or errors, and returns the requests that move on to the next stage.
+        """
+        return [self._embed_planned, self._search_planned, self._fuse_lexical,
+                self._rank_planned, self._score_planned, self._finish_planned]
     
-    def query_clinical_data(self, query: str, n_results: int = 5, metadata_filters: Dict[str, Any] = None, 
-                          drug_filter: str = None, section_filter: str = None) -> Dict[str, Any]:
-        """Query the clinical database with expanded clinical terminology and medical embeddings."""
+    @staticmethod
+    def _fail(requests: List[Dict[str, Any]], results: List[Dict[str, Any]], error: Exception) -> List[Dict[str, Any]]:
+        for request in requests:
+            results[request['position']] = {'error': str(error)}
+        return []
+    
+    def _prepare_batch(self, queries: List[Any], n_results: int = 5, metadata_filters: Dict[str, Any] = None,
+                       drug_filter: str = None, section_filter: str = None, hybrid: bool = None):
+        """Resolve per-query options, answer what the result cache can and plan the rest."""
+        results: List[Dict[str, Any]] = [None] * len(queries)
         try:
-            # Expand query with clinical synonyms and concepts
-            expanded_query = self._expand_clinical_query(query)
-            
-            # Apply explicit retrieval filters
-            if drug_filter or section_filter:
-                # Use explicit filters for targeted retrieval
-                filtered_results = self._apply_explicit_filters(expanded_query, drug_filter, section_filter, n_results * 3)
-            else:
-                # Build metadata filters based on query content
-                if metadata_filters is None:
-                    metadata_filters = self._build_metadata_filters(query)
-                
-                # Use custom medical embeddings if available
-                if self.embedding_model:
-                    query_embedding = self.embedding_model.encode([expanded_query])
-                    filtered_results = self.collection.query(
-                        query_embeddings=query_embedding.tolist(),
-                        n_results=n_results * 3,  # Get more results for filtering and re-ranking
-                        include=['documents', 'metadatas', 'distances'],
-                        where=metadata_filters if metadata_filters else None
-                    )
-                else:
-                    # Fallback to text-based query
-                    filtered_results = self.collection.query(
-                        query_texts=[expanded_query],
-                        n_results=n_results * 3,  # Get more results for filtering and re-ranking
-                        include=['documents', 'metadatas', 'distances'],
-                        where=metadata_filters if metadata_filters else None
-                    )
-            
-            # Apply post-retrieval drug and section filtering
-            post_filtered_results = self._post_filter_results(filtered_results, query, drug_filter, section_filter)
+            # Pick up a newly published index version without a restart
+            self._check_index_version()
             
-            # Re-rank results based on metadata relevance
-            metadata_reranked = self._rerank_by_metadata(post_filtered_results, query, n_results * 2)
-            
-            # Apply cross-encoder re-ranking for final refinement
-            final_results = self._cross_encoder_rerank(metadata_reranked, query, n_results)
-            
-            return {
-                'query': query,
-                'expanded_query': expanded_query,
+            # Identical queries on an unchanged index return the cached result
+            fingerprint = self._index_fingerprint()
+            if fingerprint != self._result_fingerprint:
+                self.result_cache.clear()
+                self._result_fingerprint = fingerprint
+                # An unversioned index rebuilt in place may have been re-embedded with another model
+                self.index_embedding_model = index_embedding_model(self.db_dir)
+                self._follow_index_model()
+        except Exception as e:
+            return [{'error': str(e)} for _ in queries], []
+        
+        pending = []
+        for position, item in enumerate(queries):
+            request = {
+                'position': position,
+                'query': item,
                 'n_results': n_results,
-                'results': final_results,
                 'metadata_filters': metadata_filters,
                 'drug_filter': drug_filter,
                 'section_filter': section_filter,
-                'using_medical_embeddings': self.embedding_model is not None,
-                'using_cross_encoder': self.cross_encoder is not None
+                'hybrid': hybrid
+            }
+            if isinstance(item, dict):
+                request.update(item)
+            if request['hybrid'] is None:
+                request['hybrid'] = self.hybrid
+            if request.get('cascade') is None:
+                request['cascade'] = self.cascade
+            
+            # Results depend on the models that produced them, not only on the index
+            options = {
+                'embedding_model': self.embedding_model_name,
+                'cross_encoder': self.cross_encoder_name
             }
+            if request['hybrid']:
+                options['hybrid'] = True
+            if request['cascade']:
+                options['cascade_margin'] = self.cascade_margin
+            if self.metadata_boost_weights:
+                options['metadata_boost_weights'] = self.metadata_boost_weights
+            
+            try:
+                request['cache_key'] = self.result_cache.make_key(
+                    request['query'], request['n_results'], request['drug_filter'],
+                    request['section_filter'], request['metadata_filters'], fingerprint,
+                    options=options)
+                cached = self.result_cache.get(request['cache_key'])
+                if cached is not None:
+                    cached['query'] = request['query']
+                    results[position] = cached
+                    continue
+                self._plan_query(request)
+                pending.append(request)
+            except Exception as e:
+                results[position] = {'error': str(e)}
+        return results, pending
+    
+    def _rank_planned(self, requests: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Post-filter and metadata re-rank each query's retrieved chunks."""
+        ranked = []
+        for request in requests:
+            try:
+                # Apply post-retrieval drug and section filtering
+                post_filtered_results = self._post_filter_results(request['retrieved'], request['query'],
+                                                                  request['drug_filter'], request['section_filter'],
+                                                                  drug_routed=request['drug_routed'])
+                
+                # Re-rank results based on metadata relevance (on the fused ranking in hybrid mode)
+                candidates = self._rerank_by_metadata(post_filtered_results, request['query'],
+                                                      request['rerank_n'],
+                                                      base_scores=request.get('fusion_scores'))
+                request['candidate_count'] = len(candidates['documents'][0])
+                
+                # Only the uncertain head of the metadata ranking goes on to the cross-encoder
+                if request['cascade']:
+                    candidates = self._cascade_head(candidates, request['n_results'])
+                request['candidates'] = candidates
+                ranked.append(request)
+            except Exception as e:
+                results[request['position']] = {'error': str(e)}
+        return ranked
+    
+    def _score_planned(self, requests: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Score every query's candidates in one cross-encoder call."""
+        for request, (scores, predicted) in zip(requests, self._score_candidates(requests)):
+            request['scores'] = scores
+            request['pairs_predicted'] = predicted
+        return requests
+    
+    def _finish_planned(self, requests: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Apply the final cross-encoder ordering, then record and cache each result."""
+        for request in requests:
+            try:
+                # Apply cross-encoder re-ranking for final refinement
+                final_results = self._cross_encoder_rerank(request['candidates'], request['query'],
+                                                           request['n_results'], scores=request['scores'])
+                
+                result = {
+                    'query': request['query'],
+                    'expanded_query': request['expanded_query'],
+                    'n_results': request['n_results'],
+                    'results': final_results,
+                    'metadata_filters': request['metadata_filters'],
+                    'drug_filter': request['drug_filter'],
+                    'section_filter': request['section_filter'],
+                    'hybrid': request['hybrid'],
+                    'rerank': {
+                        'cascade': request['cascade'],
+                        'candidates': request['candidate_count'],
+                        'pairs_reranked': len(request['candidates']['documents'][0]) if self.cross_encoder else 0,
+                        # Pairs the cross-encoder ran on; cached scores are not counted
+                        'pairs_scored': request['pairs_predicted']
+                    },
+                    'using_medical_embeddings': self.embedding_model is not None,
+                    'using_cross_encoder': self.cross_encoder is not None
+                }
+                with self._stats_lock:
+                    self.cascade_stats['queries'] += 1
+                    for key in ('candidates', 'pairs_reranked', 'pairs_scored'):
+                        self.cascade_stats[key] += result['rerank'][key]
+                self.result_cache.put(request['cache_key'], result)
+                results[request['position']] = result
+            except Exception as e:
+                results[request['position']] = {'error': str(e)}
+        return []
+    
+    def _plan_query(self, request: Dict[str, Any]) -> None:
+        """Work out a query's expansion, where filter, shards and retrieval depth."""
+        query = request['query']
+        
+        # Expand query with clinical synonyms and concepts
+        request['expanded_query'] = self._expand_clinical_query(query)
+        if request['hybrid']:
+            # Fused lexical + dense candidates are better, so both lists are shallower
+            # and fewer candidates go on to the cross-encoder
+            fetch_n = request['n_results'] * 2
+            request['rerank_n'] = math.ceil(request['n_results'] * 1.5)
+        else:
+            fetch_n = request['n_results'] * 3  # Get more results for filtering and re-ranking
+            request['rerank_n'] = request['n_results'] * 2
+        
+        if request['drug_filter'] or request['section_filter']:
+            # Explicit filters: get all results first, then filter; routed shards already hold only the drug's chunks
+            shards, drug_routed = self._route_shards(query, request['drug_filter'])
+            if not drug_routed or request['section_filter']:
+                fetch_n = fetch_n * 2  # Get more for filtering
+            fetch_n = min(fetch_n, self.collection.count())
+            where = None
+        else:
+            # Build metadata filters based on query content
+            if request['metadata_filters'] is None:
+                request['metadata_filters'] = self._build_metadata_filters(query)
+            where = request['metadata_filters'] or None
+            shards, drug_routed = self._route_shards(query, where=where)
+        
+        request.update(where=where, shards=shards, drug_routed=drug_routed, fetch_n=fetch_n)
+    
+    def _embed_planned(self, requests: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Embed every planned query in one encoder call (skipped without a medical embedding model)."""
+        if not requests or not self.embedding_model:
+            return requests
+        try:
+            embeddings = self._encode_queries([request['expanded_query'] for request in requests])
         except Exception as e:
-            return {'error': str(e)}
+            return self._fail(requests, results, e)
+        for request, embedding in zip(requests, embeddings):
+            request['embedding'] = embedding
+        return requests
+    
+    def _search_planned(self, requests: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Retrieve candidates for planned queries, one collection query per (filter, depth, shards) group."""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for request in requests:
+            group_key = json.dumps([request['where'], request['fetch_n'], request['shards']], sort_keys=True, default=str)
+            groups.setdefault(group_key, []).append(request)
+        
+        searched = []
+        for group in groups.values():
+            first = group[0]
+            shard_args = {'shards': first['shards']} if first['shards'] else {}
+            try:
+                if self.embedding_model:
+                    search_args = {'query_embeddings': np.stack([request['embedding'] for request in group]).tolist()}
+                else:
+                    # Fallback to text-based query (only for legacy indexes without a recorded model)
+                    self._text_search_allowed()
+                    search_args = {'query_texts': [request['expanded_query'] for request in group]}
+                found = self.collection.query(
+                    n_results=first['fetch_n'],
+                    include=['documents', 'metadatas', 'distances'],
+                    where=first['where'],
+                    **search_args,
+                    **shard_args
+                )
+            except Exception as e:
+                self._fail(group, results, e)
+                continue
+            for q, request in enumerate(group):
+                request['retrieved'] = {key: [found[key][q]] for key in ('ids', 'documents', 'metadatas', 'distances')
+                                        if found.get(key) is not None}
+                searched.append(request)
+        
+        # Keep input order for the stages that follow
+        return sorted(searched, key=lambda request: request['position'])
+    
+    def _fuse_lexical(self, requests: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fuse BM25 candidates into the dense candidates of hybrid queries with reciprocal rank fusion."""
+        for request in requests:
+            if not request['hybrid']:
+                continue
+            try:
+                self._fuse_request(request)
+            except Exception as e:
+                # Dense candidates alone are still a valid answer
+                print(f"⚠️ Hybrid retrieval failed, using dense results: {e}")
+                request.pop('fusion_scores', None)
+        return requests
+    
+    def _fuse_request(self, request: Dict[str, Any]) -> None:
+        dense = request['retrieved']
+        dense_ids = dense['ids'][0]
+        dense_rows = {chunk_id: (doc, metadata, distance) for chunk_id, doc, metadata, distance in zip(
+            dense_ids, dense['documents'][0], dense['metadatas'][0], dense['distances'][0])}
+        
+        # Over-fetch lexical hits; some fail the where filter or live outside the routed shards
+        lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(request['expanded_query'],
+                                                                             n_results=request['fetch_n'] * 2)]
+        lexical_rows = {}
+        missing = [chunk_id for chunk_id in lexical_ids if chunk_id not in dense_rows]
+        if missing:
+            found = self.collection.get(ids=missing, where=request['where'],
+                                        include=['documents', 'metadatas', 'embeddings'])
+            shards = set(request['shards'] or [])
+            keep = [i for i, metadata in enumerate(found['metadatas'])
+                    if not shards or shard_for(metadata) in shards]
+            embeddings = found.get('embeddings')
+            distances = self._lexical_distances(
+                request, [embeddings[i] if embeddings is not None else None for i in keep], dense)
+            for i, distance in zip(keep, distances):
+                lexical_rows[found['ids'][i]] = (found['documents'][i], found['metadatas'][i], distance)
+        
+        lexical_ranking = [chunk_id for chunk_id in lexical_ids
+                           if chunk_id in dense_rows or chunk_id in lexical_rows][:request['fetch_n']]
+        fused = reciprocal_rank_fusion([dense_ids, lexical_ranking], k=self.rrf_k)[:request['fetch_n']]
+        
+        rows = {**lexical_rows, **dense_rows}
+        request['retrieved'] = {
+            'ids': [[chunk_id for chunk_id, _ in fused]],
+            'documents': [[rows[chunk_id][0] for chunk_id, _ in fused]],
+            'metadatas': [[rows[chunk_id][1] for chunk_id, _ in fused]],
+            'distances': [[rows[chunk_id][2] for chunk_id, _ in fused]]
+        }
+        request['fusion_scores'] = dict(fused)
+    
+    def _lexical_distances(self, request: Dict[str, Any], embeddings, dense: Dict[str, Any]) -> List[float]:
+        """
+        Dense distances of lexical-only hits, in the collection's distance space.
+        
+        Without a query embedding (ChromaDB default embeddings) they get the worst
+        dense distance instead.
+        """
+        if not embeddings:
+            return []
+        if 'embedding' not in request or any(embedding is None for embedding in embeddings):
+            worst = max(dense['distances'][0], default=1.0)
+            return [worst] * len(embeddings)
+        
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        query = np.asarray(request['embedding'], dtype=np.float32)
+        space = (getattr(self.collection, 'metadata', None) or {}).get('hnsw:space', 'l2')
+        if space == 'cosine':
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            distances = 1 - vectors @ query / np.where(norms == 0, 1, norms)
+        elif space == 'ip':
+            distances = 1 - vectors @ query
+        else:
+            # ChromaDB's l2 space reports squared distances
+            distances = np.sum((vectors - query) ** 2, axis=1)
+        return [float(distance) for distance in distances]
+    
+    def _encode_queries(self, queries: List[str], batch_size: int = 32) -> np.ndarray:
+        """Encode query texts in one encoder call, preserving input order.
+        
+        Embeddings come from the LRU cache when possible; only distinct uncached
+        texts are sent to the encoder, all at once, so its length sort groups the
+        queries of a whole batch (or micro-batch of queued requests).
+        """
+        keys = [(self.embedding_model_name, query) for query in queries]
+        cached = [self.query_embedding_cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, cached) if embedding is None))
+        
+        if missing:
+            encoded = self.embedding_model.encode(missing, batch_size=batch_size, show_progress_bar=False,
+                                                  convert_to_numpy=True)
+            new_embeddings = dict(zip(missing, encoded))
+            for query, embedding in new_embeddings.items():
+                self.query_embedding_cache.put((self.embedding_model_name, query), embedding)
+            cached = [embedding if embedding is not None else new_embeddings[query]
+                      for query, embedding in zip(queries, cached)]
+        
+        return np.stack(cached) if cached else np.zeros((0, self.embedding_model.get_sentence_embedding_dimension()))
     
     def _expand_clinical_query(self, query: str) -> str:
         """Expand query with clinical synonyms and related concepts."""
@@ -228,7 +765,12 @@ class ClinicalQueryInterface:
         query_lower = query.lower()
         
         # ChromaDB requires a single top-level operator, so we'll prioritize the most specific filter
-        # Priority: drug > clinical_topic > other metadata
+        # Priority: numeric ranges > drug > clinical_topic > other metadata
+        
+        # Explicit dose, schedule, grade or lab constraints filter on the typed range fields
+        range_filters = parse_range_filters(query)
+        if range_filters:
+            return combine_conditions(range_conditions(range_filters))
         
         # Check for specific drug mentions first (highest priority)
         if any(drug in query_lower for drug in ['temozolomide', 'tmz', 'temodar']):
@@ -262,32 +804,37 @@ class ClinicalQueryInterface:
         # No specific filters found - return None to search all documents
         return None
     
-    def _apply_explicit_filters(self, query: str, drug_filter: str, section_filter: str, n_results: int) -> Dict[str, Any]:
-        """Apply explicit drug and section filters during retrieval."""
-        # Get all results first, then filter
-        if self.embedding_model:
-            query_embedding = self.embedding_model.encode([query])
-            results = self.collection.query(
-                query_embeddings=query_embedding.tolist(),
-                n_results=min(n_results * 2, self.collection.count()),  # Get more for filtering
-                include=['documents', 'metadatas', 'distances']
-            )
-        else:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=min(n_results * 2, self.collection.count()),
-                include=['documents', 'metadatas', 'distances']
-            )
+    def _route_shards(self, query: str, drug_filter: str = None, where: Dict[str, Any] = None):
+        """
+        Choose the shards to search in the sharded layout.
         
-        return results
+        Returns:
+            (shard names or None to search everything, whether the drug filter is
+            already satisfied by the shard choice)
+        """
+        if not self.sharded:
+            return None, False
+        
+        drug = (drug_filter or self._detect_drug_from_query(query) or '').lower() or None
+        doc_types = where_doc_types(where)
+        drug_routed = drug in ('temozolomide', 'bevacizumab')
+        if not drug_routed and not doc_types:
+            return None, False
+        return route_shards(drug if drug_routed else None, doc_types), drug_routed
     
-    def _post_filter_results(self, results: Dict[str, Any], query: str, drug_filter: str, section_filter: str) -> Dict[str, Any]:
+    def _post_filter_results(self, results: Dict[str, Any], query: str, drug_filter: str, section_filter: str,
+                             drug_routed: bool = False) -> Dict[str, Any]:
         """Apply post-retrieval filtering based on drug mentions and sections."""
         if not results['documents'][0] or (not drug_filter and not section_filter):
             return results
+        if drug_routed and not section_filter:
+            return results
         
-        # Detect drug filter from query if not explicitly provided
-        if not drug_filter:
+        if drug_routed:
+            # Results came only from the drug's shards
+            drug_filter = None
+        elif not drug_filter:
+            # Detect drug filter from query if not explicitly provided
             drug_filter = self._detect_drug_from_query(query)
         
         filtered_docs = []
@@ -373,90 +920,117 @@ class ClinicalQueryInterface:
         
         return None
     
-    def _rerank_by_metadata(self, results: Dict[str, Any], query: str, n_results: int) -> Dict[str, Any]:
-        """Re-rank results based on metadata relevance to query."""
+    def _rerank_by_metadata(self, results: Dict[str, Any], query: str, n_results: int,
+                            base_scores: Dict[str, float] = None) -> Dict[str, Any]:
+        """
+        Re-rank results based on metadata relevance to query (base_scores: chunk ID -> fused score).
+        
+        Boosts come from one product of the candidates' precomputed feature matrix
+        with the query's features and the boost weights.
+        """
         if not results['documents'][0]:
             return results
         
-        query_lower = query.lower()
-        scored_results = []
+        ids = results['ids'][0]
         
-        for i, (doc, metadata, distance) in enumerate(zip(
-            results['documents'][0],
-            results['metadatas'][0],
-            results['distances'][0]
-        )):
-            # Base score is semantic similarity (1 - distance)
-            base_score = 1 - distance
-            
-            # Metadata boost factors
-            metadata_boost = 0
-            
-            # Boost for clinical topic match
-            clinical_topic = metadata.get('clinical_topic', '')
-            topic_boosts = {
-                'dosing': ['dose', 'dosing', 'mg/m²', 'protocol', 'regimen'],
-                'toxicity': ['toxicity', 'side effects', 'adverse', 'monitoring', 'CBC'],
-                'administration': ['give', 'administer', 'infusion', 'oral', 'IV'],
-                'contraindications': ['contraindication', 'avoid', 'caution', 'warning'],
-                'interactions': ['interaction', 'concurrent', 'concomitant']
-            }
-            
-            for topic, keywords in topic_boosts.items():
-                if clinical_topic == topic and any(keyword in query_lower for keyword in keywords):
-                    metadata_boost += 0.15
-                    break
-            
-            # Boost for specific drug mention
-            drugs = metadata.get('drugs', '').lower()
-            if ('temozolomide' in drugs or 'tmz' in drugs) and any(term in query_lower for term in ['temozolomide', 'tmz', 'temodar']):
-                metadata_boost += 0.1
-            elif 'bevacizumab' in drugs and any(term in query_lower for term in ['bevacizumab', 'avastin']):
-                metadata_boost += 0.1
-            
-            # Boost for toxicity grades if query mentions specific toxicity
-            toxicity_grades = metadata.get('toxicity_grades', '')
-            if toxicity_grades and any(term in query_lower for term in ['grade', 'toxicity', 'adverse']):
-                metadata_boost += 0.08
-            
-            # Boost for laboratory values if query mentions monitoring/labs
-            lab_values = metadata.get('laboratory_values', '')
-            if lab_values and any(term in query_lower for term in ['lab', 'CBC', 'monitor', 'platelets', 'neutrophils']):
-                metadata_boost += 0.08
-            
-            # Boost for evidence level (FDA approved content gets priority)
-            evidence_level = metadata.get('evidence_level', '')
-            if 'fda approved' in evidence_level.lower():
-                metadata_boost += 0.12
-            elif 'clinical trial' in evidence_level.lower():
-                metadata_boost += 0.06
-            
-            # Boost for document type relevance
-            doc_type = metadata.get('doc_type', '').lower()
-            if 'prescribing information' in doc_type and any(term in query_lower for term in ['dose', 'administration', 'prescribing']):
-                metadata_boost += 0.1
-            elif 'clinical protocol' in doc_type and any(term in query_lower for term in ['protocol', 'regimen', 'treatment']):
-                metadata_boost += 0.1
-            
-            final_score = base_score + metadata_boost
-            scored_results.append((i, final_score, doc, metadata, distance))
-        
-        # Sort by final score (highest first) and take top n_results
-        scored_results.sort(key=lambda x: x[1], reverse=True)
-        top_results = scored_results[:n_results]
+        # Base score is semantic similarity (1 - distance), or in hybrid mode the fused rank
+        # score spread over the candidates' similarity range, so boosts weigh the same in both
+        base = 1 - np.asarray(results['distances'][0], dtype=float)
+        if base_scores is not None:
+            base = scale_to_range([base_scores.get(chunk_id, 0.0) for chunk_id in ids], base)
+        
+        # Topic, drug, toxicity grade, lab value, evidence level and document type boosts
+        features = self.rerank_features.matrix(ids, results['metadatas'][0])
+        final_scores = base + metadata_boosts(features, query_features(query), self._boost_vector)
+        
+        # Sort by final score (highest first) and take top n_results; rounding keeps equal
+        # scores in retrieval order whatever order the boosts were summed in
+        top = np.argsort(-np.round(final_scores, 9), kind='stable')[:n_results]
         
         # Reconstruct results format
         reranked_results = {
-            'ids': [results['ids'][0][item[0]] for item in top_results],
-            'documents': [[item[2] for item in top_results]],
-            'metadatas': [[item[3] for item in top_results]],
-            'distances': [[item[4] for item in top_results]]
+            'ids': [[ids[i] for i in top]],
+            'documents': [[results['documents'][0][i] for i in top]],
+            'metadatas': [[results['metadatas'][0][i] for i in top]],
+            'distances': [[results['distances'][0][i] for i in top]],
+            'metadata_scores': [[float(final_scores[i]) for i in top]]
         }
         
         return reranked_results
     
-    def _cross_encoder_rerank(self, results: Dict[str, Any], query: str, n_results: int) -> Dict[str, Any]:
-        """Apply cross-encoder re-ranking for refined semantic matching."""
+    def _cascade_head(self, results: Dict[str, Any], n_results: int) -> Dict[str, Any]:
+        """
+        Cut metadata-ranked candidates down to those the cross-encoder could still reorder.
+        
+        The top n_results are always kept; a later candidate is kept only while its
+        metadata score is within cascade_margin of the n-th one, so a clear gap after
+        the top results means the cross-encoder scores just those.
+        """
+        scores = results.get('metadata_scores', [[]])[0]
+        if n_results <= 0 or len(scores) <= n_results:
+            return results
+        
+        cut_off = scores[n_results - 1] - self.cascade_margin
+        depth = n_results
+        while depth < len(scores) and scores[depth] >= cut_off:
+            depth += 1
+        return {key: [values[0][:depth]] for key, values in results.items()}
+    
+    def _cross_encoder_pairs(self, results: Dict[str, Any], query: str):
+        """Return the (query, document) pairs the cross-encoder scores for a result set, and their chunk IDs."""
+        # Whitespace-normalized (case kept for cased models) so repeats share cached scores
+        query = ' '.join(query.split())
+        
+        # Truncate document for cross-encoder (max 512 tokens typically)
+        query_doc_pairs = [[query, doc[:2000]] for doc in results['documents'][0]]  # Approximate token limit
+        chunk_ids = results['ids'][0] if results.get('ids') else [None] * len(query_doc_pairs)
+        return query_doc_pairs, chunk_ids
+    
+    def _score_candidates(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Cross-encoder scores for the candidates of several queries, from a single model call.
+        
+        Returns (scores, pairs the model ran on) per request; scores are None where
+        there is nothing to score or scoring failed. A pair shared by several queries
+        counts for the first. If the batched call fails each query is scored on its own.
+        """
+        batch_scores = [(None, 0)] * len(requests)
+        if not self.cross_encoder:
+            return batch_scores
+        
+        all_pairs, all_ids, spans = [], [], []
+        for request in requests:
+            if not request['candidates']['documents'][0]:
+                spans.append(None)
+                continue
+            query_doc_pairs, chunk_ids = self._cross_encoder_pairs(request['candidates'], request['query'])
+            spans.append((len(all_pairs), len(all_pairs) + len(query_doc_pairs)))
+            all_pairs.extend(query_doc_pairs)
+            all_ids.extend(chunk_ids)
+        if not all_pairs:
+            return batch_scores
+        
+        try:
+            scores, predicted = self._score_pairs_counted(all_pairs, all_ids)
+        except Exception as e:
+            print(f"⚠️ Batched cross-encoder scoring failed: {e}")
+            return [self._score_request(request) if span else (None, 0) for request, span in zip(requests, spans)]
+        return [(scores[span[0]:span[1]], sum(predicted[span[0]:span[1]])) if span else (None, 0)
+                for span in spans]
+    
+    def _score_request(self, request: Dict[str, Any]):
+        """(scores, pairs the model ran on) for one query's candidates; (None, 0) if scoring fails."""
+        try:
+            query_doc_pairs, chunk_ids = self._cross_encoder_pairs(request['candidates'], request['query'])
+            scores, predicted = self._score_pairs_counted(query_doc_pairs, chunk_ids)
+        except Exception as e:
+            print(f"⚠️ Cross-encoder scoring failed: {e}")
+            return None, 0
+        return scores, sum(predicted)
+    
+    def _cross_encoder_rerank(self, results: Dict[str, Any], query: str, n_results: int,
+                              scores: List[float] = None) -> Dict[str, Any]:
+        """Apply cross-encoder re-ranking for refined semantic matching (scores may be precomputed)."""
         if not self.cross_encoder or not results['documents'][0]:
             # If no cross-encoder available, just truncate to n_results
             return {
@@ -468,18 +1042,12 @@ class ClinicalQueryInterface:
         
         try:
             # Prepare query-document pairs for cross-encoder
-            query_doc_pairs = []
             original_data = []
-            
             for i, (doc, metadata, distance) in enumerate(zip(
                 results['documents'][0],
                 results['metadatas'][0],
                 results['distances'][0]
             )):
-                # Truncate document for cross-encoder (max 512 tokens typically)
-                doc_truncated = doc[:2000]  # Approximate token limit
-                query_doc_pairs.append([query, doc_truncated])
-                
                 original_data.append({
                     'doc': doc,
                     'metadata': metadata,
@@ -487,8 +1055,11 @@ class ClinicalQueryInterface:
                     'index': i
                 })
             
-            # Get cross-encoder scores
-            cross_encoder_scores = self.cross_encoder.predict(query_doc_pairs)
+            # Get cross-encoder scores, running the model only on uncached pairs
+            cross_encoder_scores = scores
+            if cross_encoder_scores is None:
+                query_doc_pairs, chunk_ids = self._cross_encoder_pairs(results, query)
+                cross_encoder_scores = self._score_pairs(query_doc_pairs, chunk_ids)
             
             # Combine with original data and sort by cross-encoder score
             scored_results = []
@@ -509,7 +1080,7 @@ class ClinicalQueryInterface:
             
             # Reconstruct results format
             cross_encoder_results = {
-                'ids': [results['ids'][0][item['original_index']] for item in top_results] if results.get('ids') else [[]],
+                'ids': [[results['ids'][0][item['original_index']] for item in top_results]] if results.get('ids') else [[]],
                 'documents': [[item['doc'] for item in top_results]],
                 'metadatas': [[item['metadata'] for item in top_results]],
                 'distances': [[item['distance'] for item in top_results]],  # Keep original distances
@@ -528,6 +1099,36 @@ class ClinicalQueryInterface:
                 'distances': [results['distances'][0][:n_results]]
             }
     
+    def _score_pairs(self, query_doc_pairs: List[List[str]], chunk_ids: List[str]) -> List[float]:
+        """
+        Cross-encoder scores for (query, document) pairs, served from the score cache when possible.
+        
+        Keys are (model, query, chunk id, digest of the scored text), so a chunk whose
+        content changes in a later index version is scored afresh.
+        """
+        return self._score_pairs_counted(query_doc_pairs, chunk_ids)[0]
+    
+    def _score_pairs_counted(self, query_doc_pairs: List[List[str]], chunk_ids: List[str]):
+        """_score_pairs, also returning for each pair whether the model ran on it in this call."""
+        keys = [(self.cross_encoder_name, query, chunk_id, hash_text(doc))
+                for (query, doc), chunk_id in zip(query_doc_pairs, chunk_ids)]
+        scores = [self.score_cache.get(key) for key in keys]
+        # Pairs repeated within one call (e.g. the same query twice in a batch) are predicted once
+        missing = list(dict.fromkeys(key for key, score in zip(keys, scores) if score is None))
+        ran = [False] * len(keys)
+        
+        if missing:
+            first_index = {}
+            for i, key in enumerate(keys):
+                first_index.setdefault(key, i)
+            predicted = self.cross_encoder.predict([query_doc_pairs[first_index[key]] for key in missing])
+            new_scores = {key: float(score) for key, score in zip(missing, predicted)}
+            for key, score in new_scores.items():
+                self.score_cache.put(key, score)
+                ran[first_index[key]] = True
+            scores = [score if score is not None else new_scores[key] for key, score in zip(keys, scores)]
+        return scores, ran
+    
     def format_results(self, query_results: Dict[str, Any]) -> str:
         """Format query results for clinical display."""
         if 'error' in query_results:
@@ -593,6 +1194,8 @@ class ClinicalQueryInterface:
                 output.append(f"⏱️ Treatment Phase: {metadata['treatment_phases']}")
             if metadata.get('evidence_level'):
                 output.append(f"📊 Evidence: {metadata['evidence_level']}")
+            if metadata.get('alternate_sources'):
+                output.append(f"📚 Also in: {metadata['alternate_sources']}")
                 
             output.append(f"📑 Chunk: {metadata['chunk_index']+1}/{metadata['total_chunks']}")
             output.append(f"🆔 Chunk ID: {metadata.get('chunk_id', 'N/A')}")
@@ -637,19 +1240,25 @@ class ClinicalQueryInterface:
         
         # Get all results first, then filter by drug in post-processing
         # ChromaDB doesn't support $contains operator
+        self._check_index_version()
+        shards, _ = self._route_shards(query, drug)
+        shard_args = {'shards': shards} if shards else {}
         
         if self.embedding_model:
-            query_embedding = self.embedding_model.encode([query])
+            query_embedding = self._encode_queries([query])
             results = self.collection.query(
                 query_embeddings=query_embedding.tolist(),
                 n_results=20,  # Get more results to filter
-                include=['documents', 'metadatas', 'distances']
+                include=['documents', 'metadatas', 'distances'],
+                **shard_args
             )
         else:
+            self._text_search_allowed()
             results = self.collection.query(
                 query_texts=[query],
                 n_results=20,  # Get more results to filter
-                include=['documents', 'metadatas', 'distances']
+                include=['documents', 'metadatas', 'distances'],
+                **shard_args
             )
         
         # Filter results by drug in post-processing
@@ -692,14 +1301,8 @@ class ClinicalQueryInterface:
     
     def get_document_types(self) -> List[str]:
         """Get available document types."""
-        sample = self.collection.get(limit=1000)
-        doc_types = set()
-        
-        if sample['metadatas']:
-            for metadata in sample['metadatas']:
-                doc_types.add(metadata.get('doc_type', 'Unknown'))
-        
-        return sorted(list(doc_types))
+        self._check_index_version()
+        return sorted(self.corpus_stats.facets()['doc_types'])
     
     def interactive_query(self):
         """Interactive command-line interface for clinical queries."""
@@ -721,6 +1324,14 @@ class ClinicalQueryInterface:
                 elif user_input.lower() == 'stats':
                     self.show_stats()
                 
+                elif user_input.lower() in ['hybrid on', 'hybrid off']:
+                    self.hybrid = user_input.lower().endswith('on')
+                    print(f"🔤 Hybrid BM25 + dense retrieval {'on' if self.hybrid else 'off'}")
+                
+                elif user_input.lower() in ['cascade on', 'cascade off']:
+                    self.cascade = user_input.lower().endswith('on')
+                    print(f"✂️ Cascade re-ranking {'on' if self.cascade else 'off'}")
+                
                 # Parse filter commands
                 elif user_input.startswith('filter:'):
                     self._handle_filter_command(user_input)
@@ -802,6 +1413,8 @@ DRUG-SPECIFIC QUERIES:
 COMMANDS:
 - help - Show this help message
 - stats - Show database statistics
+- hybrid on/off - Fuse BM25 keyword matches with semantic results
+- cascade on/off - Cross-encoder score only candidates close to the top results
 - quit/exit/q - Exit the interface
 
 EXAMPLES:
@@ -822,6 +1435,7 @@ FEATURES:
 - 🧠 Medical domain embeddings (PubMedBERT)
 - 🔄 Cross-encoder re-ranking for refined results
 - 🎯 Metadata-based filtering and boosting
+- 🔤 Hybrid BM25 + dense retrieval for exact clinical tokens (mg/m², Grade 3, q2w)
 - 🔍 Explicit drug and section filtering
 - 📊 Clinical terminology expansion
 """
@@ -829,33 +1443,38 @@ FEATURES:
     
     def show_stats(self):
         """Show database statistics."""
-        total_count = self.collection.count()
-        sample = self.collection.get(limit=100)
-        
-        doc_types = {}
-        sources = {}
-        drugs = {}
-        
-        if sample['metadatas']:
-            for metadata in sample['metadatas']:
-                # Count document types
-                doc_type = metadata.get('doc_type', 'Unknown')
-                doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
-                
-                # Count sources
-                source = metadata.get('source', 'Unknown')
-                sources[source] = sources.get(source, 0) + 1
-                
-                # Count drugs
-                drug_list = metadata.get('drugs', 'both').split(',')
-                for drug in drug_list:
-                    drugs[drug] = drugs.get(drug, 0) + 1
+        self._check_index_version()
+        facets = self.corpus_stats.facets()
         
         print(f"\n📊 Database Statistics:")
-        print(f"📋 Total chunks: {total_count}")
-        print(f"📁 Document types: {doc_types}")
-        print(f"🏛️ Sources: {sources}")
-        print(f"💊 Drugs: {drugs}")
+        print(f"📋 Total chunks: {self.corpus_stats.total_chunks}")
+        if self.index_version:
+            print(f"🗂️ Index version: {self.index_version}")
+        print(f"📁 Document types: {facets['doc_types']}")
+        print(f"🏛️ Sources: {facets['sources']}")
+        print(f"💊 Drugs: {facets['drugs']}")
+        print(f"🎯 Clinical topics: {facets['clinical_topics']}")
+        print(f"📊 Evidence: {facets['evidence']}")
+        print(f"🤖 Models: embedding {self._embedding_loader.status()}, "
+              f"cross-encoder {self._cross_encoder_loader.status()}")
+        with self._stats_lock:
+            cascade = dict(self.cascade_stats)
+        print(f"✂️ Cascade re-ranking: {cascade['pairs_reranked']} of {cascade['candidates']} candidates "
+              f"cross-encoder ranked, {cascade['pairs_scored']} run through the model, over {cascade['queries']} "
+              f"queries ({'on' if self.cascade else 'off'}, margin {self.cascade_margin})")
+        print(f"🔤 BM25 index: {len(self.lexical_index.postings)} terms over {self.lexical_index.total_chunks} chunks "
+              f"(hybrid retrieval {'on' if self.hybrid else 'off'})")
+        
+        cache = self.query_embedding_cache.stats()
+        print(f"🧠 Query embedding cache: {cache['size']}/{cache['max_size']} entries, "
+              f"{cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']:.1%} hit rate)")
+        cache = self.score_cache.stats()
+        print(f"🎯 Cross-encoder score cache: {cache['size']}/{cache['max_size']} pairs, "
+              f"{cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']:.1%} hit rate)")
+        cache = self.result_cache.stats()
+        print(f"⚡ Result cache: {cache['size']}/{cache['max_size']} entries, "
+              f"{cache['hits']} hits ({cache['disk_hits']} from disk), {cache['misses']} misses "
+              f"({cache['hit_rate']:.1%} hit rate)")
 
 def main():
     """Main function to start the clinical query interface."""
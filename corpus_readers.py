@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Streaming Corpus Readers for GBM Clinical Vector Database
+Reads JSONL exports (PubMed-style abstracts, trial registries, institutional
+protocols), optionally gzipped, one record at a time and maps their fields onto
+the clinical document metadata used by the chunk/embed/store pipeline
+Author: Chetanya Pandey
+"""
+
+import os
+import gzip
+import json
+import multiprocessing as mp
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from clinical_chunker import ClinicalChunker
+from index_manifest import hash_text
+from ingest_profiler import StageProfiler
+
+RECORD_FILE_PATTERNS = ["*.jsonl", "*.ndjson", "*.jsonl.gz", "*.ndjson.gz"]
+
+# Document field -> record keys tried in order (dotted keys reach into nested objects)
+DEFAULT_FIELD_MAP = {
+    'id': ['id', 'doc_id', 'pmid', 'PMID', 'nct_id', 'MedlineCitation.PMID'],
+    'title': ['title', 'ArticleTitle', 'MedlineCitation.Article.ArticleTitle'],
+    'text': ['text', 'content', 'abstract', 'AbstractText', 'body', 'MedlineCitation.Article.Abstract.AbstractText'],
+    'doc_type': ['doc_type'],
+    'drug': ['drug', 'drugs'],
+    'source': ['source', 'journal', 'Journal', 'MedlineCitation.Article.Journal.Title']
+}
+
+# Uncompressed files are split into byte ranges of this size for parallel readers
+SHARD_BYTES = 8 * 1024 * 1024
+# Gzip streams cannot be split, so the parent streams them to workers in line batches
+LINES_PER_TASK = 1000
+
+# Reader state owned by each worker process
+_worker_state = None
+
+
+def parse_field_map(spec: Optional[str]) -> Dict[str, List[str]]:
+    """
+    Build a field map from 'field=key,field=key' overrides of DEFAULT_FIELD_MAP.
+
+    e.g. 'text=abstract_text,doc_type=category,source=registry'
+    """
+    field_map = {field: list(keys) for field, keys in DEFAULT_FIELD_MAP.items()}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        field, _, key = item.partition('=')
+        field = field.strip()
+        if field not in field_map or not key.strip():
+            raise ValueError(f"Invalid field mapping '{item}' (fields: {', '.join(field_map)})")
+        field_map[field] = [key.strip()]
+    return field_map
+
+
+def _lookup(record: Dict[str, Any], key: str) -> Any:
+    value = record
+    for part in key.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _first(record: Dict[str, Any], keys: List[str]) -> Any:
+    for key in keys:
+        value = _lookup(record, key)
+        if value not in (None, '', []):
+            return value
+    return None
+
+
+def _as_text(value: Any) -> str:
+    """Flatten strings, lists of sections and {'#text': ...} objects to plain text."""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '\n\n'.join(part for part in (_as_text(item) for item in value) if part)
+    if isinstance(value, dict):
+        return _as_text(value.get('#text') or value.get('text') or '')
+    return str(value).strip()
+
+
+def record_to_document(record: Dict[str, Any], source_path: str, chunker: ClinicalChunker,
+                       field_map: Dict[str, List[str]]) -> Optional[Dict[str, Any]]:
+    """
+    Map one record onto a clinical document (None if it has no text).
+
+    The document name is '<file>#<record id>', falling back to a content hash so
+    unchanged records keep their chunk IDs when others are inserted or removed.
+    Names repeated within a run are resolved by DocumentNames.
+    """
+    title = _as_text(_first(record, field_map['title']))
+    text = _as_text(_first(record, field_map['text']))
+    if not text and not title:
+        return None
+    content = f"# {title}\n\n{text}" if title and text else (text or title)
+
+    basename = os.path.basename(source_path)
+    record_id = _as_text(_first(record, field_map['id'])) or hash_text(content)[:16]
+
+    drug = _first(record, field_map['drug'])
+    if isinstance(drug, str):
+        drug = [name.strip().lower() for name in drug.split(',') if name.strip()]
+    elif isinstance(drug, list):
+        drug = [str(name).strip().lower() for name in drug if str(name).strip()]
+
+    doc_type = _first(record, field_map['doc_type'])
+    source = _first(record, field_map['source'])
+    return chunker.make_document(
+        f"{basename}#{record_id}", source_path, content,
+        doc_type=str(doc_type) if doc_type else None,
+        drug=drug or None,
+        source=_as_text(source) or None,
+        # Classify by the export's file name and the record title
+        label=f"{basename} {title}"
+    )
+
+
+class DocumentNames:
+    def __init__(self):
+        """Keep record document names (and so chunk IDs) unique across one ingestion run."""
+        # name -> content hashes seen under it
+        self.seen: Dict[str, set] = {}
+
+    def claim(self, doc: Dict[str, Any]) -> bool:
+        """
+        Register a document, renaming it if another record already used its name.
+
+        A record repeating an earlier one exactly (same name and content) returns
+        False and should be skipped. A repeated id with different content is
+        renamed '<name>~<n>' in order of appearance, so the name stays stable
+        across runs while the file's record order does not change.
+        """
+        name = doc['filename']
+        hashes = self.seen.setdefault(name, set())
+        if doc['content_hash'] in hashes:
+            print(f"⚠️ Skipping repeated record {name}")
+            return False
+        hashes.add(doc['content_hash'])
+        if len(hashes) > 1:
+            occurrence = len(hashes)
+            while f"{name}~{occurrence}" in self.seen:
+                occurrence += 1
+            unique_name = f"{name}~{occurrence}"
+            print(f"⚠️ Record id {name} is used by several records, indexing this one as {unique_name}")
+            doc['filename'] = unique_name
+            self.seen[unique_name] = {doc['content_hash']}
+        return True
+
+
+def _claim_names(results: Iterator[Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]], names: DocumentNames,
+                 known_hashes: Dict[str, str], chunker: Optional[ClinicalChunker]) -> Iterator[Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]]:
+    """Apply DocumentNames to worker results, re-chunking renamed documents under their new name."""
+    for doc, chunks in results:
+        name = doc['filename']
+        if not names.claim(doc):
+            continue
+        if doc['filename'] != name:
+            if doc['content_hash'] == known_hashes.get(doc['filename']):
+                chunks = None
+            else:
+                chunker = chunker or ClinicalChunker()
+                chunks = chunker.chunk_document(doc)
+        yield doc, chunks
+
+
+def _open_binary(path: str):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def _parse_line(line: bytes, path: str) -> Optional[Dict[str, Any]]:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        print(f"⚠️ Skipping malformed record in {os.path.basename(path)}: {e}")
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def iter_records(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the records of a JSONL file (gzipped if it ends in .gz) one line at a time.
+
+    With start/end (uncompressed files only) only the lines beginning inside that
+    byte range are read, so ranges covering a file read every line exactly once.
+    """
+    with _open_binary(path) as f:
+        position = start
+        if start:
+            # Resume at the first line that begins at or after start
+            f.seek(start - 1)
+            position = start - 1 + len(f.readline())
+        while end is None or position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            record = _parse_line(line, path)
+            if record is not None:
+                yield record
+
+
+def split_tasks(path: str, shard_bytes: int = SHARD_BYTES,
+                lines_per_task: int = LINES_PER_TASK) -> Iterator[Tuple[str, int, Optional[int], Optional[List[bytes]]]]:
+    """
+    Split a record file into reader tasks (path, start, end, lines).
+
+    Uncompressed files become byte ranges read by the workers themselves; gzip
+    streams are read here and shipped as batches of raw lines.
+    """
+    if not path.endswith('.gz'):
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), shard_bytes):
+            yield path, start, min(start + shard_bytes, size), None
+        return
+
+    batch = []
+    with _open_binary(path) as f:
+        for line in f:
+            batch.append(line)
+            if len(batch) >= lines_per_task:
+                yield path, 0, None, batch
+                batch = []
+    if batch:
+        yield path, 0, None, batch
+
+
+def _load_records(chunker: ClinicalChunker, records: Iterator[Dict[str, Any]], path: str,
+                  field_map: Dict[str, List[str]], known_hashes: Dict[str, str],
+                  names: Optional[DocumentNames] = None) -> Iterator[Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]]:
+    """Map records to documents and chunk those whose content hash changed (names: resolves repeated names)."""
+    for record in records:
+        with chunker.profiler.stage('load', items=1):
+            doc = record_to_document(record, path, chunker, field_map)
+        if doc is None or (names is not None and not names.claim(doc)):
+            continue
+        if doc['content_hash'] == known_hashes.get(doc['filename']):
+            yield doc, None
+        else:
+            yield doc, chunker.chunk_document(doc)
+
+
+def read_documents(file_paths: List[str], field_map: Optional[Dict[str, List[str]]] = None,
+                   chunker: Optional[ClinicalChunker] = None) -> Iterator[Dict[str, Any]]:
+    """Stream the documents of the given record files without chunking them."""
+    field_map = field_map or DEFAULT_FIELD_MAP
+    chunker = chunker or ClinicalChunker()
+    names = DocumentNames()
+    for path in file_paths:
+        for record in iter_records(path):
+            doc = record_to_document(record, path, chunker, field_map)
+            if doc is not None and names.claim(doc):
+                yield doc
+
+
+def _init_worker(field_map: Dict[str, List[str]], known_hashes: Dict[str, str], cprofile: bool = False) -> None:
+    """Build the chunker and receive the manifest hashes once per worker process."""
+    global _worker_state
+    _worker_state = {
+        'chunker': ClinicalChunker(profiler=StageProfiler(cprofile=cprofile)),
+        'field_map': field_map,
+        'known_hashes': known_hashes
+    }
+
+
+def _read_task(task: Tuple[str, int, Optional[int], Optional[List[bytes]]]) -> Tuple[List[Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]], Dict[str, Any]]:
+    """Worker entry point: read, map and chunk one shard of a record file, with stage timings."""
+    path, start, end, lines = task
+    chunker = _worker_state['chunker']
+    if lines is None:
+        records = iter_records(path, start, end)
+    else:
+        records = (record for record in (_parse_line(line, path) for line in lines) if record is not None)
+    results = list(_load_records(chunker, records, path, _worker_state['field_map'], _worker_state['known_hashes']))
+    return results, chunker.profiler.drain()
+
+
+def iter_record_documents(file_paths: List[str], known_hashes: Dict[str, str],
+                          field_map: Optional[Dict[str, List[str]]] = None,
+                          num_workers: int = 1, chunker: Optional[ClinicalChunker] = None,
+                          profiler: Optional[StageProfiler] = None,
+                          shard_bytes: int = SHARD_BYTES) -> Iterator[Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]]:
+    """
+    Stream (document, chunks) for every record of the given files, in file order.
+
+    Chunks are None for records whose content hash equals known_hashes. With
+    num_workers > 1, file shards are read and chunked across a process pool; at
+    most two shards per worker are in flight, so memory stays bounded however
+    large the input is.
+
+    Args:
+        file_paths: JSONL files (optionally gzipped)
+        known_hashes: document name -> content hash already indexed
+        field_map: Record keys for each document field (DEFAULT_FIELD_MAP if omitted)
+        num_workers: Number of reader processes
+        chunker: Chunker to use in-process when num_workers is 1
+        profiler: Receives the workers' stage timings when num_workers > 1
+        shard_bytes: Byte range per reader task for uncompressed files
+    """
+    field_map = field_map or DEFAULT_FIELD_MAP
+    # Records repeating a document name are skipped (exact repeats) or renamed
+    names = DocumentNames()
+
+    if num_workers <= 1:
+        chunker = chunker or ClinicalChunker()
+        for path in file_paths:
+            yield from _load_records(chunker, iter_records(path), path, field_map, known_hashes, names)
+        return
+
+    print(f"🧵 Reading record files with {num_workers} worker processes")
+    ctx = mp.get_context('spawn')
+    cprofile = bool(profiler and profiler.cprofile)
+    max_in_flight = 2 * num_workers
+    with ctx.Pool(processes=num_workers, initializer=_init_worker,
+                  initargs=(field_map, known_hashes, cprofile)) as pool:
+        in_flight = deque()
+
+        def next_results():
+            results, timings = in_flight.popleft().get()
+            if profiler:
+                profiler.merge(timings)
+            # Workers see one shard each, so repeated names are resolved here in record order
+            return _claim_names(results, names, known_hashes, chunker)
+
+        for path in file_paths:
+            for task in split_tasks(path, shard_bytes=shard_bytes):
+                in_flight.append(pool.apply_async(_read_task, (task,)))
+                # Oldest shard first keeps record order; waiting on it throttles the readers
+                if len(in_flight) >= max_in_flight:
+                    yield from next_results()
+        while in_flight:
+            yield from next_results()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Exact Corpus Statistics for GBM Clinical Vector Database
+Keeps facet counts (document type, source, drug, clinical topic, indicator flags
+and toxicity grades) for every stored chunk, updated as chunks are added or deleted
+Author: Chetanya Pandey
+"""
+
+import os
+import json
+from collections import Counter
+from typing import List, Dict, Any, Iterable
+from clinical_extractor import BOOLEAN_FIELDS
+
+STATS_FILENAME = "corpus_stats.json"
+STATS_VERSION = 1
+
+# Flag prefix -> facet name exposed by facets()
+FLAG_FACETS = {
+    'evidence_': 'evidence',
+    'treatment_phase_': 'treatment_phases',
+    'population_': 'patient_populations'
+}
+
+
+def chunk_facets(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a chunk's stored metadata to the values counted by the statistics."""
+    drugs = [drug.strip() for drug in str(metadata.get('drugs') or 'both').split(',') if drug.strip()]
+    grades = [grade.strip() for grade in str(metadata.get('toxicity_grades') or '').split(',') if grade.strip()]
+    return {
+        'doc_type': metadata.get('doc_type', 'Unknown'),
+        'source': metadata.get('source', 'Unknown'),
+        'drugs': drugs,
+        'clinical_topic': metadata.get('clinical_topic', 'General Clinical'),
+        # Accept the legacy 'True' strings as well as real booleans
+        'flags': [field for field in BOOLEAN_FIELDS if metadata.get(field) in (True, 'True')],
+        'toxicity_grades': grades
+    }
+
+
+class CorpusStats:
+    def __init__(self, db_dir: str):
+        """
+        Initialize the corpus statistics sidecar.
+
+        Args:
+            db_dir: Directory of the ChromaDB database the statistics describe
+        """
+        self.path = os.path.join(db_dir, STATS_FILENAME)
+
+        # chunk_id -> chunk_facets() record, so deletions can be subtracted exactly
+        self.chunks: Dict[str, Dict[str, Any]] = {}
+        self.counters: Dict[str, Counter] = {}
+        self.load()
+
+    def _reset_counters(self) -> None:
+        self.counters = {
+            'doc_types': Counter(),
+            'sources': Counter(),
+            'drugs': Counter(),
+            'clinical_topics': Counter(),
+            'flags': Counter(),
+            'toxicity_grades': Counter()
+        }
+
+    def _apply(self, facets: Dict[str, Any], sign: int) -> None:
+        self.counters['doc_types'][facets['doc_type']] += sign
+        self.counters['sources'][facets['source']] += sign
+        self.counters['clinical_topics'][facets['clinical_topic']] += sign
+        for drug in facets['drugs']:
+            self.counters['drugs'][drug] += sign
+        for flag in facets['flags']:
+            self.counters['flags'][flag] += sign
+        for grade in facets['toxicity_grades']:
+            self.counters['toxicity_grades'][grade] += sign
+
+    def add(self, chunk_id: str, metadata: Dict[str, Any]) -> None:
+        """Count a stored chunk, replacing its previous version if it was re-indexed."""
+        self.remove(chunk_id)
+        facets = chunk_facets(metadata)
+        self.chunks[chunk_id] = facets
+        self._apply(facets, 1)
+
+    def remove(self, chunk_id: str) -> None:
+        """Stop counting a deleted chunk (no-op if unknown)."""
+        facets = self.chunks.pop(chunk_id, None)
+        if facets is not None:
+            self._apply(facets, -1)
+
+    def remove_many(self, chunk_ids: Iterable[str]) -> None:
+        """Stop counting several deleted chunks."""
+        for chunk_id in chunk_ids:
+            self.remove(chunk_id)
+
+    def clear(self) -> None:
+        """Forget all chunks (used for full rebuilds)."""
+        self.chunks = {}
+        self._reset_counters()
+
+    @property
+    def total_chunks(self) -> int:
+        return len(self.chunks)
+
+    def facets(self) -> Dict[str, Dict[str, int]]:
+        """Return exact counts per facet value (zero counts dropped)."""
+        result = {name: {value: count for value, count in sorted(counter.items()) if count > 0}
+                  for name, counter in self.counters.items() if name != 'flags'}
+
+        for facet in FLAG_FACETS.values():
+            result[facet] = {}
+        for flag, count in sorted(self.counters['flags'].items()):
+            if count <= 0:
+                continue
+            for prefix, facet in FLAG_FACETS.items():
+                if flag.startswith(prefix):
+                    result[facet][flag[len(prefix):]] = count
+        return result
+
+    def rebuild(self, collection, page_size: int = 1000) -> None:
+        """Recount every chunk in a collection (used when the sidecar is missing or out of date)."""
+        self.clear()
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(offset=offset, limit=page_size, include=['metadatas'])
+            for chunk_id, metadata in zip(page['ids'], page['metadatas']):
+                self.add(chunk_id, metadata or {})
+
+    def ensure_consistent(self, collection) -> bool:
+        """Rebuild from the collection if the chunk count disagrees; returns True if rebuilt."""
+        if self.total_chunks == collection.count():
+            return False
+        print(f"⚠️ Corpus statistics out of date ({self.total_chunks} vs {collection.count()} chunks), recounting")
+        self.rebuild(collection)
+        return True
+
+    def load(self) -> None:
+        """Load the sidecar from disk, starting empty if missing or unreadable."""
+        self.clear()
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != STATS_VERSION:
+                print(f"⚠️ Ignoring corpus statistics with unsupported version: {data.get('version')}")
+                return
+            for chunk_id, facets in data.get('chunks', {}).items():
+                self.chunks[chunk_id] = facets
+                self._apply(facets, 1)
+        except Exception as e:
+            print(f"⚠️ Could not read corpus statistics {self.path}: {e}")
+            self.clear()
+
+    def save(self) -> None:
+        """Atomically write the sidecar to disk."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': STATS_VERSION,
+                'total_chunks': self.total_chunks,
+                'facets': self.facets(),
+                'chunks': self.chunks
+            }, f)
+        os.replace(tmp_path, self.path)
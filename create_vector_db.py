@@ -10,22 +10,75 @@ import glob
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import json
-from typing import List, Dict, Any
+import argparse
+from collections import deque
+from typing import List, Dict, Any, Iterable, Iterator
 from datetime import datetime
+from index_manifest import IndexManifest, IngestCheckpoint, index_embedding_model
+from embedding_cache import EmbeddingCache
+from parallel_encoder import ParallelEncoder
+from length_batching import PaddingStats, track_padding
+from clinical_extractor import METADATA_SCHEMA_VERSION, typed_metadata
+from clinical_chunker import ClinicalChunker, iter_load_and_chunk
+from near_duplicates import NearDuplicateIndex, DUPLICATES_FILENAME
+from ingest_profiler import StageProfiler, write_report
+from corpus_stats import CorpusStats
+from lexical_index import BM25Index
+from rerank_features import RerankFeatures
+from index_versions import IndexVersions
+from sharded_collection import ShardedCollection, is_sharded
+from corpus_readers import RECORD_FILE_PATTERNS, DEFAULT_FIELD_MAP, parse_field_map, iter_record_documents, read_documents
+
+# Queries a freshly built index must answer before it is published
+VALIDATION_QUERIES = [
+    "temozolomide dosing for glioblastoma",
+    "bevacizumab recurrent GBM dose",
+    "FDA approval trial results",
+    "maintenance treatment protocol",
+    "side effects monitoring"
+]
 
 class GBMVectorDB:
-    def __init__(self, data_dir: str = "us_clinical_data", db_dir: str = "vector_db"):
+    def __init__(self, data_dir: str = "us_clinical_data", db_dir: str = "vector_db",
+                 cache_dir: str = "embedding_cache", use_embedding_cache: bool = True,
+                 batch_size: int = 50, encode_workers: int = 1, encode_batch_size: int = 32,
+                 encode_window: int = 8, chunk_workers: int = 1, collapse_duplicates: bool = True, cprofile: bool = False,
+                 sharded: bool = False, field_map: Dict[str, List[str]] = None, commit_every: int = 20):
         """
         Initialize the GBM Vector Database.
         
         Args:
-            data_dir: Directory containing clinical markdown files
+            data_dir: Directory containing clinical markdown files (optionally gzipped) and JSONL record exports
             db_dir: Directory to store the ChromaDB database
+            cache_dir: Directory of the persistent embedding cache (shared across databases)
+            use_embedding_cache: Reuse cached chunk embeddings instead of re-encoding
+            batch_size: Number of chunks written to ChromaDB at a time
+            encode_workers: Number of embedding worker processes (1 encodes in-process)
+            encode_batch_size: Texts per forward pass after length bucketing
+            encode_window: Store batches encoded together, so length sorting has enough texts to group
+            chunk_workers: Number of processes for loading, chunking and metadata extraction
+            collapse_duplicates: Index one canonical copy of near-identical chunks across documents
+            cprofile: Collect a cProfile per ingestion stage for dump_cprofiles
+            sharded: Store chunks in one collection per drug group and document type family
+            field_map: Record keys for each document field of JSONL inputs (DEFAULT_FIELD_MAP if omitted)
+            commit_every: Stored batches between full commits of the manifest and sidecars
         """
         self.data_dir = data_dir
         self.db_dir = db_dir
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+        self.encode_window = max(1, encode_window)
+        self.chunk_workers = chunk_workers
+        self.commit_every = max(1, commit_every)
+        self.field_map = field_map or DEFAULT_FIELD_MAP
+        self.encode_workers = encode_workers
+        self.padding_stats = PaddingStats()
+        self.texts_encoded = 0
+        
+        # Wall/CPU time per ingestion stage for the profiling report
+        self.profiler = StageProfiler(cprofile=cprofile)
         
         # Initialize ChromaDB
         os.makedirs(db_dir, exist_ok=True)
@@ -78,11 +131,18 @@ class GBMVectorDB:
             'all-MiniLM-L6-v2'  # Fallback general model
         ]
         
+        # Keep embedding with the model the index was built with, so its vectors stay comparable
+        index_model = index_embedding_model(db_dir)
+        if index_model:
+            medical_models = [index_model] + [name for name in medical_models if name != index_model]
+        
         self.embedding_model = None
+        self.embedding_model_name = None
         for model_name in medical_models:
             try:
                 print(f"Attempting to load: {model_name}")
                 self.embedding_model = SentenceTransformer(model_name)
+                self.embedding_model_name = model_name
                 print(f"✅ Successfully loaded medical model: {model_name}")
                 break
             except Exception as e:
@@ -92,28 +152,93 @@ class GBMVectorDB:
         if self.embedding_model is None:
             raise Exception("Failed to load any embedding model")
         
-        # Initialize text splitter for clinical content
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=400,  # Smaller chunks for focused clinical concepts
-            chunk_overlap=100,  # Reduced overlap
-            separators=[
-                "\n## ",      # Major sections (dosing, toxicity, etc.)
-                "\n### ",     # Subsections (specific protocols)
-                "\n#### ",    # Clinical details
-                "\n**",       # Bold clinical concepts
-                "\n- **",     # Bullet points with bold headers
-                "\n---",      # Section dividers
-                "\n\n",       # Paragraph breaks
-                "\n",         # Line breaks
-                ". ",         # Sentences
-                "! ",         # Exclamations
-                "? ",         # Questions
-                "; ",         # Semicolons
-                ", ",         # Commas
-                " ",          # Spaces
-                ""            # Characters
-            ]
-        )
+        # Real tokens versus padding of every in-process forward pass, from its attention mask
+        track_padding(self.embedding_model, self.padding_stats)
+        
+        # Optional pool of worker processes for CPU-bound encoding
+        self.parallel_encoder = None
+        if encode_workers > 1:
+            self.parallel_encoder = ParallelEncoder(
+                self.embedding_model_name,
+                num_workers=encode_workers,
+                worker_batch_size=encode_batch_size
+            )
+        
+        # Persistent embedding cache keyed by model name and chunk text
+        self.embedding_cache = None
+        if use_embedding_cache:
+            self.embedding_cache = EmbeddingCache(
+                cache_dir,
+                self.embedding_model_name,
+                self.embedding_model.get_sentence_embedding_dimension()
+            )
+        
+        # Document loading, classification and chunking
+        self.chunker = ClinicalChunker(profiler=self.profiler)
+        
+        # Content-hash manifest for incremental re-indexing
+        self.manifest = IndexManifest(db_dir, schema_version=METADATA_SCHEMA_VERSION)
+        
+        # Vectors of different models cannot share a collection, so a model change re-indexes from empty.
+        # The manifest records the model with the index; queries embed with exactly that one.
+        if self.manifest.embedding_model and self.manifest.embedding_model != self.embedding_model_name:
+            if is_sharded(db_dir):
+                ShardedCollection(self.chroma_client, db_dir).drop()
+            self.chroma_client.delete_collection(collection_name)
+            self.collection = self.chroma_client.get_or_create_collection(collection_name, metadata={
+                "description": "Temozolomide and Bevacizumab clinical data with medical domain embeddings",
+                "embedding_model": "medical_domain",
+                "created_at": datetime.now().isoformat()
+            })
+            self.manifest.invalidate(f"embedding model changed from {self.manifest.embedding_model} "
+                                     f"to {self.embedding_model_name}")
+        self.manifest.embedding_model = self.embedding_model_name
+        
+        # Optional layout with one collection per drug group and document type family.
+        # Switching layouts moves every chunk, so re-index everything.
+        self.sharded = sharded
+        if sharded:
+            if not is_sharded(db_dir) and self.collection.count():
+                self.chroma_client.delete_collection(collection_name)
+                self.chroma_client.get_or_create_collection(collection_name)
+                self.manifest.invalidate("collection layout changed to sharded")
+            self.collection = ShardedCollection(self.chroma_client, db_dir, metadata={
+                "description": "Temozolomide and Bevacizumab clinical data shard with medical domain embeddings",
+                "embedding_model": "medical_domain"
+            })
+        elif is_sharded(db_dir):
+            ShardedCollection(self.chroma_client, db_dir).drop()
+            self.manifest.invalidate("collection layout changed to single collection")
+        
+        # Progress of the current ingestion run, advanced with every full commit
+        self.checkpoint = IngestCheckpoint(db_dir)
+        
+        # Exact facet counts over every stored chunk, kept in step with upserts and deletes
+        self.corpus_stats = CorpusStats(db_dir)
+        if self.corpus_stats.ensure_consistent(self.collection):
+            self.corpus_stats.save()
+        
+        # BM25 inverted index over the same chunks, for hybrid lexical + dense retrieval
+        self.lexical_index = BM25Index(db_dir)
+        if self.lexical_index.ensure_consistent(self.collection):
+            self.lexical_index.save()
+        
+        # Per-chunk metadata re-ranking features, so queries score boosts without rescanning metadata
+        self.rerank_features = RerankFeatures(db_dir)
+        if self.rerank_features.ensure_consistent(self.collection):
+            self.rerank_features.save()
+        
+        # MinHash index of near-identical chunks; collapsed copies are never stored.
+        # Switching collapsing on or off changes which chunks exist, so re-index everything.
+        self.near_duplicates = None
+        duplicates_path = os.path.join(db_dir, DUPLICATES_FILENAME)
+        if collapse_duplicates:
+            self.near_duplicates = NearDuplicateIndex(db_dir)
+            if not self.near_duplicates.restored and self.manifest.known_files():
+                self.manifest.invalidate("near-duplicate index missing")
+        elif os.path.exists(duplicates_path):
+            self.manifest.invalidate("near-duplicate collapsing disabled")
+            os.remove(duplicates_path)
         
         print(f"✅ GBM Vector DB initialized")
         print(f"📁 Data directory: {data_dir}")
@@ -121,465 +246,576 @@ class GBMVectorDB:
     
     def load_documents(self) -> List[Dict[str, Any]]:
         """Load all markdown documents from the data directory."""
-        documents = []
-        
-        # Get all markdown files
-        md_files = glob.glob(os.path.join(self.data_dir, "*.md"))
-        
-        print(f"📄 Found {len(md_files)} markdown files")
-        
-        for file_path in md_files:
+        return list(self.iter_documents())
+    
+    def iter_documents(self) -> Iterator[Dict[str, Any]]:
+        """Lazily load markdown documents, then JSONL records, one at a time from the data directory."""
+        for file_path in self._list_files():
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Extract metadata from filename
-                filename = os.path.basename(file_path)
-                doc_type = self._classify_document(filename)
-                
-                documents.append({
-                    'filename': filename,
-                    'filepath': file_path,
-                    'content': content,
-                    'doc_type': doc_type,
-                    'drug': self._extract_drug_info(filename, content),
-                    'source': self._extract_source_info(filename)
-                })
-                
-                print(f"📋 Loaded: {filename} ({doc_type})")
-                
+                document = self.chunker.load_document(file_path)
+                print(f"📋 Loaded: {document['filename']} ({document['doc_type']})")
             except Exception as e:
                 print(f"❌ Error loading {file_path}: {e}")
+                continue
+            
+            yield document
         
-        return documents
-    
-    def _classify_document(self, filename: str) -> str:
-        """Classify document type based on filename."""
-        filename_lower = filename.lower()
-        
-        if 'fda' in filename_lower and 'complete' in filename_lower:
-            return 'FDA_Complete_Prescribing_Information'
-        elif 'fda' in filename_lower and 'approval' in filename_lower:
-            return 'FDA_Approval_Trials'
-        elif 'fda' in filename_lower:
-            return 'FDA_Document'
-        elif 'nccn' in filename_lower:
-            return 'NCCN_Guidelines'
-        elif 'stupp' in filename_lower:
-            return 'Pivotal_Clinical_Trial'
-        elif 'hospital' in filename_lower or 'protocols' in filename_lower:
-            return 'Hospital_Protocol'
-        elif 'dailymed' in filename_lower:
-            return 'DailyMed_Prescribing_Info'
-        elif 'trial' in filename_lower or 'clinical' in filename_lower:
-            return 'Clinical_Research'
-        elif 'dosing' in filename_lower:
-            return 'Dosing_Protocol'
-        elif 'source' in filename_lower:
-            return 'Source_Reference'
-        else:
-            return 'Clinical_Document'
-    
-    def _extract_drug_info(self, filename: str, content: str) -> List[str]:
-        """Extract drug information from filename and content."""
-        drugs = []
-        
-        # Check filename
-        filename_lower = filename.lower()
-        if 'temodar' in filename_lower or 'temozolomide' in filename_lower:
-            drugs.append('temozolomide')
-        if 'avastin' in filename_lower or 'bevacizumab' in filename_lower:
-            drugs.append('bevacizumab')
-        
-        # Check content
-        content_lower = content.lower()
-        if 'temozolomide' in content_lower or 'temodar' in content_lower:
-            if 'temozolomide' not in drugs:
-                drugs.append('temozolomide')
-        if 'bevacizumab' in content_lower or 'avastin' in content_lower:
-            if 'bevacizumab' not in drugs:
-                drugs.append('bevacizumab')
-        
-        return drugs if drugs else ['both']
-    
-    def _extract_source_info(self, filename: str) -> str:
-        """Extract source information from filename."""
-        filename_lower = filename.lower()
-        
-        if 'fda' in filename_lower:
-            return 'FDA'
-        elif 'nccn' in filename_lower:
-            return 'NCCN'
-        elif 'nejm' in filename_lower:
-            return 'NEJM'
-        elif 'dailymed' in filename_lower:
-            return 'DailyMed'
-        elif 'hospital' in filename_lower:
-            return 'Hospital'
-        else:
-            return 'Clinical_Literature'
+        yield from read_documents(self._list_record_files(), field_map=self.field_map, chunker=self.chunker)
     
-    def chunk_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Split documents into focused clinical chunks."""
-        chunks = []
+    def _list_files(self) -> List[str]:
+        """List markdown files in the data directory in a stable order."""
+        # Get all markdown files, plain or gzipped
+        md_files = sorted(glob.glob(os.path.join(self.data_dir, "*.md")) +
+                          glob.glob(os.path.join(self.data_dir, "*.md.gz")))
         
-        for doc in documents:
-            # First try clinical-focused chunking
-            clinical_chunks = self._create_clinical_chunks(doc)
-            
-            if clinical_chunks:
-                chunks.extend(clinical_chunks)
-            else:
-                # Fallback to standard chunking
-                text_chunks = self.text_splitter.split_text(doc['content'])
-                for i, chunk in enumerate(text_chunks):
-                    chunks.append({
-                        'chunk_id': f"{doc['filename']}_chunk_{i}",
-                        'content': chunk,
-                        'filename': doc['filename'],
-                        'doc_type': doc['doc_type'],
-                        'drug': doc['drug'],
-                        'source': doc['source'],
-                        'chunk_index': i,
-                        'total_chunks': len(text_chunks),
-                        'clinical_topic': self._extract_clinical_topic(chunk)
-                    })
+        print(f"📄 Found {len(md_files)} markdown files")
+        return md_files
+    
+    def _list_record_files(self) -> List[str]:
+        """List JSONL record exports (optionally gzipped) in the data directory in a stable order."""
+        record_files = sorted(path for pattern in RECORD_FILE_PATTERNS
+                              for path in glob.glob(os.path.join(self.data_dir, pattern)))
+        
+        if record_files:
+            print(f"📄 Found {len(record_files)} record files")
+        return record_files
+    
+    def iter_loaded(self, known_hashes: Dict[str, str]) -> Iterator[tuple]:
+        """Stream (document, chunks) for markdown files then JSONL records; chunks is None when unchanged."""
+        yield from iter_load_and_chunk(self._list_files(), known_hashes,
+                                       num_workers=self.chunk_workers, chunker=self.chunker,
+                                       profiler=self.profiler)
+        yield from iter_record_documents(self._list_record_files(), known_hashes, field_map=self.field_map,
+                                         num_workers=self.chunk_workers, chunker=self.chunker,
+                                         profiler=self.profiler)
+    
+    def chunk_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Split documents into focused clinical chunks, collapsing near-duplicates when enabled."""
+        chunks = list(self.iter_chunks(documents))
         
         print(f"📄 Created {len(chunks)} focused clinical chunks from {len(documents)} documents")
+        if self.near_duplicates is not None:
+            chunks = self.collapse_near_duplicates(chunks)
         return chunks
     
-    def _create_clinical_chunks(self, doc: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Create chunks focused on clinical concepts."""
-        content = doc['content']
-        chunks = []
-        
-        # Define clinical section patterns
-        clinical_patterns = [
-            # Dosing sections
-            (r'#{1,4}\s*.*[Dd]os[ei]ng.*', 'Dosing Protocol'),
-            (r'#{1,4}\s*.*[Aa]dministration.*', 'Administration'),
-            (r'#{1,4}\s*.*[Mm]aintenance.*', 'Maintenance Protocol'),
-            (r'#{1,4}\s*.*[Cc]oncomitant.*', 'Concomitant Protocol'),
-            
-            # Safety sections
-            (r'#{1,4}\s*.*[Tt]oxicity.*', 'Toxicity Profile'),
-            (r'#{1,4}\s*.*[Ss]ide [Ee]ffects.*', 'Side Effects'),
-            (r'#{1,4}\s*.*[Aa]dverse.*', 'Adverse Events'),
-            (r'#{1,4}\s*.*[Mm]ortality.*', 'Mortality Data'),
-            (r'#{1,4}\s*.*[Ss]afety.*', 'Safety Monitoring'),
-            (r'#{1,4}\s*.*[Mm]onitoring.*', 'Clinical Monitoring'),
-            
-            # Modification sections
-            (r'#{1,4}\s*.*[Dd]ose [Mm]odification.*', 'Dose Modifications'),
-            (r'#{1,4}\s*.*[Rr]eduction.*', 'Dose Reduction'),
-            
-            # Specific conditions
-            (r'#{1,4}\s*.*[Hh]ematologic.*', 'Hematologic Effects'),
-            (r'#{1,4}\s*.*[Cc]ardiovascular.*', 'Cardiovascular Effects'),
-            (r'#{1,4}\s*.*[Nn]eurologic.*', 'Neurologic Effects'),
-            (r'#{1,4}\s*.*[Gg]astrointestinal.*', 'GI Effects'),
-            
-            # Clinical management
-            (r'#{1,4}\s*.*[Pp]rotocol.*', 'Clinical Protocol'),
-            (r'#{1,4}\s*.*[Gg]uidelines.*', 'Clinical Guidelines'),
-            (r'#{1,4}\s*.*[Mm]anagement.*', 'Clinical Management'),
-            
-            # Drug-specific sections
-            (r'#{1,4}\s*.*[Tt]emozolomide.*', 'Temozolomide Info'),
-            (r'#{1,4}\s*.*[Bb]evacizumab.*', 'Bevacizumab Info'),
-            (r'#{1,4}\s*.*[Aa]vastin.*', 'Avastin Info'),
-        ]
-        
-        # Use improved text splitter
-        text_chunks = self.text_splitter.split_text(content)
-        
-        for i, chunk in enumerate(text_chunks):
-            # Determine clinical topic
-            clinical_topic = self._extract_clinical_topic(chunk)
-            
-            # Extract detailed metadata
-            detailed_metadata = self._extract_detailed_metadata(chunk)
-            
-            chunk_data = {
-                'chunk_id': f"{doc['filename']}_clinical_{i}",
-                'content': chunk,
-                'filename': doc['filename'],
-                'doc_type': doc['doc_type'],
-                'drug': doc['drug'],
-                'source': doc['source'],
-                'chunk_index': i,
-                'total_chunks': len(text_chunks),
-                'clinical_topic': clinical_topic
-            }
-            
-            # Add detailed metadata
-            chunk_data.update(detailed_metadata)
-            chunks.append(chunk_data)
-        
-        return chunks
+    def collapse_near_duplicates(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep the first copy of each near-duplicate cluster, listing the others as alternate sources."""
+        index = NearDuplicateIndex()
+        canonical = [chunk for chunk in chunks if index.assign(chunk) is None]
+        
+        report = index.stats()
+        print(f"🧬 Near-duplicates: collapsed {report['chunks_collapsed']} of {report['chunks_total']} chunks "
+              f"(index {report['shrink_ratio']:.1%} smaller)")
+        return [{**chunk, 'alternate_sources': index.alternate_sources(chunk['chunk_id'])} for chunk in canonical]
     
-    def _extract_clinical_topic(self, chunk: str) -> str:
-        """Extract the main clinical topic from a chunk."""
-        chunk_lower = chunk.lower()
-        
-        # Dosing-related topics
-        if any(word in chunk_lower for word in ['dosing', 'dose', 'mg/m²', 'mg/kg']):
-            if 'maintenance' in chunk_lower:
-                return 'Maintenance Dosing'
-            elif 'concomitant' in chunk_lower or 'concurrent' in chunk_lower:
-                return 'Concomitant Dosing'
-            elif 'modification' in chunk_lower or 'reduction' in chunk_lower:
-                return 'Dose Modifications'
-            else:
-                return 'Dosing Protocol'
-        
-        # Toxicity-related topics
-        elif any(word in chunk_lower for word in ['toxicity', 'adverse', 'side effect', 'mortality', 'death']):
-            if 'hematologic' in chunk_lower or 'neutropenia' in chunk_lower or 'thrombocytopenia' in chunk_lower:
-                return 'Hematologic Toxicity'
-            elif 'cardiovascular' in chunk_lower or 'hypertension' in chunk_lower:
-                return 'Cardiovascular Toxicity'
-            elif 'mortality' in chunk_lower or 'death' in chunk_lower:
-                return 'Treatment Mortality'
-            else:
-                return 'Toxicity Profile'
-        
-        # Monitoring topics
-        elif any(word in chunk_lower for word in ['monitoring', 'laboratory', 'cbc', 'blood pressure']):
-            return 'Clinical Monitoring'
-        
-        # Administration topics
-        elif any(word in chunk_lower for word in ['administration', 'infusion', 'oral', 'iv']):
-            return 'Drug Administration'
-        
-        # Clinical management
-        elif any(word in chunk_lower for word in ['protocol', 'guideline', 'management']):
-            return 'Clinical Protocol'
+    def iter_chunks(self, documents: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Lazily split a stream of documents into focused clinical chunks."""
+        for doc in documents:
+            yield from self.chunker.chunk_document(doc)
+    
+    def create_embeddings_and_store(self, chunks: Iterable[Dict[str, Any]]) -> int:
+        """Create medical domain embeddings and store in ChromaDB in bounded batches."""
+        print("🔄 Creating medical domain embeddings and storing in vector database...")
         
-        # Drug-specific
-        elif 'temozolomide' in chunk_lower or 'temodar' in chunk_lower:
-            return 'Temozolomide Specific'
-        elif 'bevacizumab' in chunk_lower or 'avastin' in chunk_lower:
-            return 'Bevacizumab Specific'
+        stored = 0
+        for window_number, window_chunks in enumerate(self._iter_batches(chunks), start=1):
+            print(f"🧠 Creating embeddings for window {window_number} ({len(window_chunks)} chunks)")
+            self._store_window(window_chunks)
+            stored += len(window_chunks)
+        
+        self.corpus_stats.save()
+        self.lexical_index.save()
+        self.rerank_features.save()
+        if self.embedding_cache:
+            self.embedding_cache.flush()
+            cache_stats = self.embedding_cache.stats()
+            print(f"🗃️ Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                  f"({cache_stats['entries']} vectors cached)")
+        
+        print(f"✅ Stored {stored} chunks with medical domain embeddings")
+        print(f"🧠 Embedding model: {type(self.embedding_model).__name__}")
+        print(f"📏 Embedding dimension: {self.embedding_model.get_sentence_embedding_dimension()}")
+        print(f"🗄️ Database location: {self.db_dir}")
+        return stored
+    
+    def _iter_batches(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """Group a chunk stream into encode windows of at most encode_window store batches."""
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= self.batch_size * self.encode_window:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def _store_window(self, chunks: List[Dict[str, Any]]) -> int:
+        """
+        Encode a window of chunks in one call, then upsert it batch_size chunks at a time.
         
-        # Default
-        else:
-            return 'General Clinical'
-    
-    def _extract_detailed_metadata(self, chunk: str) -> Dict[str, Any]:
-        """Extract detailed structured metadata from clinical chunk."""
-        chunk_lower = chunk.lower()
-        metadata = {}
-        
-        # Extract section information
-        lines = chunk.split('\n')
-        section = None
-        subsection = None
-        
-        for line in lines[:5]:  # Check first 5 lines
-            line_clean = line.strip()
-            if line_clean.startswith('### '):
-                subsection = line_clean.replace('###', '').strip()
-            elif line_clean.startswith('## '):
-                section = line_clean.replace('##', '').strip()
-            elif line_clean.startswith('# ') and not line_clean.startswith('##'):
-                section = line_clean.replace('#', '').strip()
-            elif line_clean.startswith('**') and line_clean.endswith('**') and len(line_clean) < 80:
-                if not subsection:
-                    subsection = line_clean.replace('**', '').strip()
-        
-        metadata['section'] = section or 'Unknown'
-        metadata['subsection'] = subsection or 'General'
-        
-        # Extract dosing information
-        dosing_patterns = {
-            'mg_per_m2': r'(\d+(?:\.\d+)?)\s*mg/m[²2]',
-            'mg_per_kg': r'(\d+(?:\.\d+)?)\s*mg/kg',
-            'cycle_length': r'(\d+)[-\s]*day',
-            'frequency': r'every\s*(\d+)\s*weeks?|q(\d+)w'
-        }
+        One encode call over several store batches lets its length sort group similar
+        texts across them; a single store batch is too small for the sort to matter.
         
-        for key, pattern in dosing_patterns.items():
-            import re
-            matches = re.findall(pattern, chunk_lower)
-            if matches:
-                if key == 'frequency':
-                    # Handle both "every X weeks" and "qXw" patterns
-                    metadata[key] = [m[0] or m[1] for m in matches if any(m)]
-                else:
-                    metadata[key] = matches
-        
-        # Extract clinical grade information
-        grade_matches = re.findall(r'grade\s*(\d+)', chunk_lower)
-        if grade_matches:
-            metadata['toxicity_grades'] = list(set(grade_matches))
-        
-        # Extract laboratory values
-        lab_patterns = {
-            'anc_values': r'anc[:\s]*(?:≥|>=|>|<|≤|<=)\s*([0-9.,]+)',
-            'platelet_values': r'platelet[s]?[:\s]*(?:≥|>=|>|<|≤|<=)\s*([0-9.,]+)',
-            'hemoglobin_values': r'h[gb|emoglobin][:\s]*(?:≥|>=|>|<|≤|<=)\s*([0-9.,]+)'
-        }
+        Returns:
+            The number of store batches written
+        """
+        return self._store_encoded(chunks, self._wait_encoded(self._submit_window(chunks)))
+    
+    def _submit_window(self, chunks: List[Dict[str, Any]]):
+        """Start encoding a window of chunks; returns a callable that waits for their vectors."""
+        with self.profiler.stage('encode', items=len(chunks)):
+            return self._submit_texts([chunk['content'] for chunk in chunks])
+    
+    def _wait_encoded(self, encoded):
+        # Time blocked on the worker pool counts as encoding
+        with self.profiler.stage('encode'):
+            return encoded()
+    
+    def _store_encoded(self, chunks: List[Dict[str, Any]], embeddings) -> int:
+        """Upsert encoded chunks batch_size at a time; returns the number of store batches written."""
+        batches = 0
+        for start in range(0, len(chunks), self.batch_size):
+            self._store_batch(chunks[start:start + self.batch_size], embeddings[start:start + self.batch_size])
+            batches += 1
+        return batches
+    
+    def _store_batch(self, batch_chunks: List[Dict[str, Any]], batch_embeddings) -> None:
+        """Upsert one batch of encoded chunks into ChromaDB."""
+        # Upsert so re-indexed chunk IDs replace their previous versions
+        with self.profiler.stage('store', items=len(batch_chunks)):
+            metadatas = [self._build_chunk_metadata(chunk) for chunk in batch_chunks]
+            ids = [chunk['chunk_id'] for chunk in batch_chunks]
+            self.collection.upsert(
+                documents=[chunk['content'] for chunk in batch_chunks],
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=batch_embeddings.tolist()
+            )
+            for chunk_id, metadata, chunk in zip(ids, metadatas, batch_chunks):
+                self.corpus_stats.add(chunk_id, metadata)
+                self.lexical_index.add(chunk_id, chunk['content'])
+                self.rerank_features.add(chunk_id, metadata)
+    
+    def _encode_texts(self, texts: List[str]):
+        """Encode texts, serving unchanged chunks from the embedding cache."""
+        return self._submit_texts(texts)()
+    
+    def _submit_texts(self, texts: List[str]):
+        """
+        Start encoding texts, serving unchanged chunks from the embedding cache.
         
-        for key, pattern in lab_patterns.items():
-            matches = re.findall(pattern, chunk_lower)
-            if matches:
-                metadata[key] = matches
-        
-        # Extract patient population
-        population_indicators = {
-            'newly_diagnosed': ['newly diagnosed', 'initial', 'upfront', 'first-line'],
-            'recurrent': ['recurrent', 'progressive', 'relapsed', 'refractory', 'salvage'],
-            'elderly': ['elderly', '≥70', '>70', '≥65', '>65', 'geriatric'],
-            'poor_performance': ['kps', 'performance status', 'ecog']
+        Returns a callable that waits for the vectors; on the worker pool the
+        texts keep encoding in the background until it is called.
+        """
+        if not self.embedding_cache:
+            return self._submit_uncached(texts)
+        
+        embeddings, missing = self.embedding_cache.get_many(texts)
+        if not missing:
+            return lambda: embeddings
+        
+        # Encode each distinct missing text once, even if repeated in the batch
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        encoded = self._submit_uncached(missing_texts)
+        
+        def finish():
+            new_embeddings = encoded()
+            positions = {text: j for j, text in enumerate(missing_texts)}
+            embeddings[missing] = new_embeddings[[positions[texts[i]] for i in missing]]
+            self.embedding_cache.put_many(missing_texts, new_embeddings)
+            return embeddings
+        return finish
+    
+    def _submit_uncached(self, texts: List[str]):
+        """Run the embedding model (which sorts its input by length), queued on the worker pool when configured."""
+        self.texts_encoded += len(texts)
+        if self.parallel_encoder:
+            return self.parallel_encoder.submit(texts, stats=self.padding_stats).result
+        embeddings = self.embedding_model.encode(
+            texts,
+            batch_size=self.encode_batch_size,
+            show_progress_bar=True,
+            convert_to_numpy=True
+        )
+        return lambda: embeddings
+    
+    def close(self) -> None:
+        """Release worker processes, flush caches and report encode efficiency."""
+        if self.padding_stats.texts:
+            padding = self.padding_stats.report()
+            print(f"📐 Padding: {padding['tokens_padded']} padded / {padding['tokens_used']} used tokens "
+                  f"({padding['padding_ratio']:.1%}) over {padding['batches']} forward passes")
+        if self.parallel_encoder:
+            report = self.parallel_encoder.throughput_report()
+            print(f"🧵 Parallel encode: {report['texts_encoded']} texts at {report['texts_per_second']} texts/s "
+                  f"across {report['num_workers']} workers ({report['utilization']:.0%} utilized)")
+            self.parallel_encoder.close()
+        if self.embedding_cache:
+            self.embedding_cache.flush()
+    
+    def _build_chunk_metadata(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the ChromaDB metadata record for a chunk."""
+        # Base metadata
+        metadata = {
+            'filename': chunk['filename'],
+            'doc_type': chunk['doc_type'],
+            'source': chunk['source'],
+            'chunk_index': chunk['chunk_index'],
+            'total_chunks': chunk['total_chunks'],
+            'drugs': ','.join(chunk['drug']),
+            'clinical_topic': chunk.get('clinical_topic', 'General Clinical'),
+            'embedding_model': self.embedding_model.get_sentence_embedding_dimension(),
+            'created_at': datetime.now().isoformat()
         }
         
-        for pop_type, indicators in population_indicators.items():
-            if any(indicator in chunk_lower for indicator in indicators):
-                metadata[f'population_{pop_type}'] = True
+        # Display copies of the extracted values (lists joined for ChromaDB storage)
+        detailed_fields = [
+            'section', 'subsection', 'mg_per_m2', 'mg_per_kg', 'cycle_length', 
+            'frequency', 'toxicity_grades', 'anc_values', 'platelet_values', 
+            'hemoglobin_values'
+        ]
         
-        # Extract treatment phase
-        treatment_phases = {
-            'concomitant': ['concomitant', 'concurrent', 'chemoradiation', 'during radiation'],
-            'maintenance': ['maintenance', 'adjuvant', 'post-radiation'],
-            'salvage': ['salvage', 'rescue', 'recurrent treatment']
-        }
+        for field in detailed_fields:
+            if field in chunk:
+                value = chunk[field]
+                if isinstance(value, list):
+                    metadata[field] = ','.join(map(str, value))
+                else:
+                    metadata[field] = str(value)
+            else:
+                metadata[field] = ''
         
-        for phase, indicators in treatment_phases.items():
-            if any(indicator in chunk_lower for indicator in indicators):
-                metadata[f'treatment_phase_{phase}'] = True
+        # Typed numeric ranges and boolean flags so filters run inside the vector store
+        metadata.update(typed_metadata(chunk))
         
-        # Extract evidence level
-        evidence_indicators = {
-            'fda_approved': ['fda approved', 'fda approval', 'approved by fda'],
-            'clinical_trial': ['phase ii', 'phase iii', 'clinical trial', 'randomized'],
-            'guideline': ['nccn', 'guideline', 'recommendation', 'standard of care'],
-            'real_world': ['real world', 'clinical practice', 'institutional']
-        }
-        
-        for evidence_type, indicators in evidence_indicators.items():
-            if any(indicator in chunk_lower for indicator in indicators):
-                metadata[f'evidence_{evidence_type}'] = True
+        # Other documents carrying a near-identical copy of this chunk
+        if 'alternate_sources' in chunk:
+            alternates = chunk['alternate_sources']
+        elif self.near_duplicates is not None:
+            alternates = self.near_duplicates.alternate_sources(chunk['chunk_id'])
+        else:
+            alternates = []
+        metadata['alternate_sources'] = '; '.join(alternates)
+        metadata['alternate_source_count'] = len(alternates)
         
         return metadata
     
-    def create_embeddings_and_store(self, chunks: List[Dict[str, Any]]) -> None:
-        """Create medical domain embeddings and store in ChromaDB."""
-        print("🔄 Creating medical domain embeddings and storing in vector database...")
-        
-        # Prepare data for ChromaDB
-        documents = []
-        metadatas = []
-        ids = []
-        embeddings = []
-        
-        print(f"📊 Processing {len(chunks)} chunks with medical embeddings...")
+    def update_index(self, full_rebuild: bool = False, resume: bool = False) -> Dict[str, int]:
+        """
+        Incrementally re-index the data directory using the content-hash manifest.
+        
+        Only files whose content changed are re-chunked, only chunks whose hash
+        changed are embedded and upserted, and chunk IDs that vanished are deleted.
+        Documents are streamed through load, chunk, embed and store so peak memory
+        stays bounded by the encode window rather than the corpus size. Near-duplicate
+        chunks are collapsed into the first copy seen and never stored themselves.
+        
+        Every commit_every stored batches (and at the end) the run is committed:
+        the manifest and sidecars are saved and the checkpoint is advanced. Between
+        commits only the embedding cache journal is flushed, so saving the full
+        sidecars does not grow with every batch. A crashed run loses at most the
+        batches since the last commit; their files are still unrecorded in the
+        manifest, so --resume re-processes them (upserts are idempotent) and the
+        vectors come back from the embedding cache.
         
-        # Process chunks in batches to avoid memory issues
-        batch_size = 50
-        for i in range(0, len(chunks), batch_size):
-            batch_chunks = chunks[i:i+batch_size]
-            batch_texts = [chunk['content'] for chunk in batch_chunks]
+        Args:
+            full_rebuild: Ignore the manifest and re-index every document
+            resume: Continue an interrupted run instead of starting a new one
+        """
+        if resume and self.checkpoint.interrupted():
+            # A resumed full rebuild already cleared the index; committed files are skipped by hash
+            state = self.checkpoint.state
+            print(f"⏩ Resuming interrupted {state.get('mode')} run started {state.get('started_at')}: "
+                  f"{state.get('batches_completed', 0)} batches, {len(state.get('files_completed', []))} files committed")
+            full_rebuild = False
+        else:
+            if resume:
+                print("⏩ No interrupted run to resume, starting a new one")
+            elif self.checkpoint.interrupted():
+                print("⚠️ Previous run was interrupted; use --resume to continue it")
+            self.checkpoint.start('full' if full_rebuild else 'incremental')
+        
+        if full_rebuild:
+            stale_ids = [chunk_id for filename in self.manifest.known_files()
+                         for chunk_id in self.manifest.remove_file(filename)]
+            if stale_ids:
+                self.collection.delete(ids=stale_ids)
+            self.manifest.clear()
+            if self.near_duplicates is not None:
+                self.near_duplicates.clear()
+            self.corpus_stats.clear()
+            self.lexical_index.clear()
+            self.rerank_features.clear()
+            self._commit_progress()
+        
+        summary = {
+            'files_total': 0,
+            'files_changed': 0,
+            'files_removed': 0,
+            'chunks_upserted': 0,
+            'chunks_deleted': 0,
+            'chunks_unchanged': 0,
+            'chunks_collapsed': 0,
+            'batches_committed': 0
+        }
+        current_files = set()
+        
+        # Files whose chunks have all been queued; recorded once their batch is stored
+        pending_files = []
+        buffer = []
+        
+        # Batches, chunks and files stored since the last full commit
+        uncommitted = {'batches': 0, 'chunks': 0, 'files': []}
+        
+        # Canonical chunks whose list of alternate sources changed during this run
+        refresh_ids = set()
+        
+        # Encode windows submitted but not yet stored. With a worker pool one window
+        # stays in flight, so workers encode it while the previous one is stored and
+        # the next one is chunked, instead of idling between windows.
+        in_flight = deque()
+        encode_ahead = 1 if self.parallel_encoder else 0
+        
+        def flush_buffer():
+            if not buffer and not pending_files:
+                return
+            in_flight.append({
+                'chunks': list(buffer),
+                'files': list(pending_files),
+                'encoded': self._submit_window(buffer) if buffer else None,
+                'deleted': set()
+            })
+            buffer.clear()
+            pending_files.clear()
+            while len(in_flight) > encode_ahead:
+                store_window(in_flight.popleft())
+        
+        def drain():
+            while in_flight:
+                store_window(in_flight.popleft())
+        
+        def store_window(window):
+            chunks = window['chunks']
+            batches = 1
+            if chunks:
+                embeddings = self._wait_encoded(window['encoded'])
+                # Chunks deleted while their window was encoding must not be resurrected
+                keep = [i for i, chunk in enumerate(chunks) if chunk['chunk_id'] not in window['deleted']]
+                chunks = [chunks[i] for i in keep]
+                if chunks:
+                    batches = self._store_encoded(chunks, embeddings[keep])
+                    summary['chunks_upserted'] += len(chunks)
+            for doc, doc_chunks in window['files']:
+                self.manifest.record_file(doc['filename'], doc['content_hash'], doc_chunks)
             
-            # Create medical domain embeddings
-            print(f"🧠 Creating embeddings for batch {i//batch_size + 1}/{(len(chunks)-1)//batch_size + 1}")
-            batch_embeddings = self.embedding_model.encode(
-                batch_texts,
-                show_progress_bar=True,
-                convert_to_numpy=True
-            )
+            # Canonicals stored so far get their alternates rewritten; those still in
+            # flight are built with the current alternates when they are stored
+            if self.near_duplicates is not None:
+                self._refresh_alternate_sources(refresh_ids)
+                refresh_ids.clear()
+            uncommitted['batches'] += batches
+            uncommitted['chunks'] += len(chunks)
+            uncommitted['files'].extend(doc['filename'] for doc, _ in window['files'])
             
-            # Add to collections
-            for j, chunk in enumerate(batch_chunks):
-                documents.append(chunk['content'])
-                ids.append(chunk['chunk_id'])
-                embeddings.append(batch_embeddings[j].tolist())
-                
-                # Base metadata
-                metadata = {
-                    'filename': chunk['filename'],
-                    'doc_type': chunk['doc_type'],
-                    'source': chunk['source'],
-                    'chunk_index': chunk['chunk_index'],
-                    'total_chunks': chunk['total_chunks'],
-                    'drugs': ','.join(chunk['drug']),
-                    'clinical_topic': chunk.get('clinical_topic', 'General Clinical'),
-                    'embedding_model': self.embedding_model.get_sentence_embedding_dimension(),
-                    'created_at': datetime.now().isoformat()
-                }
-                
-                # Add detailed clinical metadata
-                detailed_fields = [
-                    'section', 'subsection', 'mg_per_m2', 'mg_per_kg', 'cycle_length', 
-                    'frequency', 'toxicity_grades', 'anc_values', 'platelet_values', 
-                    'hemoglobin_values', 'population_newly_diagnosed', 'population_recurrent',
-                    'population_elderly', 'population_poor_performance', 'treatment_phase_concomitant',
-                    'treatment_phase_maintenance', 'treatment_phase_salvage', 'evidence_fda_approved',
-                    'evidence_clinical_trial', 'evidence_guideline', 'evidence_real_world'
-                ]
-                
-                for field in detailed_fields:
-                    if field in chunk:
-                        # Convert lists to strings for ChromaDB storage
-                        value = chunk[field]
-                        if isinstance(value, list):
-                            metadata[field] = ','.join(map(str, value))
-                        elif isinstance(value, bool):
-                            metadata[field] = str(value)
-                        else:
-                            metadata[field] = str(value)
-                    else:
-                        metadata[field] = ''
-                metadatas.append(metadata)
-        
-        # Add to collection with custom medical embeddings
-        print("💾 Storing medical embeddings in ChromaDB...")
-        self.collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids,
-            embeddings=embeddings
-        )
-        
-        print(f"✅ Stored {len(chunks)} chunks with medical domain embeddings")
-        print(f"🧠 Embedding model: {type(self.embedding_model).__name__}")
-        print(f"📏 Embedding dimension: {self.embedding_model.get_sentence_embedding_dimension()}")
-        print(f"🗄️ Database location: {self.db_dir}")
-    
-    def get_database_stats(self) -> Dict[str, Any]:
-        """Get statistics about the vector database."""
-        try:
-            count = self.collection.count()
+            if uncommitted['batches'] >= self.commit_every:
+                commit()
+            elif self.embedding_cache:
+                # Cheap journal append; keeps this batch's vectors for a resumed run
+                self.embedding_cache.flush()
+        
+        def commit():
+            self._commit_progress()
+            if uncommitted['batches']:
+                self.checkpoint.record_batch(uncommitted['chunks'], uncommitted['files'],
+                                             batches=uncommitted['batches'])
+                summary['batches_committed'] += uncommitted['batches']
+            uncommitted.update(batches=0, chunks=0, files=[])
+        
+        def delete_chunks(chunk_ids):
+            # Also drop queued copies so a later flush cannot resurrect them
+            removed = set(chunk_ids)
+            buffer[:] = [chunk for chunk in buffer if chunk['chunk_id'] not in removed]
+            for window in in_flight:
+                window['deleted'].update(removed)
+            self.collection.delete(ids=list(chunk_ids))
+            self.corpus_stats.remove_many(chunk_ids)
+            self.lexical_index.remove_many(chunk_ids)
+            self.rerank_features.remove_many(chunk_ids)
+        
+        def forget_duplicates(chunk_ids):
+            # Duplicates orphaned by a removed canonical chunk may be promoted and need storing
+            if self.near_duplicates is None:
+                return
+            with self.profiler.stage('dedup'):
+                for chunk_id in chunk_ids:
+                    promoted, touched = self.near_duplicates.remove(chunk_id)
+                    buffer.extend(promoted)
+                    refresh_ids.update(touched)
+        
+        # Load, hash and chunk (skipping unchanged files and records) in deterministic order
+        loaded = self.iter_loaded(self.manifest.file_hashes())
+        
+        for doc, doc_chunks in loaded:
+            if doc is None:
+                continue
+            summary['files_total'] += 1
+            current_files.add(doc['filename'])
             
-            # Get sample of metadata to analyze
-            sample = self.collection.get(limit=100)
+            if doc_chunks is None:
+                summary['chunks_unchanged'] += self.manifest.chunk_count(doc['filename'])
+                continue
             
-            # Analyze document types
-            doc_types = {}
-            sources = {}
-            drugs = {}
+            doc_changed, doc_stale = self.manifest.diff_chunks(doc['filename'], doc_chunks)
+            summary['files_changed'] += 1
+            summary['chunks_unchanged'] += len(doc_chunks) - len(doc_changed)
             
-            if sample['metadatas']:
-                for metadata in sample['metadatas']:
-                    # Count document types
-                    doc_type = metadata.get('doc_type', 'Unknown')
-                    doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
-                    
-                    # Count sources
-                    source = metadata.get('source', 'Unknown')
-                    sources[source] = sources.get(source, 0) + 1
-                    
-                    # Count drugs
-                    drug_list = metadata.get('drugs', 'both').split(',')
-                    for drug in drug_list:
-                        drugs[drug] = drugs.get(drug, 0) + 1
+            if doc_stale:
+                forget_duplicates(doc_stale)
+                delete_chunks(doc_stale)
+                summary['chunks_deleted'] += len(doc_stale)
             
+            for chunk in doc_changed:
+                if self.near_duplicates is not None:
+                    forget_duplicates([chunk['chunk_id']])
+                    with self.profiler.stage('dedup', items=1):
+                        canonical_id = self.near_duplicates.assign(chunk)
+                    if canonical_id is not None:
+                        # Drop any previously stored copy; the canonical lists this source instead
+                        delete_chunks([chunk['chunk_id']])
+                        refresh_ids.add(canonical_id)
+                        continue
+                buffer.append(chunk)
+                if len(buffer) >= self.batch_size * self.encode_window:
+                    flush_buffer()
+            pending_files.append((doc, doc_chunks))
+        
+        flush_buffer()
+        drain()
+        
+        # Files that disappeared from the data directory
+        for filename in self.manifest.known_files():
+            if filename not in current_files:
+                stale_ids = self.manifest.remove_file(filename)
+                if stale_ids:
+                    forget_duplicates(stale_ids)
+                    delete_chunks(stale_ids)
+                summary['chunks_deleted'] += len(stale_ids)
+                summary['files_removed'] += 1
+        
+        # Chunks promoted while handling removed files
+        flush_buffer()
+        drain()
+        
+        if self.near_duplicates is not None:
+            self._refresh_alternate_sources(refresh_ids)
+            report = self.near_duplicates.stats()
+            summary['chunks_collapsed'] = report['chunks_collapsed']
+            print(f"🧬 Near-duplicates: {report['chunks_collapsed']} of {report['chunks_total']} chunks collapsed "
+                  f"(index {report['shrink_ratio']:.1%} smaller)")
+        
+        commit()
+        self.checkpoint.complete()
+        
+        print(f"🔁 Incremental update: {summary['files_changed']} changed, "
+              f"{summary['files_removed']} removed, "
+              f"{summary['files_total'] - summary['files_changed']} unchanged files")
+        return summary
+    
+    def _commit_progress(self) -> None:
+        """Persist the manifest, near-duplicate index and embedding cache after stored work."""
+        with self.profiler.stage('commit'):
+            self._save_state()
+    
+    def _save_state(self) -> None:
+        if self.embedding_cache:
+            self.embedding_cache.flush()
+        if self.near_duplicates is not None:
+            self.near_duplicates.save()
+        self.corpus_stats.save()
+        self.lexical_index.save()
+        self.rerank_features.save()
+        self.manifest.save()
+    
+    def _refresh_alternate_sources(self, chunk_ids: Iterable[str]) -> None:
+        """Rewrite the alternate source metadata of stored canonical chunks."""
+        ids = sorted(chunk_id for chunk_id in chunk_ids if chunk_id in self.near_duplicates.canonicals)
+        for start in range(0, len(ids), self.batch_size):
+            stored = self.collection.get(ids=ids[start:start + self.batch_size], include=['metadatas'])
+            if not stored['ids']:
+                continue
+            metadatas = []
+            for chunk_id, metadata in zip(stored['ids'], stored['metadatas']):
+                alternates = self.near_duplicates.alternate_sources(chunk_id)
+                metadatas.append({
+                    **metadata,
+                    'alternate_sources': '; '.join(alternates),
+                    'alternate_source_count': len(alternates)
+                })
+            self.collection.update(ids=stored['ids'], metadatas=metadatas)
+    
+    def profile_report(self, summary: Dict[str, int] = None) -> Dict[str, Any]:
+        """Build the structured profiling report for this build."""
+        report = self.profiler.report()
+        stages = report['stages']
+        chunks_stored = stages.get('store', {}).get('items', 0)
+        encode_seconds = stages.get('encode', {}).get('wall_seconds', 0.0)
+        if self.parallel_encoder:
+            # Encoding overlaps storing, so time the pool was busy rather than time spent waiting on it
+            encode_seconds = self.parallel_encoder.wall_seconds
+        padding = self.padding_stats.report()
+        
+        # Real (non-padding) tokens from the attention masks of the forward passes that ran;
+        # unknown rather than zero if the model hid its masks from track_padding
+        counted = padding['texts'] >= self.texts_encoded
+        tokens, tokens_padded, tokens_per_second = None, None, None
+        if counted:
+            tokens, tokens_padded = padding['tokens_used'], padding['tokens_padded']
+            tokens_per_second = round(tokens / encode_seconds, 1) if encode_seconds else 0.0
+        
+        report.update({
+            'embedding_model': self.embedding_model_name,
+            'batch_size': self.batch_size,
+            'encode_batch_size': self.encode_batch_size,
+            'encode_workers': self.encode_workers,
+            'chunk_workers': self.chunk_workers,
+            'chunks_created': stages.get('split', {}).get('items', 0),
+            'chunks_stored': chunks_stored,
+            'chunks_per_second': round(chunks_stored / report['wall_seconds'], 1) if report['wall_seconds'] else 0.0,
+            'texts_encoded': self.texts_encoded,
+            'tokens_encoded': tokens,
+            'tokens_padded': tokens_padded,
+            'tokens_per_second': tokens_per_second,
+            'padding': padding,
+            'summary': summary or {}
+        })
+        if self.embedding_cache:
+            report['embedding_cache'] = self.embedding_cache.stats()
+        if self.parallel_encoder:
+            report['parallel_encode'] = self.parallel_encoder.throughput_report()
+        return report
+    
+    def write_profile_report(self, path: str, summary: Dict[str, int] = None,
+                             cprofile_dir: str = None) -> Dict[str, Any]:
+        """Write the profiling report as JSON (and per-stage cProfile dumps when collected)."""
+        report = self.profile_report(summary)
+        if cprofile_dir and self.profiler.cprofile:
+            report['cprofile_dumps'] = self.profiler.dump_cprofiles(cprofile_dir)
+        write_report(report, path)
+        return report
+    
+    def get_database_stats(self) -> Dict[str, Any]:
+        """Get exact statistics about the vector database from the corpus statistics sidecar."""
+        try:
+            facets = self.corpus_stats.facets()
             return {
-                'total_chunks': count,
-                'doc_types': doc_types,
-                'sources': sources,
-                'drugs': drugs,
-                'collection_name': self.collection.name
+                'total_chunks': self.corpus_stats.total_chunks,
+                'doc_types': facets['doc_types'],
+                'sources': facets['sources'],
+                'drugs': facets['drugs'],
+                'clinical_topics': facets['clinical_topics'],
+                'evidence': facets['evidence'],
+                'collection_name': self.collection.name,
+                'shards': self.collection.shard_counts() if self.sharded else {}
             }
         
         except Exception as e:
@@ -588,8 +824,10 @@ class GBMVectorDB:
     def test_search(self, query: str, n_results: int = 5) -> Dict[str, Any]:
         """Test search functionality."""
         try:
+            # Embed with the ingestion model; the collection's default embedding function has another dimension
+            query_embedding = self.embedding_model.encode([query])
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=query_embedding.tolist(),
                 n_results=n_results,
                 include=['documents', 'metadatas', 'distances']
             )
@@ -602,30 +840,124 @@ class GBMVectorDB:
         
         except Exception as e:
             return {'error': str(e)}
+    
+    def validate_index(self, queries: List[str] = None, n_results: int = 3) -> Dict[str, Any]:
+        """
+        Check a built index before it is published.
+        
+        The index passes when it is non-empty, the corpus statistics, BM25 index
+        and re-ranking features match the collection, and every validation query returns results.
+        """
+        queries = queries or VALIDATION_QUERIES
+        errors = []
+        
+        total = self.collection.count()
+        if not total:
+            errors.append("collection is empty")
+        if self.corpus_stats.total_chunks != total:
+            errors.append(f"corpus statistics count {self.corpus_stats.total_chunks} != collection count {total}")
+        if self.lexical_index.total_chunks != total:
+            errors.append(f"BM25 index count {self.lexical_index.total_chunks} != collection count {total}")
+        if self.rerank_features.total_chunks != total:
+            errors.append(f"re-ranking features count {self.rerank_features.total_chunks} != collection count {total}")
+        
+        searches = []
+        for query in queries:
+            result = self.test_search(query, n_results=n_results)
+            if 'error' in result:
+                errors.append(f"'{query}': {result['error']}")
+            elif not result['results']['ids'][0]:
+                errors.append(f"'{query}': no results")
+            searches.append(result)
+        
+        return {
+            'passed': not errors,
+            'total_chunks': total,
+            'queries': len(queries),
+            'errors': errors,
+            'searches': searches
+        }
 
 def main():
     """Main function to create the vector database."""
+    parser = argparse.ArgumentParser(description="Create or update the GBM clinical vector database")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore the ingestion manifest and re-index every document")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of embedding worker processes (default: 1, in-process)")
+    parser.add_argument('--chunk-workers', type=int, default=1,
+                        help="Number of processes for loading, chunking and metadata extraction")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="Chunks per store batch (default: 50, or 32 per worker when --workers > 1)")
+    parser.add_argument('--encode-window', type=int, default=8,
+                        help="Store batches encoded together so length sorting can group similar texts (default: 8)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its last commit")
+    parser.add_argument('--commit-every', type=int, default=20,
+                        help="Stored batches between commits of the manifest and sidecars (default: 20)")
+    parser.add_argument('--profile-report', default=None,
+                        help="Path of the JSON profiling report (default: <db_dir>/ingest_profile.json)")
+    parser.add_argument('--cprofile-dir', default=None,
+                        help="Also write a cProfile dump per ingestion stage to this directory")
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help="Index near-identical chunks separately instead of collapsing them")
+    parser.add_argument('--data-dir', default="us_clinical_data",
+                        help="Directory of markdown files (.md, .md.gz) and JSONL record exports (.jsonl, .jsonl.gz)")
+    parser.add_argument('--field-map', default=None,
+                        help="Record keys for JSONL inputs, e.g. 'text=abstract_text,doc_type=category,source=registry'")
+    parser.add_argument('--sharded', action='store_true',
+                        help="Store chunks in one collection per drug group and document type family")
+    parser.add_argument('--db-root', default="vector_db",
+                        help="Index root; each build goes into <db_root>/versions/ and is published via <db_root>/CURRENT")
+    parser.add_argument('--keep-versions', type=int, default=2,
+                        help="Number of index versions kept on disk after publishing (default: 2)")
+    args = parser.parse_args()
+    try:
+        field_map = parse_field_map(args.field_map)
+    except ValueError as e:
+        parser.error(str(e))
+    batch_size = args.batch_size or (max(50, 32 * args.workers) if args.workers > 1 else 50)
+    
     print("🚀 Starting GBM Clinical Data Vector Database Creation")
     print("=" * 60)
     
+    # Build into a new version directory; readers keep using the live one until it is published
+    versions = IndexVersions(args.db_root)
+    version = versions.prepare_build(copy_current=not args.full, resume=args.resume)
+    
     # Initialize vector DB
-    vector_db = GBMVectorDB()
+    vector_db = GBMVectorDB(data_dir=args.data_dir, db_dir=versions.version_path(version),
+                            batch_size=batch_size, encode_workers=args.workers,
+                            encode_window=args.encode_window,
+                            chunk_workers=args.chunk_workers,
+                            collapse_duplicates=not args.keep_duplicates,
+                            cprofile=bool(args.cprofile_dir),
+                            sharded=args.sharded,
+                            field_map=field_map,
+                            commit_every=args.commit_every)
     
-    # Load documents
-    print("\\n📄 Loading clinical documents...")
-    documents = vector_db.load_documents()
+    # Load, chunk, embed and store only what changed since the last build
+    print("\\n🔄 Indexing clinical documents...")
+    try:
+        summary = vector_db.update_index(full_rebuild=args.full, resume=args.resume)
+    finally:
+        vector_db.close()
     
-    if not documents:
-        print("❌ No documents found! Make sure markdown files exist in us_clinical_data/")
+    if not summary['files_total']:
+        print(f"❌ No documents found! Make sure markdown or JSONL files exist in {args.data_dir}/")
+        versions.discard_build(version)
         return
     
-    # Chunk documents
-    print("\\n✂️ Chunking documents...")
-    chunks = vector_db.chunk_documents(documents)
+    print(f"📋 Upserted {summary['chunks_upserted']} chunks, deleted {summary['chunks_deleted']}, "
+          f"kept {summary['chunks_unchanged']} unchanged")
     
-    # Create embeddings and store
-    print("\\n🔄 Creating embeddings and storing in database...")
-    vector_db.create_embeddings_and_store(chunks)
+    # Structured per-stage timings for tracking build performance across versions
+    report_path = args.profile_report or os.path.join(vector_db.db_dir, "ingest_profile.json")
+    report = vector_db.write_profile_report(report_path, summary, cprofile_dir=args.cprofile_dir)
+    tokens_rate = (f"{report['tokens_per_second']} tokens/s" if report['tokens_per_second'] is not None
+                   else "tokens not counted")
+    print(f"⏱️ Profile: {report['wall_seconds']}s wall, {report['chunks_per_second']} chunks/s, "
+          f"{tokens_rate}, peak RSS {report['peak_rss_mb']} MB -> {report_path}")
     
     # Get database statistics
     print("\\n📊 Database Statistics:")
@@ -636,23 +968,17 @@ def main():
         print(f"📁 Document types: {stats['doc_types']}")
         print(f"🏛️ Sources: {stats['sources']}")
         print(f"💊 Drugs covered: {stats['drugs']}")
+        if stats['shards']:
+            print(f"🧩 Shards: {stats['shards']}")
     else:
         print(f"❌ Error getting stats: {stats['error']}")
     
-    # Test search functionality
+    # Validate the new version with the test searches before publishing it
     print("\\n🔍 Testing search functionality...")
-    test_queries = [
-        "temozolomide dosing for glioblastoma",
-        "bevacizumab recurrent GBM dose",
-        "FDA approval trial results",
-        "maintenance treatment protocol",
-        "side effects monitoring"
-    ]
-    
-    for query in test_queries:
-        print(f"\\n🔎 Query: '{query}'")
-        results = vector_db.test_search(query, n_results=3)
-        
+    validation = vector_db.validate_index(VALIDATION_QUERIES, n_results=3)
+    
+    for results in validation['searches']:
+        print(f"\\n🔎 Query: '{results.get('query', '')}'")
         if 'error' not in results:
             for i, (doc, metadata, distance) in enumerate(zip(
                 results['results']['documents'][0],
@@ -664,6 +990,28 @@ def main():
         else:
             print(f"     ❌ Search error: {results['error']}")
     
+    if not validation['passed']:
+        print("\\n❌ Validation failed, index version not published:")
+        for error in validation['errors']:
+            print(f"   - {error}")
+        print(f"🗄️ Unpublished build left in: {vector_db.db_dir}")
+        versions.abandon_build()
+        return
+    
+    if versions.current_version() and not (summary['chunks_upserted'] or summary['chunks_deleted']):
+        # Nothing changed; publishing an identical copy would only churn reader caches
+        print(f"\\n✅ Index unchanged, keeping live version {versions.current_version()}")
+        versions.discard_build(version)
+        return
+    
+    versions.activate(version, validation={
+        'total_chunks': validation['total_chunks'],
+        'queries': validation['queries']
+    })
+    removed = versions.prune(keep=args.keep_versions)
+    if removed:
+        print(f"🧹 Removed old index versions: {', '.join(removed)}")
+    
     print("\\n" + "=" * 60)
     print("✅ Vector database creation completed successfully!")
     print(f"🗄️ Database stored in: {vector_db.db_dir}")
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Persistent Embedding Cache for GBM Clinical Vector Database
+Stores chunk embeddings in a memory-mapped array keyed by model name and normalized chunk text.
+The hash index is a snapshot plus an append-only journal; an evicted slot is only
+reused once its eviction is journaled, so an interrupted run never maps a key to
+another text's vector
+Author: Chetanya Pandey
+"""
+
+import os
+import re
+import json
+import hashlib
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
+import numpy as np
+
+INDEX_FILENAME = "index.json"
+JOURNAL_FILENAME = "index.log"
+VECTORS_FILENAME = "vectors.f32"
+
+
+def normalize_text(text: str) -> str:
+    """Normalize chunk text so whitespace-only differences share a cache entry."""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _model_dirname(model_name: str) -> str:
+    """Turn a model name like 'pritamdeka/S-PubMedBert-MS-MARCO' into a safe directory name."""
+    return re.sub(r'[^A-Za-z0-9._-]+', '__', model_name)
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str, dimension: int,
+                 max_entries: int = 200000, initial_capacity: int = 1024,
+                 eviction_batch: int = 256):
+        """
+        Initialize the on-disk embedding cache for one embedding model.
+
+        Args:
+            cache_dir: Root directory shared by all models' caches
+            model_name: Embedding model the vectors belong to
+            dimension: Embedding dimension of the model
+            max_entries: Maximum number of vectors kept before least-recently-used eviction
+            initial_capacity: Number of slots allocated when the vector file is first created
+            eviction_batch: Entries evicted at once when the cache is full, so the
+                journal is written once per batch rather than once per insert
+        """
+        self.model_name = model_name
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.eviction_batch = max(1, eviction_batch)
+        self.model_dir = os.path.join(cache_dir, _model_dirname(model_name))
+        self.index_path = os.path.join(self.model_dir, INDEX_FILENAME)
+        self.journal_path = os.path.join(self.model_dir, JOURNAL_FILENAME)
+        self.vectors_path = os.path.join(self.model_dir, VECTORS_FILENAME)
+        os.makedirs(self.model_dir, exist_ok=True)
+
+        # key -> slot, least recently used first
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        # Slots whose eviction is journaled and which may be overwritten
+        self.free_slots: List[int] = []
+        self.next_slot = 0
+        self.capacity = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Index changes not yet journaled: new (key, slot) pairs and keys used since the last flush
+        self._pending_puts: Dict[str, int] = {}
+        self._touched: "OrderedDict[str, None]" = OrderedDict()
+        self._journal_records = 0
+
+        self._load_index()
+        self._check_vectors()
+        self._open_vectors(max(initial_capacity, self.capacity))
+
+    def _load_index(self) -> None:
+        """Load the index snapshot and replay the journal, discarding both if they belong to another model."""
+        if not os.path.exists(self.index_path):
+            self._replay_journal()
+            return
+
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read embedding cache index {self.index_path}: {e}")
+            self._reset_journal()
+            return
+
+        if data.get('model_name') != self.model_name or data.get('dimension') != self.dimension:
+            print(f"⚠️ Embedding cache at {self.model_dir} does not match model, starting fresh")
+            self._reset_journal()
+            return
+
+        entries = data.get('entries', [])
+        if isinstance(entries, dict):
+            # Earlier format: key -> [slot, last_used_tick]
+            entries = [(key, entry[0]) for key, entry in sorted(entries.items(), key=lambda item: item[1][1])]
+        self.entries = OrderedDict((key, slot) for key, slot in entries)
+        self.next_slot = data.get('next_slot', len(self.entries))
+        self.capacity = data.get('capacity', 0)
+        self._replay_journal()
+
+    def _replay_journal(self) -> None:
+        """Apply journal records written since the snapshot (a torn last record is ignored)."""
+        if os.path.exists(self.journal_path):
+            self._apply_journal()
+        self._rebuild_free_slots()
+
+    def _apply_journal(self) -> None:
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    op, key, slot = json.loads(line)
+                except ValueError:
+                    break
+                if op == 'put':
+                    self.entries[key] = slot
+                    self.entries.move_to_end(key)
+                    self.next_slot = max(self.next_slot, slot + 1)
+                elif op == 'touch' and key in self.entries:
+                    self.entries.move_to_end(key)
+                elif op == 'evict' and self.entries.get(key) == slot:
+                    del self.entries[key]
+                self._journal_records += 1
+
+    def _rebuild_free_slots(self) -> None:
+        """Free every allocated slot no entry points at, so no crash between journal and snapshot loses one."""
+        occupied = set(self.entries.values())
+        self.free_slots = [slot for slot in range(self.next_slot) if slot not in occupied]
+
+    def _reset_journal(self) -> None:
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def _check_vectors(self) -> None:
+        """
+        Reconcile the loaded index with the vector file before trusting any row.
+
+        A file with fewer rows than the index has allocated (replaced or truncated)
+        would serve zeros or another text's vector, so the cache starts fresh. An
+        index built with a larger max_entries is shrunk to the current limit.
+        """
+        row_bytes = self.dimension * np.dtype(np.float32).itemsize
+        rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        if rows < self.next_slot:
+            if self.entries:
+                print(f"⚠️ Embedding cache vectors at {self.vectors_path} hold {rows} rows but the index "
+                      f"uses {self.next_slot}, starting fresh")
+            self.entries = OrderedDict()
+            self.free_slots = []
+            self.next_slot = 0
+            self.capacity = 0
+            if os.path.exists(self.vectors_path):
+                os.remove(self.vectors_path)
+            # An empty snapshot, so the stale one is not trusted once the file regrows
+            self._compact()
+            return
+
+        if max(rows, self.next_slot) > self.max_entries:
+            print(f"⚠️ Embedding cache at {self.model_dir} is larger than max_entries={self.max_entries}, shrinking")
+            self.entries = OrderedDict((key, slot) for key, slot in self.entries.items() if slot < self.max_entries)
+            self.next_slot = min(self.next_slot, self.max_entries)
+            self.capacity = self.max_entries
+            self._rebuild_free_slots()
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(self.max_entries * row_bytes)
+            # The journal may still reference dropped slots
+            self._compact()
+
+    def _open_vectors(self, capacity: int) -> None:
+        """Open (creating or growing as needed) the memory-mapped vector file."""
+        row_bytes = self.dimension * np.dtype(np.float32).itemsize
+        current_bytes = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        # Never shrink below the rows already on disk (the journal may reference them)
+        capacity = min(max(capacity, current_bytes // row_bytes, 1), self.max_entries)
+        required_bytes = capacity * row_bytes
+
+        # Grow the backing file in place; existing rows keep their offsets
+        if current_bytes < required_bytes:
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(required_bytes)
+
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+',
+                                 shape=(capacity, self.dimension))
+        self.capacity = capacity
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        """Hash normalized chunk text into a cache key."""
+        return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Look up cached vectors for a batch of texts.
+
+        Returns:
+            (array of shape (len(texts), dimension) with cached rows filled in,
+             indices of texts that were not in the cache)
+        """
+        result = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        missing = []
+
+        for i, text in enumerate(texts):
+            key = self.make_key(text)
+            slot = self.entries.get(key)
+            if slot is None:
+                missing.append(i)
+                self.misses += 1
+                continue
+
+            self._touch(key)
+            result[i] = self.vectors[slot]
+            self.hits += 1
+
+        return result, missing
+
+    def _touch(self, key: str) -> None:
+        self.entries.move_to_end(key)
+        self._touched[key] = None
+        self._touched.move_to_end(key)
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """Store freshly computed vectors, evicting least-recently-used entries if full."""
+        # Batches larger than the cache are stored in parts, each fitting once evictions are done
+        step = max(1, self.max_entries // 2)
+        if len(texts) > step:
+            for start in range(0, len(texts), step):
+                self.put_many(texts[start:start + step], vectors[start:start + step])
+            return
+
+        keys = [self.make_key(text) for text in texts]
+        # Keys already cached move to the most recent end first, so making room never evicts them
+        cached = set(key for key in keys if key in self.entries)
+        for key in cached:
+            self._touch(key)
+        self._reserve_slots(len(set(keys) - cached), protected=len(cached))
+
+        for key, vector in zip(keys, vectors):
+            slot = self.entries.get(key)
+            if slot is not None:
+                # Same text, same vector: overwriting in place is safe
+                self._touch(key)
+                self.vectors[slot] = vector
+                continue
+
+            slot = self._allocate_slot()
+            self.vectors[slot] = vector
+            self.entries[key] = slot
+            self._pending_puts[key] = slot
+
+    def _reserve_slots(self, count: int, protected: int = 0) -> None:
+        """
+        Make sure count slots can be allocated, growing the vector file or evicting LRU entries.
+
+        The protected most recently used entries are never evicted.
+        """
+        while self.next_slot + count > self.capacity and self.capacity < self.max_entries:
+            self.vectors.flush()
+            self._open_vectors(self.capacity * 2)
+
+        shortfall = count - (self.capacity - self.next_slot) - len(self.free_slots)
+        if shortfall <= 0:
+            return
+
+        # Evict a batch of the least recently used entries and journal the evictions
+        # before any of their slots are overwritten
+        evicted = []
+        for _ in range(min(max(shortfall, self.eviction_batch), len(self.entries) - protected)):
+            key, slot = self.entries.popitem(last=False)
+            self._pending_puts.pop(key, None)
+            self._touched.pop(key, None)
+            evicted.append(['evict', key, slot])
+        self.evictions += len(evicted)
+        # Free the slots before flushing: a compaction inside the flush snapshots
+        # free_slots, and nothing is allocated from them until the flush returns
+        self.free_slots.extend(slot for _, _, slot in evicted)
+        self.flush(extra_records=evicted)
+
+    def _allocate_slot(self) -> int:
+        """Take a journaled free slot, or the next unused one."""
+        if self.free_slots:
+            return self.free_slots.pop()
+        slot = self.next_slot
+        self.next_slot += 1
+        return slot
+
+    def flush(self, extra_records: List[List[Any]] = None) -> None:
+        """Persist vectors, then append the index changes to the journal (compacting it when long)."""
+        records = [['put', key, slot] for key, slot in self._pending_puts.items()]
+        records += [['touch', key, None] for key in self._touched if key not in self._pending_puts]
+        records += extra_records or []
+        if not records:
+            return
+
+        # Vectors reach the file before any record points at them
+        self.vectors.flush()
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+        self._journal_records += len(records)
+        self._pending_puts = {}
+        self._touched = OrderedDict()
+
+        if self._journal_records > max(len(self.entries), 1024):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rewrite the snapshot from the in-memory index and start an empty journal."""
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'model_name': self.model_name,
+                'dimension': self.dimension,
+                'capacity': self.capacity,
+                'next_slot': self.next_slot,
+                'free_slots': self.free_slots,
+                'entries': list(self.entries.items())
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        # Replaying the old journal over the new snapshot ends in the same state,
+        # so a crash before this truncation is harmless
+        open(self.journal_path, 'w').close()
+        self._journal_records = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            'model_name': self.model_name,
+            'entries': len(self.entries),
+            'capacity': self.capacity,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
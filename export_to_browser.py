@@ -10,6 +10,8 @@ import numpy as np
 from pathlib import Path
 import chromadb
 from chromadb.config import Settings
+from index_versions import resolve_index_dir
+from sharded_collection import open_collection
 
 def export_vector_db_to_json():
     """Export vector database to JSON format for browser."""
@@ -17,21 +19,19 @@ def export_vector_db_to_json():
     print("🔄 Exporting vector database to browser format...")
     
     try:
-        # Connect to ChromaDB
+        # Connect to ChromaDB (the published index version)
+        db_dir = resolve_index_dir("vector_db")
         chroma_client = chromadb.PersistentClient(
-            path="vector_db",
+            path=db_dir,
             settings=Settings(anonymized_telemetry=False)
         )
         
-        # Get collection
+        # Get collection (or its shards)
         try:
-            collection = chroma_client.get_collection("gbm_clinical_medical_embeddings")
+            collection = open_collection(chroma_client, db_dir)
         except:
-            try:
-                collection = chroma_client.get_collection("gbm_clinical_data")
-            except:
-                print("❌ No valid collection found")
-                return
+            print("❌ No valid collection found")
+            return
         
         print(f"📊 Found {collection.count()} documents")
         
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Ingestion Manifest for GBM Clinical Vector Database
+Tracks per-file and per-chunk content hashes so rebuilds only re-embed what changed
+Author: Chetanya Pandey
+"""
+
+import os
+import json
+import hashlib
+from typing import List, Dict, Any, Tuple, Optional
+from datetime import datetime
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_text(text: str) -> str:
+    """Return a stable SHA-256 hex digest for a piece of text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_chunk(chunk: Dict[str, Any]) -> str:
+    """Hash everything about a chunk that ends up in the index (content and metadata)."""
+    return hash_text(json.dumps(chunk, sort_keys=True, default=str))
+
+
+def index_embedding_model(db_dir: str) -> Optional[str]:
+    """Return the embedding model an index was built with (None if unrecorded or unreadable)."""
+    try:
+        with open(os.path.join(db_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f).get('embedding_model')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class IndexManifest:
+    def __init__(self, db_dir: str, schema_version: int = 1):
+        """
+        Initialize the ingestion manifest.
+
+        Args:
+            db_dir: Directory of the ChromaDB database the manifest describes
+            schema_version: Version of the stored metadata layout; a mismatch re-indexes every file
+        """
+        self.path = os.path.join(db_dir, MANIFEST_FILENAME)
+        self.schema_version = schema_version
+
+        # filename -> {'file_hash': str, 'chunks': {chunk_id: chunk_hash}, 'indexed_at': str}
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+        # Model every stored vector was embedded with; queries must embed with the same one
+        self.embedding_model: Optional[str] = None
+        self.load()
+
+    def load(self) -> None:
+        """Load the manifest from disk, starting empty if missing or unreadable."""
+        self.embedding_model = None
+        if not os.path.exists(self.path):
+            self.files = {}
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                print(f"⚠️ Ignoring manifest with unsupported version: {data.get('version')}")
+                self.files = {}
+            else:
+                self.files = data.get('files', {})
+                self.embedding_model = data.get('embedding_model')
+                if data.get('schema_version', 1) != self.schema_version:
+                    self.invalidate("metadata schema changed")
+        except Exception as e:
+            print(f"⚠️ Could not read manifest {self.path}: {e}")
+            self.files = {}
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'schema_version': self.schema_version,
+                'embedding_model': self.embedding_model,
+                'updated_at': datetime.now().isoformat(),
+                'files': self.files
+            }, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def invalidate(self, reason: str) -> None:
+        """Keep known chunk IDs (so stale ones are still deleted) but force every file to re-index."""
+        print(f"⚠️ Re-indexing all {len(self.files)} files: {reason}")
+        for entry in self.files.values():
+            entry['file_hash'] = None
+            entry['chunks'] = {chunk_id: None for chunk_id in entry.get('chunks', {})}
+
+    def clear(self) -> None:
+        """Forget all indexed files (used for full rebuilds)."""
+        self.files = {}
+
+    def known_files(self) -> List[str]:
+        """Return the filenames currently recorded in the manifest."""
+        return sorted(self.files.keys())
+
+    def file_hashes(self) -> Dict[str, str]:
+        """Return filename -> content hash for every indexed file."""
+        return {filename: entry.get('file_hash') for filename, entry in self.files.items()}
+
+    def chunk_count(self, filename: str) -> int:
+        """Return how many chunks are recorded for a file."""
+        return len(self.files.get(filename, {}).get('chunks', {}))
+
+    def file_changed(self, filename: str, file_hash: str) -> bool:
+        """Check whether a file is new or its content differs from the last indexed version."""
+        entry = self.files.get(filename)
+        return entry is None or entry.get('file_hash') != file_hash
+
+    def diff_chunks(self, filename: str, chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Compare freshly built chunks for a file against the manifest.
+
+        Returns:
+            (chunks that are new or changed, chunk IDs that no longer exist)
+        """
+        previous = self.files.get(filename, {}).get('chunks', {})
+
+        changed_chunks = []
+        current_ids = set()
+        for chunk in chunks:
+            current_ids.add(chunk['chunk_id'])
+            if previous.get(chunk['chunk_id']) != hash_chunk(chunk):
+                changed_chunks.append(chunk)
+
+        stale_ids = [chunk_id for chunk_id in previous if chunk_id not in current_ids]
+        return changed_chunks, stale_ids
+
+    def record_file(self, filename: str, file_hash: str, chunks: List[Dict[str, Any]]) -> None:
+        """Record the indexed state of a file and its chunks."""
+        self.files[filename] = {
+            'file_hash': file_hash,
+            'chunks': {chunk['chunk_id']: hash_chunk(chunk) for chunk in chunks},
+            'indexed_at': datetime.now().isoformat()
+        }
+
+    def remove_file(self, filename: str) -> List[str]:
+        """Drop a file from the manifest and return the chunk IDs it owned."""
+        entry = self.files.pop(filename, None)
+        return list(entry.get('chunks', {}).keys()) if entry else []
+
+
+CHECKPOINT_FILENAME = "ingest_checkpoint.json"
+
+
+class IngestCheckpoint:
+    def __init__(self, db_dir: str):
+        """
+        Initialize the ingestion checkpoint.
+
+        The manifest records which files are committed; the checkpoint records
+        the run itself so an interrupted rebuild can be resumed rather than restarted.
+
+        Args:
+            db_dir: Directory of the ChromaDB database being built
+        """
+        self.path = os.path.join(db_dir, CHECKPOINT_FILENAME)
+        self.state: Dict[str, Any] = {}
+        self.load()
+
+    def load(self) -> None:
+        """Load the checkpoint from disk, starting empty if missing or unreadable."""
+        if not os.path.exists(self.path):
+            self.state = {}
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read checkpoint {self.path}: {e}")
+            self.state = {}
+
+    def save(self) -> None:
+        """Atomically write the checkpoint to disk."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.state['updated_at'] = datetime.now().isoformat()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def interrupted(self) -> bool:
+        """Check whether the last run started but never completed."""
+        return self.state.get('status') == 'running'
+
+    def start(self, mode: str) -> None:
+        """Begin a new run ('full' or 'incremental')."""
+        self.state = {
+            'status': 'running',
+            'mode': mode,
+            'started_at': datetime.now().isoformat(),
+            'batches_completed': 0,
+            'chunks_committed': 0,
+            'files_completed': []
+        }
+        self.save()
+
+    def record_batch(self, chunks_committed: int, files_completed: List[str], batches: int = 1) -> None:
+        """Record committed batches and the files they finished."""
+        self.state['batches_completed'] = self.state.get('batches_completed', 0) + batches
+        self.state['chunks_committed'] = self.state.get('chunks_committed', 0) + chunks_committed
+        self.state.setdefault('files_completed', []).extend(files_completed)
+        self.save()
+
+    def complete(self) -> None:
+        """Mark the run as finished."""
+        self.state['status'] = 'complete'
+        self.state['completed_at'] = datetime.now().isoformat()
+        self.save()
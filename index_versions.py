@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Blue/Green Index Versions for GBM Clinical Vector Database
+Builds go into a fresh versioned directory and are published by atomically
+replacing a pointer file, so readers never see a half-built index
+Author: Chetanya Pandey
+"""
+
+import os
+import json
+import shutil
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+
+POINTER_FILENAME = "CURRENT"
+BUILDING_FILENAME = "BUILDING"
+VERSIONS_DIRNAME = "versions"
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def resolve_index_dir(root: str) -> str:
+    """Return the directory of the live index under root (root itself for a legacy unversioned index)."""
+    return IndexVersions(root).current_path()
+
+
+class IndexVersions:
+    def __init__(self, root: str = "vector_db"):
+        """
+        Initialize versioned index storage.
+
+        Args:
+            root: Index root holding the CURRENT pointer and the versions/ directory
+        """
+        self.root = root
+        self.pointer_path = os.path.join(root, POINTER_FILENAME)
+        self.building_path = os.path.join(root, BUILDING_FILENAME)
+        self.versions_dir = os.path.join(root, VERSIONS_DIRNAME)
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """Return the published pointer record, or None if nothing has been published."""
+        return _read_json(self.pointer_path)
+
+    def current_version(self) -> Optional[str]:
+        """Return the live version ID (None for a legacy or empty root)."""
+        pointer = self.current()
+        return pointer.get('version') if pointer else None
+
+    def current_path(self) -> str:
+        """Return the directory readers should open."""
+        version = self.current_version()
+        return self.version_path(version) if version else self.root
+
+    def version_path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    def list_versions(self) -> List[str]:
+        """Return all version IDs on disk, oldest first."""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(name for name in os.listdir(self.versions_dir)
+                      if os.path.isdir(os.path.join(self.versions_dir, name)))
+
+    def pointer_token(self) -> Optional[tuple]:
+        """Cheap change detector for the pointer file (os.replace gives every publish a new inode)."""
+        try:
+            stat = os.stat(self.pointer_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def prepare_build(self, copy_current: bool = True, resume: bool = False) -> str:
+        """
+        Create (or reuse, when resuming) the directory for a new version.
+
+        Args:
+            copy_current: Seed the new version with a copy of the live one so the
+                build can run incrementally against its manifest
+            resume: Reuse the unfinished build recorded by a previous run if there is one
+
+        Returns:
+            The version ID being built
+        """
+        building = _read_json(self.building_path)
+        if resume and building and os.path.isdir(self.version_path(building['version'])):
+            print(f"⏩ Resuming build of index version {building['version']}")
+            return building['version']
+
+        version = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        path = self.version_path(version)
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+        source = self.current_path()
+        if copy_current and os.path.isdir(source) and self._has_index(source):
+            # A legacy root also contains versions/ and the pointer files; copy only index files
+            shutil.copytree(source, path, ignore=shutil.ignore_patterns(
+                VERSIONS_DIRNAME, POINTER_FILENAME, BUILDING_FILENAME, '*.tmp'))
+            print(f"📋 Seeded index version {version} from {source}")
+        else:
+            os.makedirs(path)
+
+        _write_json_atomic(self.building_path, {
+            'version': version,
+            'started_at': datetime.now().isoformat()
+        })
+        return version
+
+    def activate(self, version: str, validation: Optional[Dict[str, Any]] = None) -> None:
+        """Atomically point readers at a finished version."""
+        if not os.path.isdir(self.version_path(version)):
+            raise ValueError(f"Unknown index version: {version}")
+
+        previous = self.current_version()
+        _write_json_atomic(self.pointer_path, {
+            'version': version,
+            'previous': previous,
+            'activated_at': datetime.now().isoformat(),
+            'validation': validation or {}
+        })
+        if os.path.exists(self.building_path):
+            os.remove(self.building_path)
+        print(f"🔀 Activated index version {version}" + (f" (was {previous})" if previous else ""))
+
+    def abandon_build(self) -> None:
+        """Forget the unfinished build marker (its directory is kept for inspection)."""
+        if os.path.exists(self.building_path):
+            os.remove(self.building_path)
+
+    def discard_build(self, version: str) -> None:
+        """Delete an unpublished build."""
+        if version == self.current_version():
+            raise ValueError(f"Refusing to discard the live index version: {version}")
+        self.abandon_build()
+        shutil.rmtree(self.version_path(version), ignore_errors=True)
+
+    def prune(self, keep: int = 2) -> List[str]:
+        """
+        Delete old versions, keeping the newest `keep` plus the live and previous ones.
+
+        Readers still holding the previous version keep working; only older ones go.
+        """
+        pointer = self.current() or {}
+        protected = {pointer.get('version'), pointer.get('previous')}
+        building = _read_json(self.building_path)
+        if building:
+            protected.add(building.get('version'))
+
+        versions = self.list_versions()
+        removed = []
+        for version in versions[:-keep] if keep > 0 else versions:
+            if version in protected:
+                continue
+            shutil.rmtree(self.version_path(version), ignore_errors=True)
+            removed.append(version)
+        return removed
+
+    @staticmethod
+    def _has_index(path: str) -> bool:
+        return any(name.endswith('.sqlite3') or name.endswith('.json') for name in os.listdir(path))
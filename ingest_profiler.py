@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Ingestion Profiler for GBM Clinical Vector Database
+Accumulates wall and CPU time per ingestion stage, throughput counters and peak
+memory, with optional per-stage cProfile dumps, and writes them as a JSON report
+Author: Chetanya Pandey
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterator
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class _RawStats:
+    """Adapter so pstats.Stats can load a profile's stats dict shipped from a worker."""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+def peak_rss_mb(who: str = 'self') -> Optional[float]:
+    """Peak resident set size in MB for this process ('self') or its finished workers ('children')."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(usage.ru_maxrss / divisor, 1)
+
+
+class StageProfiler:
+    def __init__(self, cprofile: bool = False):
+        """
+        Initialize an ingestion stage profiler.
+
+        Args:
+            cprofile: Also collect a cProfile per stage (stages must not nest)
+        """
+        self.cprofile = cprofile
+        self.started_at = datetime.now().isoformat()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+        # stage -> {'wall_seconds', 'cpu_seconds', 'calls', 'items'}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._worker_profiles: Dict[str, list] = {}
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0) -> Iterator[None]:
+        """Time a block of work belonging to a stage."""
+        profile = self._profiles.setdefault(name, cProfile.Profile()) if self.cprofile else None
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            # Stop profiling first so the clocks themselves stay out of the dump
+            if profile is not None:
+                profile.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._add(name, wall, cpu, 1, items)
+
+    def count(self, name: str, items: int) -> None:
+        """Credit items to a stage once they are known (e.g. chunks produced by a split)."""
+        self._add(name, 0.0, 0.0, 0, items)
+
+    def _add(self, name: str, wall: float, cpu: float, calls: int, items: int) -> None:
+        entry = self.stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'calls': 0, 'items': 0})
+        entry['wall_seconds'] += wall
+        entry['cpu_seconds'] += cpu
+        entry['calls'] += calls
+        entry['items'] += items
+
+    def drain(self) -> Dict[str, Any]:
+        """Return and reset everything recorded so far (used to ship worker timings to the parent)."""
+        snapshot = {'stages': self.stages, 'profiles': {}}
+        for name, profile in self._profiles.items():
+            profile.create_stats()
+            snapshot['profiles'][name] = profile.stats
+        self.stages = {}
+        self._profiles = {}
+        return snapshot
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """Fold a worker's drained timings into this profiler."""
+        for name, entry in snapshot.get('stages', {}).items():
+            self._add(name, entry['wall_seconds'], entry['cpu_seconds'], entry['calls'], entry['items'])
+        if self.cprofile:
+            for name, stats in snapshot.get('profiles', {}).items():
+                self._worker_profiles.setdefault(name, []).append(stats)
+
+    def report(self) -> Dict[str, Any]:
+        """Summarize per-stage timings, total time and peak memory."""
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = {
+                'wall_seconds': round(entry['wall_seconds'], 4),
+                'cpu_seconds': round(entry['cpu_seconds'], 4),
+                'calls': entry['calls'],
+                'items': entry['items'],
+                'items_per_second': round(entry['items'] / entry['wall_seconds'], 1) if entry['wall_seconds'] else 0.0
+            }
+
+        return {
+            'started_at': self.started_at,
+            'wall_seconds': round(time.perf_counter() - self._wall_start, 3),
+            'cpu_seconds': round(time.process_time() - self._cpu_start, 3),
+            'stages': stages,
+            'peak_rss_mb': peak_rss_mb('self'),
+            'peak_rss_workers_mb': peak_rss_mb('children')
+        }
+
+    def dump_cprofiles(self, profile_dir: str) -> Dict[str, str]:
+        """Write one .prof file per stage (worker profiles merged in) and return their paths."""
+        os.makedirs(profile_dir, exist_ok=True)
+        paths = {}
+        for name in sorted(set(self._profiles) | set(self._worker_profiles)):
+            stats = None
+            sources = ([self._profiles[name]] if name in self._profiles else []) + \
+                      [_RawStats(raw) for raw in self._worker_profiles.get(name, [])]
+            for source in sources:
+                if stats is None:
+                    stats = pstats.Stats(source)
+                else:
+                    stats.add(source)
+            path = os.path.join(profile_dir, f"{name}.prof")
+            stats.dump_stats(path)
+            paths[name] = path
+        return paths
+
+
+def write_report(report: Dict[str, Any], path: str) -> None:
+    """Atomically write a profiling report as JSON."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
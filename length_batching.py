@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Length-Bucketed Batching for GBM Clinical Embeddings
+Groups texts of similar length into the same forward pass and measures the
+padding each pass really carried from the attention masks the encoder builds
+Author: Chetanya Pandey
+"""
+
+import threading
+from typing import List, Dict, Any, Optional
+
+
+def plan_length_batches(texts: List[str], batch_size: int) -> List[List[int]]:
+    """
+    Split indices into batches of similar length, longest first.
+
+    Sorts on character length, the same key SentenceTransformer.encode sorts a
+    single call by, so batches handed to separate workers are composed the way
+    one encode call over all the texts would compose them.
+    """
+    order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class PaddingStats:
+    def __init__(self):
+        """Track tokens the encoder actually ran on versus tokens spent on padding."""
+        self.tokens_used = 0
+        self.tokens_padded = 0
+        self.batches = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def record_mask(self, attention_mask) -> None:
+        """Record one forward pass from its attention mask (texts x padded length, torch or numpy)."""
+        texts, width = attention_mask.shape
+        used = int(attention_mask.sum())
+        self.add(used, texts * width - used, batches=1, texts=texts)
+
+    def add(self, tokens_used: int, tokens_padded: int, batches: int, texts: int) -> None:
+        """Add counts measured elsewhere (e.g. in an encoding worker process)."""
+        with self._lock:
+            self.tokens_used += tokens_used
+            self.tokens_padded += tokens_padded
+            self.batches += batches
+            self.texts += texts
+
+    def counts(self) -> tuple:
+        """(tokens_used, tokens_padded, batches, texts), for passing between processes."""
+        return self.tokens_used, self.tokens_padded, self.batches, self.texts
+
+    def report(self) -> Dict[str, Any]:
+        """Summarize padding efficiency."""
+        total = self.tokens_used + self.tokens_padded
+        return {
+            'texts': self.texts,
+            'batches': self.batches,
+            'tokens_used': self.tokens_used,
+            'tokens_padded': self.tokens_padded,
+            'padding_ratio': round(self.tokens_padded / total, 4) if total else 0.0
+        }
+
+
+def track_padding(model, stats: PaddingStats) -> Optional[Any]:
+    """
+    Count every forward pass of a SentenceTransformer into stats.
+
+    Hooks the first module (the transformer), which receives the tokenized batch
+    encode already built, so no text is tokenized twice. Returns the hook handle,
+    or None if the model does not expose its modules.
+    """
+    first_module = getattr(model, '_first_module', None)
+    if first_module is None:
+        return None
+
+    def record(module, args):
+        features = args[0] if args else None
+        if isinstance(features, dict) and features.get('attention_mask') is not None:
+            stats.record_mask(features['attention_mask'])
+
+    return first_module().register_forward_pre_hook(record)
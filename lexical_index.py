@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+BM25 Lexical Index for GBM Clinical Vector Database
+Persisted inverted index over the stored chunks, updated as chunks are added or
+deleted, so exact clinical tokens (mg/m², Grade 3, ANC ≥1500, q2w) can be
+matched alongside the dense embeddings
+Author: Chetanya Pandey
+"""
+
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter
+from typing import List, Dict, Iterable, Tuple
+
+INDEX_FILENAME = "bm25_index.json"
+INDEX_VERSION = 1
+
+# Comparator-number tokens (≥1500, <100) and words kept whole across / . - (mg/m2, q2w, 3-4)
+TOKEN_PATTERN = re.compile(r"[≥≤<>]=?\s?\d+(?:[.,]\d+)*|[a-z0-9]+(?:[./\-][a-z0-9]+)*")
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'how', 'in', 'is', 'it',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'were', 'what', 'when', 'which',
+    'with', 'should', 'can', 'do', 'does'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split clinical text into BM25 terms.
+
+    Text is NFKC-normalized (so m² and m2 match) and lowercased. A comparator
+    number also yields the bare number, hyphenated tokens also yield their parts,
+    and a word followed by a number also yields the pair ('grade 3-4' -> grade,
+    3-4, 3, 4, grade_3-4, grade_3).
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    tokens = []
+    previous = None
+    for token in TOKEN_PATTERN.findall(text):
+        token = token.replace(' ', '')
+        if token in STOPWORDS:
+            previous = None
+            continue
+        tokens.append(token)
+        parts = token.split('-') if '-' in token else []
+        tokens.extend(part for part in parts if part)
+        if token[0] in '≥≤<>':
+            tokens.append(token.lstrip('≥≤<>='))
+        elif token[0].isdigit() and previous is not None and previous.isalpha():
+            tokens.append(f"{previous}_{token}")
+            if parts:
+                tokens.append(f"{previous}_{parts[0]}")
+        previous = token
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, db_dir: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialize the BM25 index sidecar.
+
+        Args:
+            db_dir: Directory of the ChromaDB database the index describes
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.path = os.path.join(db_dir, INDEX_FILENAME)
+        self.k1 = k1
+        self.b = b
+
+        # chunk_id -> term frequencies, so deletions can be subtracted exactly
+        self.chunks: Dict[str, Dict[str, int]] = {}
+        # term -> {chunk_id: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.load()
+
+    def _apply(self, chunk_id: str, frequencies: Dict[str, int]) -> None:
+        self.chunks[chunk_id] = frequencies
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[chunk_id] = frequency
+        length = sum(frequencies.values())
+        self.lengths[chunk_id] = length
+        self.total_length += length
+
+    def add(self, chunk_id: str, text: str) -> None:
+        """Index a stored chunk, replacing its previous version if it was re-indexed."""
+        self.remove(chunk_id)
+        self._apply(chunk_id, dict(Counter(tokenize(text))))
+
+    def remove(self, chunk_id: str) -> None:
+        """Drop a deleted chunk (no-op if unknown)."""
+        frequencies = self.chunks.pop(chunk_id, None)
+        if frequencies is None:
+            return
+        for term in frequencies:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(chunk_id, 0)
+
+    def remove_many(self, chunk_ids: Iterable[str]) -> None:
+        """Drop several deleted chunks."""
+        for chunk_id in chunk_ids:
+            self.remove(chunk_id)
+
+    def clear(self) -> None:
+        """Forget all chunks (used for full rebuilds)."""
+        self.chunks = {}
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+
+    @property
+    def total_chunks(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """Return the top (chunk_id, BM25 score) pairs for a query, best first."""
+        total = len(self.chunks)
+        if not total:
+            return []
+        average_length = self.total_length / total
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        # Ties broken by chunk ID so results are deterministic
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:n_results]
+
+    def rebuild(self, collection, page_size: int = 1000) -> None:
+        """Re-index every chunk in a collection (used when the sidecar is missing or out of date)."""
+        self.clear()
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(offset=offset, limit=page_size, include=['documents'])
+            for chunk_id, document in zip(page['ids'], page['documents']):
+                self.add(chunk_id, document or '')
+
+    def ensure_consistent(self, collection) -> bool:
+        """Rebuild from the collection if the chunk count disagrees; returns True if rebuilt."""
+        if self.total_chunks == collection.count():
+            return False
+        print(f"⚠️ BM25 index out of date ({self.total_chunks} vs {collection.count()} chunks), re-indexing")
+        self.rebuild(collection)
+        return True
+
+    def load(self) -> None:
+        """Load the sidecar from disk, starting empty if missing or unreadable."""
+        self.clear()
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION:
+                print(f"⚠️ Ignoring BM25 index with unsupported version: {data.get('version')}")
+                return
+            for chunk_id, frequencies in data.get('chunks', {}).items():
+                self._apply(chunk_id, frequencies)
+        except Exception as e:
+            print(f"⚠️ Could not read BM25 index {self.path}: {e}")
+            self.clear()
+
+    def save(self) -> None:
+        """Atomically write the sidecar to disk."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'total_chunks': self.total_chunks,
+                'chunks': self.chunks
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked ID lists with reciprocal rank fusion.
+
+    Scores are normalized by the best possible score (first in every list), so
+    they fall in (0, 1] like a similarity.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    best = len(rankings) / (k + 1) if rankings else 1.0
+    return sorted(((chunk_id, score / best) for chunk_id, score in scores.items()),
+                  key=lambda item: -item[1])
@@ -5,91 +5,206 @@ Provides rich filtering by document type, clinical topic, evidence level, and mo
 Author: Chetanya Pandey
 """
 
-from typing import Dict, List, Any, Optional, Set
+import re
+from typing import Dict, List, Any, Optional, Set, Tuple
 import chromadb
 from chromadb.config import Settings
+from clinical_extractor import NUMERIC_FIELDS
+from corpus_stats import CorpusStats
+from index_versions import IndexVersions
+from sharded_collection import open_collection
+
+# Typed numeric fields stored as <prefix>_min / <prefix>_max
+RANGE_FIELDS = tuple(NUMERIC_FIELDS.values())
+
+# Filter values -> boolean indicator fields stored on each chunk
+EVIDENCE_FLAGS = {
+    'fda_approved': 'evidence_fda_approved',
+    'clinical_guideline': 'evidence_guideline',
+    'guideline': 'evidence_guideline',
+    'randomized_controlled_trial': 'evidence_clinical_trial',
+    'clinical_trial': 'evidence_clinical_trial',
+    'real_world': 'evidence_real_world'
+}
+
+TREATMENT_PHASE_FLAGS = {
+    'concomitant': 'treatment_phase_concomitant',
+    'maintenance': 'treatment_phase_maintenance',
+    'salvage': 'treatment_phase_salvage',
+    'first_line': 'population_newly_diagnosed'
+}
+
+POPULATION_FLAGS = {
+    'newly_diagnosed': 'population_newly_diagnosed',
+    'recurrent': 'population_recurrent',
+    'elderly': 'population_elderly',
+    'poor_performance': 'population_poor_performance'
+}
+
+# Query phrases that carry numeric constraints
+_NUMBER = r'(\d+(?:,\d{3})*(?:\.\d+)?)'
+_UNITS = {
+    'mg_per_m2': r'mg/m[²2]',
+    'mg_per_kg': r'mg/kg',
+    'cycle_length_days': r'[-\s]*days?',
+    'frequency_weeks': r'[-\s]*weeks?'
+}
+_LOWER_WORDS = r'(?:≥|>=|>|at least|above|over|more than|greater than|minimum(?: of)?)'
+_UPPER_WORDS = r'(?:≤|<=|<|at most|below|under|less than|up to|maximum(?: of)?)'
+_LAB_NAMES = {
+    'anc': r'(?:anc|absolute neutrophil count)',
+    'platelets': r'platelets?',
+    'hemoglobin': r'(?:hemoglobin|hgb|hb)'
+}
+
+
+def _number(text: str) -> float:
+    return float(text.replace(',', ''))
+
+
+def _as_range(value: Any) -> Tuple[Optional[float], Optional[float]]:
+    """Normalize a number, (lo, hi) pair or {'min', 'max'} dict into an inclusive range."""
+    if isinstance(value, dict):
+        return value.get('min'), value.get('max')
+    if isinstance(value, (list, tuple)):
+        return value[0], value[1]
+    return value, value
+
+
+def range_conditions(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Build ChromaDB predicates for numeric range filters.
+    
+    A chunk matches when its [min, max] value range overlaps the requested range,
+    e.g. {'mg_per_m2': (150, 200)} or {'toxicity_grade': {'min': 3}}.
+    """
+    conditions = []
+    for prefix in RANGE_FIELDS:
+        value = filters.get(prefix)
+        if value is None or isinstance(value, str):
+            continue
+        lo, hi = _as_range(value)
+        if lo is not None:
+            conditions.append({f'{prefix}_max': {'$gte': lo}})
+        if hi is not None:
+            conditions.append({f'{prefix}_min': {'$lte': hi}})
+    return conditions
+
+
+def _flag_condition(values: Any, flags: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Match chunks carrying any of the boolean flags the filter values map to."""
+    values = values if isinstance(values, list) else [values]
+    fields = list(dict.fromkeys(flags[v] for v in values if v in flags))
+    if not fields:
+        return None
+    if len(fields) == 1:
+        return {fields[0]: {'$eq': True}}
+    return {'$or': [{field: {'$eq': True}} for field in fields]}
+
+
+def combine_conditions(conditions: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Wrap predicates in $and since ChromaDB allows a single top-level operator."""
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {'$and': conditions}
+
+
+def parse_range_filters(query: str) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """
+    Extract numeric constraints from a free-text query.
+    
+    Recognizes dose, cycle and interval ranges ("between 150 and 200 mg/m²",
+    "21-28 day"), bounds ("at least 150 mg/m2", "platelets ≥ 100,000") and
+    grade thresholds ("grade 3 or higher", "grade 3-4").
+    """
+    query_lower = query.lower()
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+
+    for prefix, unit in _UNITS.items():
+        between = re.search(r'(?:between\s+)?' + _NUMBER + r'\s*(?:and|to|-|–)\s*' + _NUMBER + r'\s*' + unit, query_lower)
+        lower = re.search(_LOWER_WORDS + r'\s*' + _NUMBER + r'\s*' + unit, query_lower)
+        upper = re.search(_UPPER_WORDS + r'\s*' + _NUMBER + r'\s*' + unit, query_lower)
+        if between:
+            ranges[prefix] = (_number(between.group(1)), _number(between.group(2)))
+        elif lower or upper:
+            ranges[prefix] = (_number(lower.group(1)) if lower else None,
+                              _number(upper.group(1)) if upper else None)
+
+    for prefix, name in _LAB_NAMES.items():
+        lower = re.search(name + r'[:\s]*' + _LOWER_WORDS + r'\s*' + _NUMBER, query_lower)
+        upper = re.search(name + r'[:\s]*' + _UPPER_WORDS + r'\s*' + _NUMBER, query_lower)
+        if lower or upper:
+            ranges[prefix] = (_number(lower.group(1)) if lower else None,
+                              _number(upper.group(1)) if upper else None)
+
+    grade_span = re.search(r'grades?\s*(\d)\s*(?:-|–|to|or|and)\s*(\d)\b', query_lower)
+    grade_min = (re.search(r'grades?\s*(\d)\s*(?:or|and)\s*(?:higher|above|greater|more|worse)', query_lower)
+                 or re.search(r'grades?\s*(?:≥|>=)\s*(\d)', query_lower))
+    grade_max = (re.search(r'grades?\s*(\d)\s*(?:or|and)\s*(?:lower|below|less)', query_lower)
+                 or re.search(r'grades?\s*(?:≤|<=)\s*(\d)', query_lower))
+    if grade_span:
+        ranges['toxicity_grade'] = (float(grade_span.group(1)), float(grade_span.group(2)))
+    elif grade_min or grade_max:
+        ranges['toxicity_grade'] = (float(grade_min.group(1)) if grade_min else None,
+                                    float(grade_max.group(1)) if grade_max else None)
+
+    return ranges
+
 
 class EnhancedMetadataFilter:
     def __init__(self, db_dir: str = "vector_db"):
         """Initialize enhanced metadata filtering system."""
-        self.db_dir = db_dir
+        # db_dir is the index root; filter options follow its published version
+        self.db_root = db_dir
+        self.index_versions = IndexVersions(db_dir)
+        
+        # Connect to ChromaDB and initialize available filter options by analyzing database
+        self._connect_index()
+        
+        # Define filter hierarchies and relationships
+        self._init_filter_hierarchies()
+    
+    def _connect_index(self):
+        """Open the live index version and load its filter options."""
+        self._pointer_token = self.index_versions.pointer_token()
+        self.db_dir = self.index_versions.current_path()
         
         # Connect to ChromaDB
         self.chroma_client = chromadb.PersistentClient(
-            path=db_dir,
+            path=self.db_dir,
             settings=Settings(anonymized_telemetry=False)
         )
         
-        try:
-            self.collection = self.chroma_client.get_collection("gbm_clinical_medical_embeddings")
-        except:
-            self.collection = self.chroma_client.get_collection("gbm_clinical_data")
+        self.collection = open_collection(self.chroma_client, self.db_dir)
         
-        # Initialize available filter options by analyzing database
         self._init_filter_options()
-        
-        # Define filter hierarchies and relationships
-        self._init_filter_hierarchies()
+    
+    def _check_index_version(self) -> bool:
+        """Reload filter options if a new index version was published; returns True if it switched."""
+        if self.index_versions.pointer_token() == self._pointer_token:
+            return False
+        self._connect_index()
+        return True
     
     def _init_filter_options(self):
-        """Initialize available filter options by analyzing the database."""
-        # Sample a representative set of documents to understand available metadata
-        sample_size = min(1000, self.collection.count())
-        sample = self.collection.get(limit=sample_size, include=['metadatas'])
+        """Initialize available filter options from the exact corpus statistics."""
+        self.corpus_stats = CorpusStats(self.db_dir)
+        self.corpus_stats.ensure_consistent(self.collection)
+        facets = self.corpus_stats.facets()
         
-        # Extract unique values for each metadata field
+        # Evidence, phase and population names match the suffixes of their boolean flags
         self.available_filters = {
-            'doc_types': set(),
-            'sources': set(),
-            'clinical_topics': set(),
-            'evidence_levels': set(),
-            'drugs': set(),
-            'treatment_phases': set(),
-            'patient_populations': set(),
-            'toxicity_grades': set()
+            'doc_types': sorted(facets['doc_types']),
+            'sources': sorted(facets['sources']),
+            'clinical_topics': sorted(facets['clinical_topics']),
+            'evidence_levels': sorted(facets['evidence']),
+            'drugs': sorted(facets['drugs']),
+            'treatment_phases': sorted(facets['treatment_phases']),
+            'patient_populations': sorted(facets['patient_populations']),
+            'toxicity_grades': sorted(facets['toxicity_grades'], key=int)
         }
-        
-        if sample['metadatas']:
-            for metadata in sample['metadatas']:
-                # Document types
-                if metadata.get('doc_type'):
-                    self.available_filters['doc_types'].add(metadata['doc_type'])
-                
-                # Sources
-                if metadata.get('source'):
-                    self.available_filters['sources'].add(metadata['source'])
-                
-                # Clinical topics
-                if metadata.get('clinical_topic'):
-                    self.available_filters['clinical_topics'].add(metadata['clinical_topic'])
-                
-                # Evidence levels
-                if metadata.get('evidence_level'):
-                    self.available_filters['evidence_levels'].add(metadata['evidence_level'])
-                
-                # Drugs
-                if metadata.get('drugs'):
-                    drugs = metadata['drugs'].split(',')
-                    for drug in drugs:
-                        self.available_filters['drugs'].add(drug.strip())
-                
-                # Treatment phases
-                if metadata.get('treatment_phases'):
-                    phases = metadata['treatment_phases'].split(',')
-                    for phase in phases:
-                        self.available_filters['treatment_phases'].add(phase.strip())
-                
-                # Patient populations
-                if metadata.get('patient_population'):
-                    self.available_filters['patient_populations'].add(metadata['patient_population'])
-                
-                # Toxicity grades
-                if metadata.get('toxicity_grades'):
-                    self.available_filters['toxicity_grades'].add(metadata['toxicity_grades'])
-        
-        # Convert sets to sorted lists for consistent display
-        for key in self.available_filters:
-            self.available_filters[key] = sorted(list(self.available_filters[key]))
     
     def _init_filter_hierarchies(self):
         """Initialize filter hierarchies and relationships."""
@@ -133,6 +248,7 @@ class EnhancedMetadataFilter:
     
     def get_available_filters(self) -> Dict[str, List[str]]:
         """Get all available filter options."""
+        self._check_index_version()
         return {
             'document_types': self.available_filters['doc_types'],
             'sources': self.available_filters['sources'],
@@ -146,39 +262,37 @@ class EnhancedMetadataFilter:
     
     def build_metadata_query(self, filters: Dict[str, Any]) -> Dict[str, Any]:
         """Build ChromaDB metadata query from filter specifications."""
-        where_conditions = {}
+        where_conditions = []
         
         # Document type filter
         if filters.get('doc_type'):
             doc_types = filters['doc_type'] if isinstance(filters['doc_type'], list) else [filters['doc_type']]
             if len(doc_types) == 1:
-                where_conditions['doc_type'] = {'$eq': doc_types[0]}
+                where_conditions.append({'doc_type': {'$eq': doc_types[0]}})
             else:
-                where_conditions['doc_type'] = {'$in': doc_types}
+                where_conditions.append({'doc_type': {'$in': doc_types}})
         
         # Source filter
         if filters.get('source'):
             sources = filters['source'] if isinstance(filters['source'], list) else [filters['source']]
             if len(sources) == 1:
-                where_conditions['source'] = {'$eq': sources[0]}
+                where_conditions.append({'source': {'$eq': sources[0]}})
             else:
-                where_conditions['source'] = {'$in': sources}
+                where_conditions.append({'source': {'$in': sources}})
         
         # Clinical topic filter
         if filters.get('clinical_topic'):
             topics = filters['clinical_topic'] if isinstance(filters['clinical_topic'], list) else [filters['clinical_topic']]
             if len(topics) == 1:
-                where_conditions['clinical_topic'] = {'$eq': topics[0]}
+                where_conditions.append({'clinical_topic': {'$eq': topics[0]}})
             else:
-                where_conditions['clinical_topic'] = {'$in': topics}
+                where_conditions.append({'clinical_topic': {'$in': topics}})
         
-        # Evidence level filter
+        # Evidence level filter (boolean evidence_* flags)
         if filters.get('evidence_level'):
-            levels = filters['evidence_level'] if isinstance(filters['evidence_level'], list) else [filters['evidence_level']]
-            if len(levels) == 1:
-                where_conditions['evidence_level'] = {'$eq': levels[0]}
-            else:
-                where_conditions['evidence_level'] = {'$in': levels}
+            condition = _flag_condition(filters['evidence_level'], EVIDENCE_FLAGS)
+            if condition:
+                where_conditions.append(condition)
         
         # Drug filter (handle synonyms)
         if filters.get('drug'):
@@ -186,23 +300,22 @@ class EnhancedMetadataFilter:
             # Use post-processing for drug filtering since it may contain multiple drugs
             pass
         
-        # Treatment phase filter
+        # Treatment phase filter (boolean treatment_phase_* flags)
         if filters.get('treatment_phase'):
-            phases = filters['treatment_phase'] if isinstance(filters['treatment_phase'], list) else [filters['treatment_phase']]
-            if len(phases) == 1:
-                where_conditions['treatment_phases'] = {'$eq': phases[0]}
-            else:
-                where_conditions['treatment_phases'] = {'$in': phases}
+            condition = _flag_condition(filters['treatment_phase'], TREATMENT_PHASE_FLAGS)
+            if condition:
+                where_conditions.append(condition)
         
-        # Patient population filter
+        # Patient population filter (boolean population_* flags)
         if filters.get('patient_population'):
-            pops = filters['patient_population'] if isinstance(filters['patient_population'], list) else [filters['patient_population']]
-            if len(pops) == 1:
-                where_conditions['patient_population'] = {'$eq': pops[0]}
-            else:
-                where_conditions['patient_population'] = {'$in': pops}
+            condition = _flag_condition(filters['patient_population'], POPULATION_FLAGS)
+            if condition:
+                where_conditions.append(condition)
+        
+        # Numeric dose, schedule, grade and laboratory ranges
+        where_conditions.extend(range_conditions(filters))
         
-        return where_conditions if where_conditions else None
+        return combine_conditions(where_conditions)
     
     def _expand_drug_variants(self, drug_input: str) -> List[str]:
         """Expand drug names to include variants and synonyms."""
@@ -246,7 +359,7 @@ class EnhancedMetadataFilter:
                     include_result = False
             
             # Apply toxicity grade filter
-            if filters.get('toxicity_grade') and include_result:
+            if isinstance(filters.get('toxicity_grade'), str) and include_result:
                 required_grade = filters['toxicity_grade'].lower()
                 doc_grades = metadata.get('toxicity_grades', '').lower()
                 if required_grade not in doc_grades and required_grade not in doc.lower():
@@ -395,6 +508,7 @@ class EnhancedMetadataFilter:
         stats = {}
         
         # Get total document count
+        self._check_index_version()
         total_docs = self.collection.count()
         stats['total_documents'] = total_docs
         
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Micro-Batching Scheduler for GBM Clinical Query Interface
+Collects clinician queries arriving within a few milliseconds of each other and
+answers them with one batched query encode and one batched cross-encoder pass,
+routing each result back to its caller
+Author: Chetanya Pandey
+"""
+
+import time
+import queue
+import asyncio
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# Stops the scheduler thread once the requests queued before it are answered
+_STOP = object()
+
+
+class BatchMetrics:
+    def __init__(self, history: int = 10000):
+        """
+        Track batch sizes and how long requests waited to be batched.
+
+        Args:
+            history: Most recent requests/batches kept for percentiles
+        """
+        self.batches = 0
+        self.requests = 0
+        self.cancelled = 0
+        self.batch_sizes = Counter()
+        self.queue_waits_ms = deque(maxlen=history)
+        self.batch_ms = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def record(self, queue_waits: List[float], batch_seconds: float) -> None:
+        """Record one batch: each request's wait in the queue and the batch's run time (seconds)."""
+        with self._lock:
+            self.batches += 1
+            self.requests += len(queue_waits)
+            self.batch_sizes[len(queue_waits)] += 1
+            self.queue_waits_ms.extend(wait * 1000 for wait in queue_waits)
+            self.batch_ms.append(batch_seconds * 1000)
+
+    def record_cancelled(self, count: int) -> None:
+        with self._lock:
+            self.cancelled += count
+
+    @staticmethod
+    def _percentiles(values: List[float]) -> Dict[str, float]:
+        if not values:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {'p50': round(float(p50), 3), 'p95': round(float(p95), 3),
+                'p99': round(float(p99), 3), 'max': round(float(max(values)), 3)}
+
+    def report(self) -> Dict[str, Any]:
+        """Summarize batch sizes, queue waits and batch run times."""
+        with self._lock:
+            queue_waits = list(self.queue_waits_ms)
+            batch_ms = list(self.batch_ms)
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+            batches, requests, cancelled = self.batches, self.requests, self.cancelled
+        return {
+            'batches': batches,
+            'requests': requests,
+            'cancelled': cancelled,
+            'mean_batch_size': round(requests / batches, 2) if batches else 0.0,
+            'batch_size_histogram': batch_sizes,
+            'queue_wait_ms': self._percentiles(queue_waits),
+            'batch_ms': self._percentiles(batch_ms)
+        }
+
+
+class MicroBatchScheduler:
+    def __init__(self, interface, window_ms: float = 5.0, max_batch_size: int = 32):
+        """
+        Initialize the scheduler and start its batching thread.
+
+        Args:
+            interface: ClinicalQueryInterface answering the batches (only the
+                scheduler thread calls it)
+            window_ms: How long after the first queued request to wait for others
+                (0 batches only what is already queued)
+            max_batch_size: Requests per batch; a full batch runs without waiting
+                out the window
+        """
+        self.interface = interface
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.metrics = BatchMetrics()
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='gbm-micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, n_results: int = 5, metadata_filters: Dict[str, Any] = None,
+               drug_filter: str = None, section_filter: str = None, hybrid: bool = None) -> Future:
+        """Queue a query; the returned future resolves to its query_clinical_data result."""
+        if self._closed:
+            raise RuntimeError("Micro-batch scheduler is closed")
+        future = Future()
+        request = {
+            'query': query,
+            'n_results': n_results,
+            'metadata_filters': metadata_filters,
+            'drug_filter': drug_filter,
+            'section_filter': section_filter,
+            'hybrid': hybrid
+        }
+        self._queue.put((time.perf_counter(), request, future))
+        return future
+
+    def query_clinical_data(self, query: str, n_results: int = 5, metadata_filters: Dict[str, Any] = None,
+                            drug_filter: str = None, section_filter: str = None, hybrid: bool = None,
+                            timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Blocking query through the scheduler ({'error': ...} if it times out)."""
+        future = self.submit(query, n_results, metadata_filters, drug_filter, section_filter, hybrid)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # Dropped from its batch if that has not started yet
+            future.cancel()
+            return {'error': f"Query timed out after {timeout}s"}
+
+    async def aquery_clinical_data(self, query: str, n_results: int = 5, metadata_filters: Dict[str, Any] = None,
+                                   drug_filter: str = None, section_filter: str = None,
+                                   hybrid: bool = None) -> Dict[str, Any]:
+        """Awaitable query through the scheduler; cancelling it drops the request if its batch has not started."""
+        future = self.submit(query, n_results, metadata_filters, drug_filter, section_filter, hybrid)
+        return await asyncio.wrap_future(future)
+
+    def _collect(self) -> List[Any]:
+        """Block for the next request, then gather others until the window closes or the batch is full."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [first]
+        batch = [first]
+        deadline = first[0] + self.window_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+
+            # Callers that timed out or were cancelled while queued are skipped
+            live = [(submitted, request, future) for submitted, request, future in batch
+                    if future.set_running_or_notify_cancel()]
+            if len(live) < len(batch):
+                self.metrics.record_cancelled(len(batch) - len(live))
+
+            if live:
+                started = time.perf_counter()
+                try:
+                    results = self.interface.query_clinical_data_batch([request for _, request, _ in live])
+                except Exception as e:
+                    results = [{'error': str(e)} for _ in live]
+                self.metrics.record([started - submitted for submitted, _, _ in live],
+                                    time.perf_counter() - started)
+                for (_, _, future), result in zip(live, results):
+                    future.set_result(result)
+
+            if stop:
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        report = self.metrics.report()
+        report['window_ms'] = self.window_seconds * 1000
+        report['max_batch_size'] = self.max_batch_size
+        report['queued'] = self._queue.qsize()
+        return report
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Answer the requests already queued, then stop the scheduler thread."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def __enter__(self) -> 'MicroBatchScheduler':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
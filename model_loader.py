@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Model Loading for GBM Clinical Query System
+Remembers which candidate model of each kind last loaded successfully, and loads
+models lazily or on a background thread with a warm-up inference, so interfaces
+start without waiting on (or retrying) remote model downloads
+Author: Chetanya Pandey
+"""
+
+import os
+import json
+import time
+import threading
+from typing import List, Dict, Any, Optional, Callable
+
+MODEL_CHOICE_FILENAME = "model_choice.json"
+
+
+class ModelChoice:
+    def __init__(self, cache_dir: str = "embedding_cache"):
+        """
+        Initialize the record of the last successfully loaded model of each kind.
+
+        Args:
+            cache_dir: Directory holding the record (shared with the embedding cache)
+        """
+        self.path = os.path.join(cache_dir, MODEL_CHOICE_FILENAME)
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, kind: str) -> Optional[str]:
+        record = self._read().get(kind)
+        return record.get('model') if isinstance(record, dict) else None
+
+    def order(self, kind: str, candidates: List[str]) -> List[str]:
+        """Return the candidates with the last successful choice first (even if it is not listed)."""
+        chosen = self.get(kind)
+        if not chosen:
+            return list(candidates)
+        return [chosen] + [name for name in candidates if name != chosen]
+
+    def record(self, kind: str, model_name: str) -> None:
+        """Remember a model that loaded successfully."""
+        with self._lock:
+            data = self._read()
+            if (data.get(kind) or {}).get('model') == model_name:
+                return
+            data[kind] = {'model': model_name, 'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"⚠️ Could not record model choice: {e}")
+
+
+class LazyModel:
+    def __init__(self, kind: str, candidates: List[str], load: Callable[[str], Any],
+                 choice: Optional[ModelChoice] = None, warm_up: Optional[Callable[[Any], None]] = None,
+                 description: str = "model", fallback: str = "continuing without it"):
+        """
+        Initialize a model that is resolved on first use or on a background thread.
+
+        Args:
+            kind: Key of the model in the choice record ('embedding', 'cross_encoder')
+            candidates: Model names to try, in order of preference
+            load: Loads a model by name (raising if it cannot)
+            choice: Record of the last successful choice, tried first
+            warm_up: Runs a first inference so the first real query does not pay for it
+            description: Name used in progress messages
+            fallback: What happens if no candidate loads, for the failure message
+        """
+        self.kind = kind
+        self.candidates = candidates
+        self.choice = choice
+        self._load = load
+        self._warm_up = warm_up
+        self.description = description
+        self.fallback = fallback
+
+        self.model = None
+        self.name = None
+        self.load_seconds = None
+        self._resolved = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def resolved(self) -> bool:
+        return self._resolved
+
+    def status(self) -> str:
+        if self._resolved:
+            return f"{self.name} ({self.load_seconds:.1f}s)" if self.model is not None else "unavailable"
+        return "loading" if self._thread is not None else "not loaded"
+
+    def start_background(self) -> None:
+        """Resolve the model on a daemon thread; get() waits for it."""
+        if self._thread is None and not self._resolved:
+            self._thread = threading.Thread(target=self.get, name=f"load-{self.kind}", daemon=True)
+            self._thread.start()
+
+    def get(self) -> Optional[Any]:
+        """Return the model (None if no candidate loads), loading it now if needed."""
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    self._resolve()
+        return self.model
+
+    def _resolve(self) -> None:
+        started = time.perf_counter()
+        names = self.choice.order(self.kind, self.candidates) if self.choice else list(self.candidates)
+        for model_name in names:
+            try:
+                model = self._load(model_name)
+            except Exception:
+                continue
+            if self._warm_up:
+                try:
+                    self._warm_up(model)
+                except Exception as e:
+                    print(f"⚠️ Warm-up of {model_name} failed: {e}")
+            self.model = model
+            self.name = model_name
+            if self.choice:
+                self.choice.record(self.kind, model_name)
+            break
+
+        self.load_seconds = time.perf_counter() - started
+        self._resolved = True
+        if self.model is not None:
+            print(f"✅ Loaded {self.description}: {self.name} ({self.load_seconds:.1f}s)")
+        else:
+            print(f"❌ Failed to load {self.description}, {self.fallback}")
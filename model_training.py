@@ -17,23 +17,23 @@ import random
 from sklearn.model_selection import train_test_split
 import torch
 from torch.utils.data import DataLoader
+from index_versions import resolve_index_dir
+from sharded_collection import open_collection
 
 class ClinicalRerankerTrainer:
     def __init__(self, db_dir: str = "vector_db"):
         """Initialize the clinical re-ranker trainer."""
-        self.db_dir = db_dir
+        # Train against the published index version
+        self.db_dir = resolve_index_dir(db_dir)
         
         # Connect to existing ChromaDB
         self.chroma_client = chromadb.PersistentClient(
-            path=db_dir,
+            path=self.db_dir,
             settings=Settings(anonymized_telemetry=False)
         )
         
-        # Get the collection
-        try:
-            self.collection = self.chroma_client.get_collection("gbm_clinical_medical_embeddings")
-        except:
-            self.collection = self.chroma_client.get_collection("gbm_clinical_data")
+        # Get the collection (or its shards)
+        self.collection = open_collection(self.chroma_client, self.db_dir)
         
         print(f"✅ Connected to database with {self.collection.count()} documents")
         
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Chunk Collapsing for GBM Clinical Vector Database
+MinHash signatures with LSH banding find near-identical chunks across the
+overlapping prescribing-information versions so only one canonical copy is indexed
+Author: Chetanya Pandey
+"""
+
+import os
+import re
+import json
+import zlib
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+DUPLICATES_FILENAME = "near_duplicates.json"
+DUPLICATES_VERSION = 1
+
+# Prime just above 2^32 so every 32-bit shingle hash is a valid residue
+_PRIME = np.uint64((1 << 32) + 15)
+
+
+def _shingles(text: str, size: int) -> List[str]:
+    """Word n-grams of lowercased text (the whole text if it is shorter than one shingle)."""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) <= size:
+        return [' '.join(words)]
+    return [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class NearDuplicateIndex:
+    def __init__(self, db_dir: Optional[str] = None, num_perm: int = 64, bands: int = 16,
+                 threshold: float = 0.85, shingle_size: int = 5, seed: int = 42):
+        """
+        Initialize the near-duplicate index.
+
+        Args:
+            db_dir: Directory to persist the index in (None keeps it in memory only)
+            num_perm: Number of MinHash permutations per signature
+            bands: Number of LSH bands (num_perm must divide evenly)
+            threshold: Estimated Jaccard similarity at or above which chunks are collapsed
+            shingle_size: Words per shingle
+            seed: Seed for the permutation coefficients
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.path = os.path.join(db_dir, DUPLICATES_FILENAME) if db_dir else None
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+        # chunk_id -> {'signature': [...], 'filename': str, 'source': str}
+        self.canonicals: Dict[str, Dict[str, Any]] = {}
+        # chunk_id -> {'canonical': chunk_id, 'signature': [...], 'chunk': {...}}
+        self.duplicates: Dict[str, Dict[str, Any]] = {}
+        # canonical chunk_id -> IDs of the duplicates collapsed into it
+        self.collapsed: Dict[str, set] = {}
+        # (band, band hash) -> canonical chunk IDs
+        self.buckets: Dict[Tuple[int, int], set] = {}
+
+        # True once state has been restored from disk
+        self.restored = False
+        self.load()
+
+    def signature(self, text: str) -> np.ndarray:
+        """Compute the MinHash signature of a chunk's text."""
+        hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in _shingles(text, self.shingle_size)],
+                          dtype=np.uint64)
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature) -> List[Tuple[int, int]]:
+        sig = [int(v) for v in signature]
+        return [(band, hash(tuple(sig[band * self.rows:(band + 1) * self.rows])))
+                for band in range(self.bands)]
+
+    def _add_canonical(self, chunk_id: str, signature, filename: str, source: str) -> None:
+        self.canonicals[chunk_id] = {
+            'signature': [int(v) for v in signature],
+            'filename': filename,
+            'source': source
+        }
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, set()).add(chunk_id)
+
+    def _drop_canonical(self, chunk_id: str) -> None:
+        entry = self.canonicals.pop(chunk_id)
+        for key in self._band_keys(entry['signature']):
+            bucket = self.buckets.get(key)
+            if bucket:
+                bucket.discard(chunk_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def _add_duplicate(self, chunk_id: str, entry: Dict[str, Any]) -> None:
+        if chunk_id in self.duplicates:
+            self._pop_duplicate(chunk_id)
+        self.duplicates[chunk_id] = entry
+        self.collapsed.setdefault(entry['canonical'], set()).add(chunk_id)
+
+    def _pop_duplicate(self, chunk_id: str) -> Dict[str, Any]:
+        entry = self.duplicates.pop(chunk_id)
+        siblings = self.collapsed.get(entry['canonical'])
+        if siblings is not None:
+            siblings.discard(chunk_id)
+            if not siblings:
+                del self.collapsed[entry['canonical']]
+        return entry
+
+    def find_canonical(self, signature) -> Optional[str]:
+        """Return the most similar canonical chunk at or above the threshold, if any."""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates |= self.buckets.get(key, set())
+
+        best_id, best_similarity = None, self.threshold
+        signature = np.asarray(signature, dtype=np.uint64)
+        for candidate in sorted(candidates):
+            similarity = float(np.mean(signature == np.asarray(self.canonicals[candidate]['signature'],
+                                                               dtype=np.uint64)))
+            if similarity >= best_similarity:
+                best_id, best_similarity = candidate, similarity
+        return best_id
+
+    def assign(self, chunk: Dict[str, Any]) -> Optional[str]:
+        """
+        Register a chunk, returning the canonical chunk ID it collapses into.
+
+        Returns None when the chunk is new content and becomes canonical itself.
+        """
+        signature = self.signature(chunk['content'])
+        canonical_id = self.find_canonical(signature)
+        if canonical_id is None or canonical_id == chunk['chunk_id']:
+            self._add_canonical(chunk['chunk_id'], signature, chunk['filename'], chunk['source'])
+            return None
+
+        self._add_duplicate(chunk['chunk_id'], {
+            'canonical': canonical_id,
+            'signature': [int(v) for v in signature],
+            'chunk': chunk
+        })
+        return canonical_id
+
+    def remove(self, chunk_id: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Forget a chunk that was deleted or is about to be re-assigned.
+
+        Returns:
+            (duplicate chunks promoted to canonical that must now be stored,
+             canonical IDs whose alternate sources changed)
+        """
+        if chunk_id in self.duplicates:
+            return [], [self._pop_duplicate(chunk_id)['canonical']]
+        if chunk_id not in self.canonicals:
+            return [], []
+
+        self._drop_canonical(chunk_id)
+
+        # Re-assign the orphaned duplicates; the first to find no match is promoted
+        orphans = sorted(self.collapsed.get(chunk_id, ()))
+        promoted, touched = [], []
+        for dup_id in orphans:
+            entry = self._pop_duplicate(dup_id)
+            canonical_id = self.find_canonical(entry['signature'])
+            if canonical_id is None:
+                chunk = entry['chunk']
+                self._add_canonical(dup_id, entry['signature'], chunk['filename'], chunk['source'])
+                promoted.append(chunk)
+            else:
+                entry['canonical'] = canonical_id
+                self._add_duplicate(dup_id, entry)
+                touched.append(canonical_id)
+        return promoted, touched
+
+    def alternate_sources(self, chunk_id: str) -> List[str]:
+        """List 'source (filename)' for every duplicate collapsed into a canonical chunk."""
+        alternates = []
+        for dup_id in sorted(self.collapsed.get(chunk_id, ())):
+            chunk = self.duplicates[dup_id]['chunk']
+            alternates.append(f"{chunk['source']} ({chunk['filename']})")
+        return list(dict.fromkeys(alternates))
+
+    def is_duplicate(self, chunk_id: str) -> bool:
+        """Check whether a chunk is currently collapsed into another."""
+        return chunk_id in self.duplicates
+
+    def stats(self) -> Dict[str, Any]:
+        """Report how much collapsing shrank the index."""
+        total = len(self.canonicals) + len(self.duplicates)
+        return {
+            'chunks_total': total,
+            'chunks_indexed': len(self.canonicals),
+            'chunks_collapsed': len(self.duplicates),
+            'shrink_ratio': round(len(self.duplicates) / total, 4) if total else 0.0
+        }
+
+    def clear(self) -> None:
+        """Forget all chunks (used for full rebuilds)."""
+        self.canonicals = {}
+        self.duplicates = {}
+        self.collapsed = {}
+        self.buckets = {}
+
+    def load(self) -> None:
+        """Load the persisted index, starting empty if missing, unreadable or built with other settings."""
+        self.clear()
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != DUPLICATES_VERSION or data.get('settings') != self._settings():
+                print("⚠️ Ignoring near-duplicate index built with different settings")
+                return
+            for chunk_id, entry in data.get('canonicals', {}).items():
+                self._add_canonical(chunk_id, entry['signature'], entry['filename'], entry['source'])
+            for chunk_id, entry in data.get('duplicates', {}).items():
+                self._add_duplicate(chunk_id, entry)
+            self.restored = True
+        except Exception as e:
+            print(f"⚠️ Could not read near-duplicate index {self.path}: {e}")
+            self.clear()
+
+    def save(self) -> None:
+        """Atomically write the index to disk."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': DUPLICATES_VERSION,
+                'settings': self._settings(),
+                'canonicals': self.canonicals,
+                'duplicates': self.duplicates
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def _settings(self) -> Dict[str, Any]:
+        return {
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'threshold': self.threshold,
+            'shingle_size': self.shingle_size,
+            'seed': self.seed
+        }
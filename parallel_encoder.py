@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Multi-Process Embedding Encoder for GBM Clinical Vector Database
+Spreads SentenceTransformer encoding across a pool of CPU worker processes
+Author: Chetanya Pandey
+"""
+
+import os
+import time
+import threading
+import multiprocessing as mp
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from length_batching import PaddingStats, plan_length_batches, track_padding
+
+# Model instance owned by each worker process, and the padding of its forward passes
+_worker_model = None
+_worker_padding = None
+
+
+def _init_worker(model_name: str, threads_per_worker: int) -> None:
+    """Load the embedding model once per worker process."""
+    global _worker_model, _worker_padding
+
+    # Keep each worker on its own cores instead of oversubscribing the machine
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name, device='cpu')
+    _worker_padding = PaddingStats()
+    track_padding(_worker_model, _worker_padding)
+
+
+def _encode_batch(texts: List[str]) -> Tuple[np.ndarray, int, float, tuple]:
+    """Encode one batch inside a worker and report which process did the work and its padding."""
+    before = _worker_padding.counts()
+    start = time.perf_counter()
+    vectors = _worker_model.encode(
+        texts,
+        batch_size=len(texts),
+        show_progress_bar=False,
+        convert_to_numpy=True
+    )
+    seconds = time.perf_counter() - start
+    padding = tuple(after - prior for after, prior in zip(_worker_padding.counts(), before))
+    return vectors, os.getpid(), seconds, padding
+
+
+class PendingEncode:
+    def __init__(self, encoder: 'ParallelEncoder', batches: List[List[int]], stats: Optional[PaddingStats]):
+        """
+        Vectors of texts queued on the pool, filled in as worker batches finish.
+
+        Args:
+            encoder: Pool the batches run on (its counters are updated as they finish)
+            batches: Text indices of each worker batch
+            stats: Optional PaddingStats to accumulate the workers' tokens used versus padded
+        """
+        self._encoder = encoder
+        self._stats = stats
+        self._remaining = len(batches)
+        self._total = sum(len(batch) for batch in batches)
+        self._vectors = None
+        self._error = None
+        self._done = threading.Event()
+        if not batches:
+            self._done.set()
+
+    # Callbacks run on the pool's result handler thread, one at a time
+    def _batch_done(self, batch: List[int], outcome: Tuple[np.ndarray, int, float, tuple]) -> None:
+        vectors, worker_pid, seconds, padding = outcome
+        if self._vectors is None:
+            self._vectors = np.zeros((self._total, vectors.shape[1]), dtype=np.float32)
+        self._vectors[batch] = vectors
+        if self._stats is not None:
+            self._stats.add(*padding)
+        self._encoder._batch_finished(len(vectors), worker_pid, seconds)
+        self._finish_one()
+
+    def _batch_failed(self, error: BaseException) -> None:
+        self._error = self._error or error
+        self._encoder._batch_finished(0, None, 0.0)
+        self._finish_one()
+
+    def _finish_one(self) -> None:
+        self._remaining -= 1
+        if not self._remaining:
+            self._done.set()
+
+    def result(self) -> np.ndarray:
+        """Wait for every batch and return the vectors in the original text order."""
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._vectors if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+
+
+class ParallelEncoder:
+    def __init__(self, model_name: str, num_workers: Optional[int] = None,
+                 worker_batch_size: int = 16, threads_per_worker: int = 1):
+        """
+        Initialize a pool of encoding worker processes.
+
+        Args:
+            model_name: SentenceTransformer model each worker loads
+            num_workers: Number of worker processes (defaults to the CPU count)
+            worker_batch_size: Number of texts sent to a worker per task
+            threads_per_worker: Torch intra-op threads per worker
+        """
+        self.model_name = model_name
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.worker_batch_size = worker_batch_size
+        self.threads_per_worker = threads_per_worker
+        self.pool = None
+
+        # Throughput counters accumulated across encode() calls; wall time counts
+        # only while the pool has batches queued or running
+        self.texts_encoded = 0
+        self.wall_seconds = 0.0
+        self.worker_seconds = 0.0
+        self.texts_per_worker: Dict[int, int] = {}
+        self._in_flight = 0
+        self._busy_since = 0.0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the worker pool (spawned so each worker gets a clean torch runtime)."""
+        if self.pool is not None:
+            return
+
+        print(f"🧵 Starting {self.num_workers} embedding workers for {self.model_name}")
+        ctx = mp.get_context('spawn')
+        self.pool = ctx.Pool(
+            processes=self.num_workers,
+            initializer=_init_worker,
+            initargs=(self.model_name, self.threads_per_worker)
+        )
+
+    def close(self) -> None:
+        """Shut down the worker pool."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, texts: List[str], stats: Optional[PaddingStats] = None) -> PendingEncode:
+        """
+        Queue texts on the pool without waiting for them.
+
+        The caller keeps working (storing the previous batch, chunking the next)
+        while workers encode; PendingEncode.result() returns the vectors.
+
+        Args:
+            texts: Texts to encode
+            stats: Optional PaddingStats to accumulate the workers' tokens used versus padded
+        """
+        # Length-sorted batches keep similar-length texts together in each worker call
+        batches = plan_length_batches(texts, self.worker_batch_size)
+        pending = PendingEncode(self, batches, stats)
+        if not batches:
+            return pending
+
+        self.start()
+        with self._lock:
+            if not self._in_flight:
+                self._busy_since = time.perf_counter()
+            self._in_flight += len(batches)
+        for batch in batches:
+            self.pool.apply_async(_encode_batch, ([texts[i] for i in batch],),
+                                  callback=partial(pending._batch_done, batch),
+                                  error_callback=pending._batch_failed)
+        return pending
+
+    def encode(self, texts: List[str], stats: Optional[PaddingStats] = None) -> np.ndarray:
+        """Encode texts across the pool and return vectors in the original order."""
+        return self.submit(texts, stats).result()
+
+    def _batch_finished(self, texts: int, worker_pid: Optional[int], seconds: float) -> None:
+        with self._lock:
+            self.texts_encoded += texts
+            self.worker_seconds += seconds
+            if worker_pid is not None:
+                self.texts_per_worker[worker_pid] = self.texts_per_worker.get(worker_pid, 0) + texts
+            self._in_flight -= 1
+            if not self._in_flight:
+                self.wall_seconds += time.perf_counter() - self._busy_since
+
+    def throughput_report(self) -> Dict[str, Any]:
+        """Summarize measured encoding throughput and worker utilization."""
+        texts_per_second = self.texts_encoded / self.wall_seconds if self.wall_seconds else 0.0
+        capacity_seconds = self.wall_seconds * self.num_workers
+        return {
+            'num_workers': self.num_workers,
+            'worker_batch_size': self.worker_batch_size,
+            'texts_encoded': self.texts_encoded,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'texts_per_second': round(texts_per_second, 2),
+            # Share of worker time spent encoding while the pool had work queued
+            'utilization': round(self.worker_seconds / capacity_seconds, 4) if capacity_seconds else 0.0,
+            'texts_per_worker': dict(self.texts_per_worker)
+        }
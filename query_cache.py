@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Query-Side Caches for GBM Clinical Query Interface
+Bounded in-memory LRU caches with hit/miss counters for repeated clinician queries,
+and a query result cache with TTL and an optional on-disk tier
+Author: Chetanya Pandey
+"""
+
+import os
+import re
+import json
+import time
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class LRUCache:
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = None):
+        """
+        Initialize a thread-safe least-recently-used cache.
+
+        Args:
+            max_size: Maximum number of entries kept (0 disables caching)
+            ttl_seconds: Entries older than this are treated as misses (None keeps them forever)
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # key -> (stored_at, value)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value (marking it most recently used), or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, stored_at: Optional[float] = None) -> None:
+        """
+        Store a value, evicting the least recently used entries beyond max_size.
+
+        stored_at (default now) is when the value was computed, so a value restored
+        from elsewhere keeps its age for the TTL.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() if stored_at is None else stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size, hit/miss/eviction counts and hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize query text so whitespace differences share a cache entry.
+
+    Case is kept: query expansion and the cross-encoder are case-sensitive, so
+    "ANC" and "anc" can expand and score differently.
+    """
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+def _json_default(value: Any) -> Any:
+    """Serialize numpy scores and arrays found in query results."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResultCache:
+    def __init__(self, max_size: int = 256, ttl_seconds: Optional[float] = 3600,
+                 disk_dir: Optional[str] = None, max_disk_entries: int = 10000):
+        """
+        Initialize the query result cache.
+
+        Args:
+            max_size: Results kept in memory
+            ttl_seconds: Age after which a result is recomputed (None never expires)
+            disk_dir: Directory of the optional on-disk tier that survives restarts
+            max_disk_entries: Results kept on disk before the oldest are removed
+        """
+        self.memory = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.disk_hits = 0
+        self._disk_writes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(query: str, n_results: int, drug_filter: Optional[str], section_filter: Optional[str],
+                 metadata_filters: Optional[Dict[str, Any]], index_fingerprint: str,
+                 options: Optional[Dict[str, Any]] = None) -> str:
+        """Key a result by everything that determines it, including the index it came from and retrieval options."""
+        key = [normalize_query(query), n_results, drug_filter, section_filter, metadata_filters, index_fingerprint]
+        if options:
+            key.append(options)
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached result from memory, then disk, or None."""
+        result = self.memory.get(key)
+        if result is None and self.disk_dir:
+            entry = self._disk_get(key)
+            if entry is not None:
+                self.disk_hits += 1
+                # Promoted with its original age, so it still expires ttl_seconds after it was computed
+                stored_at, result = entry
+                self.memory.put(key, result, stored_at=stored_at)
+        return copy.deepcopy(result) if result is not None else None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Cache a copy of a result in memory and, if configured, on disk."""
+        result = copy.deepcopy(result)
+        self.memory.put(key, result)
+        if self.disk_dir:
+            self._disk_put(key, result)
+
+    def clear(self) -> None:
+        """Drop the in-memory tier (disk entries are keyed by index fingerprint and simply stop matching)."""
+        self.memory.clear()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Return (stored_at, result) for an unexpired disk entry, or None."""
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        stored_at = entry.get('stored_at', 0)
+        if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        result = entry.get('result')
+        return (stored_at, result) if result is not None else None
+
+    def _disk_put(self, key: str, result: Dict[str, Any]) -> None:
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'stored_at': time.time(), 'result': result}, f, default=_json_default)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            print(f"⚠️ Could not write result cache entry: {e}")
+            return
+
+        # Trim the oldest entries every so often rather than listing the directory on every write
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self.prune_disk()
+
+    def prune_disk(self) -> int:
+        """Remove expired entries and the oldest beyond max_disk_entries; returns the number removed."""
+        if not self.disk_dir:
+            return 0
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.json'):
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort()
+
+        now = time.time()
+        excess = len(entries) - self.max_disk_entries
+        removed = 0
+        for i, (mtime, path) in enumerate(entries):
+            expired = self.ttl_seconds is not None and now - mtime > self.ttl_seconds
+            if i < excess or expired:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        report = self.memory.stats()
+        report['disk_hits'] = self.disk_hits
+        report['disk_enabled'] = bool(self.disk_dir)
+        return report
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Metadata Re-ranking Features for GBM Clinical Vector Database
+Per-chunk feature vectors (clinical topic class, drug, toxicity grade, lab value and
+evidence flags, document type family) computed once at ingest from the stored metadata,
+so metadata boosts for hundreds of candidates are one matrix-vector product against the
+query's features
+Author: Chetanya Pandey
+"""
+
+import os
+import re
+import json
+from typing import List, Dict, Any, Iterable
+
+import numpy as np
+from sharded_collection import DOC_TYPE_FAMILY_NAMES, doc_type_family
+
+FEATURES_FILENAME = "rerank_features.json"
+FEATURES_VERSION = 2
+
+# Stored clinical_topic (ClinicalMetadataExtractor._classify_topic) -> topic class
+CLINICAL_TOPIC_CLASSES = {
+    'Dosing Protocol': 'dosing',
+    'Maintenance Dosing': 'dosing',
+    'Concomitant Dosing': 'dosing',
+    'Dose Modifications': 'dosing',
+    'Toxicity Profile': 'toxicity',
+    'Hematologic Toxicity': 'toxicity',
+    'Cardiovascular Toxicity': 'toxicity',
+    'Treatment Mortality': 'toxicity',
+    'Clinical Monitoring': 'monitoring',
+    'Drug Administration': 'administration',
+    'Clinical Protocol': 'protocol'
+}
+
+# Topic class -> query terms that make chunks on that topic more relevant
+TOPIC_KEYWORDS = {
+    'dosing': ['dose', 'dosing', 'mg/m²', 'mg/m2', 'mg/kg', 'regimen', 'schedule'],
+    'toxicity': ['toxicity', 'toxicities', 'side effect', 'adverse', 'neutropenia', 'thrombocytopenia',
+                 'hypertension', 'mortality'],
+    'monitoring': ['monitor', 'cbc', 'lab', 'labs', 'laboratory', 'blood count', 'blood pressure'],
+    'administration': ['give', 'administer', 'administration', 'infusion', 'oral', 'iv'],
+    'protocol': ['protocol', 'guideline', 'management', 'stupp']
+}
+TEMOZOLOMIDE_TERMS = ['temozolomide', 'tmz', 'temodar']
+BEVACIZUMAB_TERMS = ['bevacizumab', 'avastin']
+TOXICITY_TERMS = ['grade', 'toxicity', 'toxicities', 'adverse']
+LAB_TERMS = ['lab', 'labs', 'laboratory', 'cbc', 'monitor', 'platelet', 'neutrophil', 'anc', 'hemoglobin',
+             'blood count']
+
+# Abbreviations that only match as whole words ('lab' not 'label', 'anc' not 'ancillary');
+# other terms match the start of a word so 'monitor' still matches 'monitoring'
+WHOLE_WORD_TERMS = {'anc', 'cbc', 'iv', 'lab', 'labs', 'tmz', 'fda', 'nccn'}
+
+# Document type family (sharded_collection.DOC_TYPE_FAMILIES) -> query terms it answers best
+DOC_TYPE_KEYWORDS = {
+    'regulatory': ['dose', 'dosing', 'administration', 'prescribing', 'label', 'fda', 'contraindication',
+                   'warning'],
+    'guideline': ['guideline', 'nccn', 'recommend', 'standard of care'],
+    'trial': ['trial', 'survival', 'efficacy', 'outcome', 'study'],
+    'protocol': ['protocol', 'regimen', 'treatment', 'schedule', 'cycle'],
+    'reference': []
+}
+
+# Typed lab value fields written by clinical_extractor.typed_metadata
+LAB_FIELDS = ['anc_min', 'platelets_min', 'hemoglobin_min']
+
+# Boost added when a chunk feature matches the query
+DEFAULT_BOOST_WEIGHTS = {
+    'topic': 0.15,
+    'drug': 0.1,
+    'toxicity_grades': 0.08,
+    'laboratory_values': 0.08,
+    'fda_approved': 0.12,
+    'clinical_trial': 0.06,
+    'doc_type': 0.1
+}
+
+# Feature -> boost weight it carries. Topic and document type are one-hot, so at
+# most one of each fires. A chunk on both drugs matched by a query naming both
+# gets one drug boost, not two: 'drug_both' takes the second back off, which
+# keeps the boosts a single dot product.
+FEATURES = (
+    [(f"topic_{topic}", 'topic') for topic in TOPIC_KEYWORDS] +
+    [('drug_temozolomide', 'drug'), ('drug_bevacizumab', 'drug'), ('drug_both', '-drug'),
+     ('toxicity_grades', 'toxicity_grades'), ('laboratory_values', 'laboratory_values'),
+     ('evidence_fda_approved', 'fda_approved'), ('evidence_clinical_trial', 'clinical_trial')] +
+    [(f"doc_{family}", 'doc_type') for family in DOC_TYPE_FAMILY_NAMES]
+)
+FEATURE_NAMES = [name for name, _ in FEATURES]
+
+
+def _flag(metadata: Dict[str, Any], field: str) -> bool:
+    # Accept the legacy 'True' strings as well as real booleans
+    return metadata.get(field) in (True, 'True')
+
+
+def chunk_features(metadata: Dict[str, Any]) -> List[int]:
+    """Reduce a chunk's stored metadata to its 0/1 feature vector (in FEATURE_NAMES order)."""
+    topic_class = CLINICAL_TOPIC_CLASSES.get(metadata.get('clinical_topic'))
+    drugs = str(metadata.get('drugs') or '').lower()
+    family = doc_type_family(metadata.get('doc_type'))
+
+    temozolomide = 'temozolomide' in drugs or 'tmz' in drugs
+    bevacizumab = 'bevacizumab' in drugs
+    fda_approved = _flag(metadata, 'evidence_fda_approved')
+
+    values = [topic_class == topic for topic in TOPIC_KEYWORDS] + [
+        temozolomide, bevacizumab, temozolomide and bevacizumab,
+        bool(metadata.get('toxicity_grades')),
+        any(metadata.get(field) is not None for field in LAB_FIELDS),
+        # FDA approval outranks trial evidence; a chunk gets one evidence boost
+        fda_approved, not fda_approved and _flag(metadata, 'evidence_clinical_trial')
+    ] + [family == name for name in DOC_TYPE_FAMILY_NAMES]
+    return [int(value) for value in values]
+
+
+def _mentions(query_lower: str, terms: List[str]) -> bool:
+    """Whether any term starts a word of the query ('monitor' matches 'monitoring', 'iv' not 'give')."""
+    return any(re.search(r'(?<![a-z0-9])' + re.escape(term) + (r'(?![a-z0-9])' if term in WHOLE_WORD_TERMS else ''),
+                         query_lower)
+               for term in terms)
+
+
+def query_features(query: str) -> np.ndarray:
+    """The query's side of each feature: 1 where a matching chunk should be boosted."""
+    query_lower = query.lower()
+    temozolomide = _mentions(query_lower, TEMOZOLOMIDE_TERMS)
+    bevacizumab = _mentions(query_lower, BEVACIZUMAB_TERMS)
+
+    # Evidence level boosts apply to every query
+    values = [_mentions(query_lower, keywords) for keywords in TOPIC_KEYWORDS.values()] + [
+        temozolomide, bevacizumab, temozolomide and bevacizumab,
+        _mentions(query_lower, TOXICITY_TERMS), _mentions(query_lower, LAB_TERMS),
+        True, True
+    ] + [_mentions(query_lower, DOC_TYPE_KEYWORDS[name]) for name in DOC_TYPE_FAMILY_NAMES]
+    return np.array(values, dtype=float)
+
+
+def boost_weights(weights: Dict[str, float] = None) -> np.ndarray:
+    """
+    Per-feature weight vector.
+
+    Args:
+        weights: Boosts overriding DEFAULT_BOOST_WEIGHTS (keys as in that dict)
+    """
+    merged = dict(DEFAULT_BOOST_WEIGHTS)
+    for key, value in (weights or {}).items():
+        if key not in merged:
+            raise ValueError(f"Unknown boost weight '{key}' (expected one of {', '.join(merged)})")
+        merged[key] = float(value)
+    return np.array([-merged[boost[1:]] if boost.startswith('-') else merged[boost]
+                     for _, boost in FEATURES], dtype=float)
+
+
+def metadata_boosts(feature_matrix: np.ndarray, query_vector: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Boost of every candidate row: one product of the feature matrix with the weighted query features."""
+    return feature_matrix @ (weights * query_vector)
+
+
+def scale_to_range(scores: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """
+    Map scores linearly onto the range of reference scores, keeping their order.
+
+    Fused (RRF) scores of neighbouring ranks differ by about 0.01, so on their own
+    scale any metadata boost would override the fused ranking; spread over the
+    dense similarity range of the same candidates, boosts and the cascade margin
+    weigh them as they weigh 1 - distance.
+    """
+    scores = np.asarray(scores, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    if not len(scores):
+        return scores
+    low, high = float(reference.min()), float(reference.max())
+    span = float(scores.max() - scores.min())
+    if not span:
+        return np.full(len(scores), high)
+    return low + (scores - scores.min()) / span * (high - low)
+
+
+class RerankFeatures:
+    def __init__(self, db_dir: str):
+        """
+        Initialize the re-ranking feature sidecar.
+
+        Args:
+            db_dir: Directory of the ChromaDB database the features describe
+        """
+        self.path = os.path.join(db_dir, FEATURES_FILENAME)
+
+        # chunk_id -> chunk_features() vector
+        self.chunks: Dict[str, List[int]] = {}
+        self.load()
+
+    def add(self, chunk_id: str, metadata: Dict[str, Any]) -> None:
+        """Record a stored chunk's features, replacing those of its previous version."""
+        self.chunks[chunk_id] = chunk_features(metadata)
+
+    def remove(self, chunk_id: str) -> None:
+        """Drop a deleted chunk (no-op if unknown)."""
+        self.chunks.pop(chunk_id, None)
+
+    def remove_many(self, chunk_ids: Iterable[str]) -> None:
+        """Drop several deleted chunks."""
+        for chunk_id in chunk_ids:
+            self.remove(chunk_id)
+
+    def clear(self) -> None:
+        """Forget all chunks (used for full rebuilds)."""
+        self.chunks = {}
+
+    @property
+    def total_chunks(self) -> int:
+        return len(self.chunks)
+
+    def matrix(self, chunk_ids: List[str], metadatas: List[Dict[str, Any]]) -> np.ndarray:
+        """Feature matrix of candidates (one row each); chunks missing from the sidecar use their metadata."""
+        rows = [self.chunks.get(chunk_id) or chunk_features(metadata or {})
+                for chunk_id, metadata in zip(chunk_ids, metadatas)]
+        return np.array(rows, dtype=float).reshape(len(rows), len(FEATURE_NAMES))
+
+    def rebuild(self, collection, page_size: int = 1000) -> None:
+        """Recompute every chunk's features (used when the sidecar is missing or out of date)."""
+        self.clear()
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(offset=offset, limit=page_size, include=['metadatas'])
+            for chunk_id, metadata in zip(page['ids'], page['metadatas']):
+                self.add(chunk_id, metadata or {})
+
+    def ensure_consistent(self, collection) -> bool:
+        """Rebuild from the collection if the chunk count disagrees; returns True if rebuilt."""
+        if self.total_chunks == collection.count():
+            return False
+        print(f"⚠️ Re-ranking features out of date ({self.total_chunks} vs {collection.count()} chunks), recomputing")
+        self.rebuild(collection)
+        return True
+
+    def load(self) -> None:
+        """Load the sidecar from disk, starting empty if missing, unreadable or of another feature layout."""
+        self.clear()
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != FEATURES_VERSION or data.get('features') != FEATURE_NAMES:
+                print("⚠️ Ignoring re-ranking features with a different version or layout")
+                return
+            self.chunks = data.get('chunks', {})
+        except Exception as e:
+            print(f"⚠️ Could not read re-ranking features {self.path}: {e}")
+            self.clear()
+
+    def save(self) -> None:
+        """Atomically write the sidecar to disk."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': FEATURES_VERSION,
+                'features': FEATURE_NAMES,
+                'total_chunks': self.total_chunks,
+                'chunks': self.chunks
+            }, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Sharded Collections for GBM Clinical Vector Database
+Stores chunks in one ChromaDB collection per drug group and document type family,
+and routes queries to the shards that can hold matching chunks
+Author: Chetanya Pandey
+"""
+
+import os
+import json
+from typing import List, Dict, Any, Optional, Iterable
+
+LAYOUT_FILENAME = "shards.json"
+LAYOUT_VERSION = 1
+SHARD_PREFIX = "gbm_shard_"
+SHARDED_COLLECTION_NAME = "gbm_clinical_sharded"
+
+# Drug groups: documents on one drug, on both drugs, or on neither
+DRUG_GROUPS = ['temozolomide', 'bevacizumab', 'multi', 'general']
+
+# doc_type -> family; unlisted types fall into 'reference'
+DOC_TYPE_FAMILIES = {
+    'FDA_Complete_Prescribing_Information': 'regulatory',
+    'FDA_Approval_Trials': 'regulatory',
+    'FDA_Document': 'regulatory',
+    'DailyMed_Prescribing_Info': 'regulatory',
+    'NCCN_Guidelines': 'guideline',
+    'Pivotal_Clinical_Trial': 'trial',
+    'Clinical_Research': 'trial',
+    'Hospital_Protocol': 'protocol',
+    'Dosing_Protocol': 'protocol'
+}
+DOC_TYPE_FAMILY_NAMES = ['regulatory', 'guideline', 'trial', 'protocol', 'reference']
+
+
+def drug_group(drugs: str) -> str:
+    """Map a chunk's 'drugs' metadata ('temozolomide,bevacizumab', 'both', ...) to its drug group."""
+    names = {drug.strip() for drug in str(drugs or '').split(',') if drug.strip()} - {'both'}
+    if len(names) == 1:
+        name = names.pop()
+        return name if name in DRUG_GROUPS else 'general'
+    return 'multi' if names else 'general'
+
+
+def doc_type_family(doc_type: str) -> str:
+    return DOC_TYPE_FAMILIES.get(doc_type, 'reference')
+
+
+def shard_name(group: str, family: str) -> str:
+    return f"{SHARD_PREFIX}{group}_{family}"
+
+
+def shard_for(metadata: Dict[str, Any]) -> str:
+    """Return the shard a chunk is stored in."""
+    return shard_name(drug_group(metadata.get('drugs')), doc_type_family(metadata.get('doc_type')))
+
+
+def route_shards(drug: Optional[str] = None, doc_types: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Return the shards that can hold chunks for a drug and/or set of document types.
+
+    A drug's chunks live in its own group and in the 'multi' group (documents
+    covering both drugs); documents mentioning neither drug cannot match.
+    """
+    if drug in ('temozolomide', 'bevacizumab'):
+        groups = [drug, 'multi']
+    else:
+        groups = DRUG_GROUPS
+    families = sorted({doc_type_family(doc_type) for doc_type in doc_types}) if doc_types else DOC_TYPE_FAMILY_NAMES
+    return [shard_name(group, family) for group in groups for family in families]
+
+
+def where_doc_types(where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Return the doc_types a where filter restricts results to (None if unrestricted)."""
+    if not where:
+        return None
+    if '$and' in where:
+        for condition in where['$and']:
+            doc_types = where_doc_types(condition)
+            if doc_types:
+                return doc_types
+        return None
+    condition = where.get('doc_type')
+    if isinstance(condition, str):
+        return [condition]
+    if isinstance(condition, dict):
+        if '$eq' in condition:
+            return [condition['$eq']]
+        if '$in' in condition:
+            return list(condition['$in'])
+    return None
+
+
+def is_sharded(db_dir: str) -> bool:
+    return os.path.exists(os.path.join(db_dir, LAYOUT_FILENAME))
+
+
+def open_collection(chroma_client, db_dir: str):
+    """Open the stored chunks of a database: its shard set, or the single (or original) collection."""
+    if is_sharded(db_dir):
+        return ShardedCollection(chroma_client, db_dir)
+    try:
+        return chroma_client.get_collection("gbm_clinical_medical_embeddings")
+    except Exception:
+        # Fallback to original collection
+        return chroma_client.get_collection("gbm_clinical_data")
+
+
+class ShardedCollection:
+    def __init__(self, chroma_client, db_dir: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Initialize a set of shard collections that behaves like a single collection.
+
+        Args:
+            chroma_client: ChromaDB client of the database
+            db_dir: Directory of the database (holds the shard layout file)
+            metadata: Collection metadata for newly created shards
+        """
+        self.chroma_client = chroma_client
+        self.path = os.path.join(db_dir, LAYOUT_FILENAME)
+        self.collection_metadata = metadata
+        self.name = SHARDED_COLLECTION_NAME
+
+        # shard name -> collection, for shards that exist
+        self.shards: Dict[str, Any] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            self._save()
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+        if layout.get('version') != LAYOUT_VERSION:
+            raise ValueError(f"Unsupported shard layout version: {layout.get('version')}")
+        for name in layout.get('shards', []):
+            self.shards[name] = self.chroma_client.get_collection(name)
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': LAYOUT_VERSION, 'shards': sorted(self.shards)}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _shard(self, name: str):
+        """Return a shard collection, creating it on first write."""
+        if name not in self.shards:
+            self.shards[name] = self.chroma_client.get_or_create_collection(name, metadata=self.collection_metadata)
+            self._save()
+        return self.shards[name]
+
+    def drop(self) -> None:
+        """Delete every shard and the layout file."""
+        for name in list(self.shards):
+            self.chroma_client.delete_collection(name)
+        self.shards = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards.values())
+
+    def shard_counts(self) -> Dict[str, int]:
+        return {name: shard.count() for name, shard in sorted(self.shards.items())}
+
+    def _group_by_shard(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(shard_for(metadata), []).append(i)
+        return groups
+
+    def upsert(self, ids: List[str], metadatas: List[Dict[str, Any]], documents: List[str] = None,
+               embeddings=None) -> None:
+        for name, positions in self._group_by_shard(ids, metadatas).items():
+            shard_ids = [ids[i] for i in positions]
+            # A re-indexed chunk may have moved shard (its document's drugs or type changed)
+            for other_name, other in self.shards.items():
+                if other_name != name:
+                    other.delete(ids=shard_ids)
+            self._shard(name).upsert(
+                ids=shard_ids,
+                metadatas=[metadatas[i] for i in positions],
+                documents=[documents[i] for i in positions] if documents is not None else None,
+                embeddings=[embeddings[i] for i in positions] if embeddings is not None else None
+            )
+
+    def update(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        for name, positions in self._group_by_shard(ids, metadatas).items():
+            self._shard(name).update(ids=[ids[i] for i in positions], metadatas=[metadatas[i] for i in positions])
+
+    def delete(self, ids: List[str]) -> None:
+        for shard in self.shards.values():
+            shard.delete(ids=ids)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            offset: Optional[int] = None, limit: Optional[int] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get chunks across shards; offset/limit page over the shards in name order."""
+        kwargs = {'include': include} if include is not None else {}
+        pages = []
+        if ids is not None or where is not None:
+            for name in sorted(self.shards):
+                pages.append(self.shards[name].get(ids=ids, where=where, **kwargs))
+            merged = self._merge_get(pages)
+            start = offset or 0
+            end = start + limit if limit is not None else None
+            return {key: (value[start:end] if value is not None else None) for key, value in merged.items()}
+
+        skip = offset or 0
+        remaining = limit
+        for name in sorted(self.shards):
+            if remaining is not None and remaining <= 0:
+                break
+            shard = self.shards[name]
+            size = shard.count()
+            if skip >= size:
+                skip -= size
+                continue
+            page = shard.get(offset=skip, limit=remaining if remaining is not None else size - skip, **kwargs)
+            pages.append(page)
+            skip = 0
+            if remaining is not None:
+                remaining -= len(page['ids'])
+        return self._merge_get(pages)
+
+    @staticmethod
+    def _merge_get(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        merged = {'ids': [], 'documents': None, 'metadatas': None, 'embeddings': None}
+        for page in pages:
+            merged['ids'].extend(page['ids'])
+            for key in ('documents', 'metadatas', 'embeddings'):
+                if page.get(key) is not None:
+                    merged[key] = (merged[key] or []) + list(page[key])
+        return merged
+
+    def query(self, query_embeddings=None, query_texts: Optional[List[str]] = None, n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None,
+              shards: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Search the given shards (all by default) and merge their top-k by distance.
+
+        Each shard returns its own top n_results, so the merged top n_results is exact.
+        """
+        include = list(include or ['documents', 'metadatas', 'distances'])
+        if 'distances' not in include:
+            include.append('distances')
+        searched = [self.shards[name] for name in (shards or sorted(self.shards)) if name in self.shards]
+
+        queries = query_embeddings if query_embeddings is not None else query_texts
+        keys = ['ids'] + [key for key in include if key in ('documents', 'metadatas', 'distances', 'embeddings')]
+        merged = {key: [[] for _ in queries] for key in keys}
+
+        for shard in searched:
+            size = shard.count()
+            if not size:
+                continue
+            kwargs = {'query_embeddings': query_embeddings} if query_embeddings is not None else {'query_texts': query_texts}
+            results = shard.query(n_results=min(n_results, size), where=where, include=include, **kwargs)
+            for q in range(len(queries)):
+                for key in keys:
+                    merged[key][q].extend(results[key][q])
+
+        for q in range(len(queries)):
+            order = sorted(range(len(merged['ids'][q])), key=lambda i: merged['distances'][q][i])[:n_results]
+            for key in keys:
+                merged[key][q] = [merged[key][q][i] for i in order]
+        return merged
@@ -0,0 +1,31 @@
+import json
+
+from corpus_readers import DEFAULT_FIELD_MAP, iter_record_documents, read_documents
+
+
+def write_records(path, records):
+    path.write_text('\n'.join(json.dumps(record) for record in records) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def test_records_sharing_an_id_get_unique_names_and_chunk_ids(tmp_path):
+    path = write_records(tmp_path / 'abstracts.jsonl', [
+        {'id': '123', 'title': 'Temozolomide dosing', 'text': 'Temozolomide 75 mg/m² daily with radiotherapy.'},
+        {'id': '123', 'title': 'Bevacizumab dosing', 'text': 'Bevacizumab 10 mg/kg every 2 weeks.'},
+    ])
+
+    results = list(iter_record_documents([path], {}, field_map=DEFAULT_FIELD_MAP))
+
+    names = [doc['filename'] for doc, _ in results]
+    assert names == ['abstracts.jsonl#123', 'abstracts.jsonl#123~2']
+    chunk_ids = [chunk['chunk_id'] for _, chunks in results for chunk in chunks]
+    assert len(chunk_ids) == len(set(chunk_ids))
+    assert all(chunk['chunk_id'].startswith('abstracts.jsonl#123~2_') for chunk in results[1][1])
+
+
+def test_exact_repeated_record_is_skipped(tmp_path):
+    record = {'title': 'Temozolomide dosing', 'text': 'Temozolomide 150 mg/m² days 1-5 of each 28-day cycle.'}
+    path = write_records(tmp_path / 'protocols.jsonl', [record, record])
+
+    assert len(list(iter_record_documents([path], {}))) == 1
+    assert len(list(read_documents([path]))) == 1
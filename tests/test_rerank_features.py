@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from clinical_extractor import typed_metadata
+from lexical_index import reciprocal_rank_fusion
+from rerank_features import DEFAULT_BOOST_WEIGHTS, FEATURE_NAMES, boost_weights, chunk_features, metadata_boosts, query_features, scale_to_range
+
+
+def stored_metadata(doc_type, clinical_topic, drugs, **extracted):
+    """Metadata shaped like create_vector_db._build_chunk_metadata writes it."""
+    chunk = {
+        'toxicity_grades': [], 'anc_values': [], 'platelet_values': [], 'hemoglobin_values': [],
+        **extracted
+    }
+    return {
+        'doc_type': doc_type,
+        'clinical_topic': clinical_topic,
+        'drugs': drugs,
+        'toxicity_grades': ', '.join(chunk['toxicity_grades']),
+        **typed_metadata(chunk)
+    }
+
+
+# weight -> (stored chunk metadata that carries the feature, query that asks for it)
+CASES = {
+    'topic': (stored_metadata('Other', 'Dosing Protocol', ''),
+              'What is the dosing schedule?'),
+    'drug': (stored_metadata('Other', 'General Clinical', 'temozolomide'),
+             'Temozolomide in elderly patients'),
+    'toxicity_grades': (stored_metadata('Other', 'General Clinical', '', toxicity_grades=['3', '4']),
+                        'Which grade requires holding therapy?'),
+    'laboratory_values': (stored_metadata('Other', 'General Clinical', '', anc_values=['1.5']),
+                          'Required neutrophil count'),
+    'fda_approved': (stored_metadata('Other', 'General Clinical', '', evidence_fda_approved=True),
+                     'Glioblastoma'),
+    'clinical_trial': (stored_metadata('Other', 'General Clinical', '', evidence_clinical_trial=True),
+                       'Glioblastoma'),
+    'doc_type': (stored_metadata('FDA_Complete_Prescribing_Information', 'General Clinical', ''),
+                 'Prescribing information for glioblastoma'),
+}
+
+
+def boost(metadata, query, weights=None):
+    features = np.array([chunk_features(metadata)], dtype=float)
+    return metadata_boosts(features, query_features(query), boost_weights(weights))[0]
+
+
+@pytest.mark.parametrize('weight', sorted(DEFAULT_BOOST_WEIGHTS))
+def test_each_weight_changes_the_score(weight):
+    metadata, query = CASES[weight]
+
+    assert boost(metadata, query) == pytest.approx(DEFAULT_BOOST_WEIGHTS[weight])
+    assert boost(metadata, query, {weight: 0.0}) == 0.0
+
+
+def test_stored_metadata_features():
+    metadata = stored_metadata('Hospital_Protocol', 'Hematologic Toxicity', 'temozolomide,bevacizumab',
+                               toxicity_grades=['3'], platelet_values=['100'],
+                               evidence_fda_approved=True, evidence_clinical_trial=True)
+    features = dict(zip(FEATURE_NAMES, chunk_features(metadata)))
+
+    on = {name for name, value in features.items() if value}
+    assert on == {'topic_toxicity', 'drug_temozolomide', 'drug_bevacizumab', 'drug_both', 'toxicity_grades',
+                  'laboratory_values', 'evidence_fda_approved', 'doc_protocol'}
+
+
+def test_query_terms_match_lowercased_whole_words():
+    features = dict(zip(FEATURE_NAMES, query_features('Check CBC before IV bevacizumab')))
+    assert features['topic_monitoring'] and features['topic_administration']
+
+    features = dict(zip(FEATURE_NAMES, query_features('Survival benefit in positive trials')))
+    assert not features['topic_administration']
+
+
+@pytest.mark.parametrize('query', ['Bevacizumab label warnings', 'Labeling of temozolomide capsules',
+                                   'Ancillary care for glioblastoma', 'Ancestry and survival'])
+def test_abbreviations_do_not_match_inside_longer_words(query):
+    features = dict(zip(FEATURE_NAMES, query_features(query)))
+    assert not features['topic_monitoring'] and not features['laboratory_values']
+
+
+@pytest.mark.parametrize('query', ['ANC before cycle 2', 'Labs before cycle 2', 'Laboratory monitoring'])
+def test_abbreviations_match_as_whole_words(query):
+    features = dict(zip(FEATURE_NAMES, query_features(query)))
+    assert features['laboratory_values']
+
+
+def test_both_drugs_boost_once():
+    metadata = stored_metadata('Other', 'General Clinical', 'temozolomide,bevacizumab')
+
+    assert boost(metadata, 'temozolomide plus bevacizumab', {'fda_approved': 0, 'clinical_trial': 0}) == \
+        pytest.approx(DEFAULT_BOOST_WEIGHTS['drug'])
+
+
+def hybrid_order(fused, distances, metadatas, query):
+    """Candidate order after metadata re-ranking, as ClinicalQueryInterface._rerank_by_metadata ranks it."""
+    base = scale_to_range([score for _, score in fused], 1 - np.asarray(distances))
+    features = np.array([chunk_features(metadata) for metadata in metadatas], dtype=float)
+    final = base + metadata_boosts(features, query_features(query), boost_weights())
+    return [fused[i][0] for i in np.argsort(-np.round(final, 9), kind='stable')]
+
+
+def test_hybrid_order_survives_boosting_when_no_feature_fires():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c', 'd'], ['d', 'c', 'e', 'a']])
+    distances = [0.45, 0.5, 0.6, 0.62, 0.7]
+    metadatas = [stored_metadata('Other', 'General Clinical', '')] * len(fused)
+
+    assert hybrid_order(fused, distances, metadatas, 'temozolomide dosing schedule') == [chunk_id for chunk_id, _ in fused]
+
+
+def test_one_boost_does_not_override_the_fused_ranking():
+    ids = [f'c{i}' for i in range(10)]
+    fused = reciprocal_rank_fusion([ids, ids])
+    distances = np.linspace(0.2, 1.2, len(ids))
+    metadatas = [stored_metadata('Other', 'General Clinical', '')] * 9 + \
+        [stored_metadata('Other', 'Dosing Protocol', '')]
+
+    # On the raw fused scale (about 0.01 per rank) the topic boost would lift the last candidate to the top
+    assert hybrid_order(fused, distances, metadatas, 'dosing')[:5] == ids[:5]